@@ -1,65 +1,128 @@
 """
 API Flask pour les prédictions de transactions Santander
+
+La configuration, le cycle de vie du modèle et le scoring sont dans
+service.py, partagé avec le point d'entrée ASGI (asgi_app.py).
 """
-from flask import Flask, request, jsonify, render_template
+import service  # en premier: démarre le chronomètre du démarrage (/ready)
+
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
-import pandas as pd
-import joblib
+import hmac
 import numpy as np
 import os
+import threading
+
+import batch_formats
+import metrics
 
 app = Flask(__name__)
 CORS(app)  # Permettre les requêtes cross-origin
 
-# Chemins des modèles (compatible local et Render)
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.environ.get('MODEL_PATH', os.path.join(BASE_DIR, '..', 'models', 'best_model.pkl'))
-SCALER_PATH = os.environ.get('SCALER_PATH', os.path.join(BASE_DIR, '..', 'models', 'scaler.pkl'))
+def current_bundle(wait=True):
+    """
+    Bundle actif, capturé pour toute la durée de la requête.
+    Pendant le chargement initial, attend au plus READY_TIMEOUT secondes.
+    """
+    bundle = service.get_bundle(wait)
+    g.model_version = bundle.version if bundle is not None else None
+    return bundle
 
-model = None
-scaler = None
+def batch_rows_response(probabilities):
+    """Réponse JSON historique de /predict_batch: un dictionnaire par ligne"""
+    return jsonify(service.batch_rows_payload(probabilities))
 
-def load_model():
-    """Charge le modèle et le scaler"""
-    global model, scaler
-    try:
-        if os.path.exists(MODEL_PATH):
-            model = joblib.load(MODEL_PATH)
-            print("✅ Modèle chargé avec succès")
-        else:
-            print("⚠️ Modèle non trouvé. Entraînez d'abord un modèle.")
-        
-        if os.path.exists(SCALER_PATH):
-            scaler = joblib.load(SCALER_PATH)
-            print("✅ Scaler chargé avec succès")
-        else:
-            print("⚠️ Scaler non trouvé.")
-    except Exception as e:
-        print(f"❌ Erreur lors du chargement: {e}")
+def request_option(name, input_format, default=None):
+    """Option lue dans la query string, puis dans le corps JSON"""
+    if name in request.args:
+        return request.args[name]
+    if input_format == 'json':
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            return data.get(name, default)
+    return default
+
+@app.after_request
+def add_model_version(response):
+    """En-têtes X-Model-Version et X-Prediction-Tier: bundle et tier qui ont servi la requête"""
+    version = g.get('model_version')
+    if version:
+        response.headers['X-Model-Version'] = version
+    tier = g.get('tier')
+    if tier:
+        response.headers['X-Prediction-Tier'] = tier
+    return response
+
+def request_tier(input_format, bundle):
+    """Tier demandé (?tier=fast ou "tier" du corps JSON), voir service.resolve_tier"""
+    g.tier = service.resolve_tier(request_option('tier', input_format), bundle)
+    return g.tier
+
+@app.before_request
+def start_stage_timer():
+    """Chronomètre par étape des routes de prédiction (voir metrics.py)"""
+    if metrics.enabled and request.endpoint in service.PREDICTION_ENDPOINTS:
+        g.stage_timer = metrics.StageTimer(request.endpoint)
+
+def mark_stage(stage):
+    """Fin de l'étape stage de la requête en cours (parse, predict)"""
+    timer = g.get('stage_timer')
+    if timer is not None:
+        timer.mark(stage)
+
+def record_exception(e):
+    """Exception interceptée par la route, reportée dans santander_errors_total"""
+    g.exception = e
+
+@app.after_request
+def observe_request(response):
+    """Étape serialize (réponse construite), latence totale et compteurs"""
+    timer = g.get('stage_timer')
+    if timer is not None:
+        if timer.stages:
+            timer.mark('serialize')
+        timer.finish(response.status_code, g.get('model_version'), g.get('exception'))
+    return response
+
+@app.after_request
+def track_first_prediction(response):
+    """Mesure le temps jusqu'à la première prédiction réussie du worker"""
+    service.record_first_prediction(request.endpoint, response.status_code)
+    return response
 
 @app.route('/')
 def home():
     """Page d'accueil de l'API"""
+    bundle = current_bundle(wait=False)
     return jsonify({
         'message': 'API Santander Customer Transaction Prediction',
         'status': 'active',
         'endpoints': {
             '/': 'GET - Page d\'accueil',
             '/health': 'GET - Vérifier l\'état de l\'API',
+            '/ready': 'GET - Modèle chargé et préchauffé',
             '/predict': 'POST - Faire une prédiction'
         },
-        'model_loaded': model is not None,
-        'scaler_loaded': scaler is not None
+        'model_loaded': bundle is not None,
+        'scaler_loaded': bundle is not None and bundle.scaler is not None,
+        'model_version': bundle.version if bundle is not None else None
     })
 
 @app.route('/health')
 def health():
-    """Endpoint de santé de l'API"""
-    return jsonify({
-        'status': 'healthy',
-        'model_status': 'loaded' if model else 'not_loaded',
-        'scaler_status': 'loaded' if scaler else 'not_loaded'
-    })
+    """Endpoint de santé de l'API (répond sans attendre le chargement du modèle)"""
+    current_bundle(wait=False)
+    return jsonify(service.health_payload())
+
+@app.route('/ready')
+def ready():
+    """
+    Disponibilité du worker: 200 une fois le modèle chargé et préchauffé, 503 avant
+    Détail des phases du démarrage (ms) et temps jusqu'à la première prédiction
+    """
+    current_bundle(wait=False)
+    payload, status = service.ready_payload()
+    return jsonify(payload), status
 
 @app.route('/model-info')
 def model_info():
@@ -67,37 +130,13 @@ def model_info():
     Endpoint d'informations sur le modèle
     Retourne les métadonnées du modèle chargé
     """
-    if model is None:
+    bundle = current_bundle()
+    if bundle is None:
         return jsonify({
             'error': 'Modèle non chargé'
         }), 503
     
-    model_type = type(model).__name__
-    
-    # Informations selon le type de modèle
-    info = {
-        'model_type': model_type,
-        'n_features': 200,
-        'feature_names': [f'var_{i}' for i in range(200)],
-        'training_framework': 'scikit-learn',
-        'scaler': 'StandardScaler' if scaler else 'None',
-        'target': 'binary_classification',
-        'classes': [0, 1],
-        'class_names': ['No Transaction', 'Transaction']
-    }
-    
-    # Ajouter des infos spécifiques selon le modèle
-    if hasattr(model, 'coef_'):
-        info['n_coefficients'] = len(model.coef_[0])
-        info['intercept'] = float(model.intercept_[0])
-    
-    if hasattr(model, 'n_estimators'):
-        info['n_estimators'] = model.n_estimators
-    
-    if hasattr(model, 'max_depth'):
-        info['max_depth'] = model.max_depth
-    
-    return jsonify(info)
+    return jsonify(service.model_info_payload(bundle))
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -106,19 +145,22 @@ def predict():
     
     Input JSON format:
     {
-        "features": [val_0, val_1, ..., val_199]
+        "features": [val_0, val_1, ..., val_199],
+        "tier": "full" ou "fast"  (optionnel, aussi en query string: ?tier=fast)
     }
     
     Output JSON format:
     {
         "prediction": 0 or 1,
         "probability": float,
-        "confidence": float
+        "confidence": float,
+        "tier": tier utilisé ("full" si aucun élève distillé n'est chargé)
     }
     """
     try:
-        # Vérifier que le modèle est chargé
-        if model is None:
+        # Vérifier que le modèle est chargé (bundle capturé pour toute la requête)
+        bundle = current_bundle()
+        if bundle is None:
             return jsonify({
                 'error': 'Modèle non chargé. Entraînez d\'abord un modèle.'
             }), 503
@@ -131,42 +173,27 @@ def predict():
                 'error': 'Format invalide. Attendu: {"features": [...]}'
             }), 400
         
-        features = data['features']
-        
-        # Vérifier le nombre de features
-        if len(features) != 200:
+        # Vérifier et convertir les features
+        try:
+            X = service.parse_features(data['features'])
+            tier = request_tier('json', bundle)
+        except ValueError as e:
             return jsonify({
-                'error': f'Nombre de features invalide. Attendu: 200, Reçu: {len(features)}'
+                'error': str(e)
             }), 400
+        mark_stage('parse')
         
-        # Convertir en DataFrame
-        feature_names = [f'var_{i}' for i in range(200)]
-        df = pd.DataFrame([features], columns=feature_names)
-        
-        # Appliquer le scaler si disponible
-        if scaler is not None:
-            df_scaled = scaler.transform(df)
-        else:
-            df_scaled = df.values
+        # Faire la prédiction (un seul passage du modèle, regroupé si micro-batching)
+        probability = service.score_row(X, bundle, tier)
+        mark_stage('predict')
         
-        # Faire la prédiction
-        prediction = model.predict(df_scaled)[0]
-        probability = model.predict_proba(df_scaled)[0]
-        
-        # Calculer la confiance
-        confidence = max(probability) * 100
-        
-        return jsonify({
-            'prediction': int(prediction),
-            'probability': {
-                'no_transaction': float(probability[0]),
-                'transaction': float(probability[1])
-            },
-            'confidence': float(confidence),
-            'message': 'Transaction prédite' if prediction == 1 else 'Pas de transaction prédite'
-        })
+        payload = service.prediction_payload(probability)
+        payload['model_version'] = bundle.version
+        payload['tier'] = tier
+        return jsonify(payload)
     
     except Exception as e:
+        record_exception(e)
         return jsonify({
             'error': f'Erreur lors de la prédiction: {str(e)}'
         }), 500
@@ -179,7 +206,8 @@ def predict_with_threshold():
     Input JSON format:
     {
         "features": [val_0, val_1, ..., val_199],
-        "threshold": 0.6  (optionnel, défaut: 0.5)
+        "threshold": 0.6  (optionnel, défaut: 0.5),
+        "tier": "full" ou "fast"  (optionnel, voir /predict)
     }
     
     Output JSON format:
@@ -193,7 +221,8 @@ def predict_with_threshold():
     }
     """
     try:
-        if model is None:
+        bundle = current_bundle()
+        if bundle is None:
             return jsonify({
                 'error': 'Modèle non chargé'
             }), 503
@@ -205,7 +234,6 @@ def predict_with_threshold():
                 'error': 'Format invalide. Attendu: {"features": [...], "threshold": 0.6}'
             }), 400
         
-        features = data['features']
         threshold = float(data.get('threshold', 0.5))
         
         # Validation du seuil
@@ -214,56 +242,114 @@ def predict_with_threshold():
                 'error': 'Le seuil doit être entre 0 et 1'
             }), 400
         
-        # Vérifier le nombre de features
-        if len(features) != 200:
+        # Vérifier et convertir les features
+        try:
+            X = service.parse_features(data['features'])
+            tier = request_tier('json', bundle)
+        except ValueError as e:
             return jsonify({
-                'error': f'Nombre de features invalide. Attendu: 200, Reçu: {len(features)}'
+                'error': str(e)
             }), 400
+        mark_stage('parse')
         
-        # Convertir en DataFrame
-        feature_names = [f'var_{i}' for i in range(200)]
-        df = pd.DataFrame([features], columns=feature_names)
+        # Faire la prédiction (regroupée si micro-batching)
+        probability = service.score_row(X, bundle, tier)
+        mark_stage('predict')
         
-        # Appliquer le scaler si disponible
-        if scaler is not None:
-            df_scaled = scaler.transform(df)
-        else:
-            df_scaled = df.values
+        payload = service.threshold_payload(probability, threshold)
+        payload['model_version'] = bundle.version
+        payload['tier'] = tier
+        return jsonify(payload)
+    
+    except Exception as e:
+        record_exception(e)
+        return jsonify({
+            'error': f'Erreur lors de la prédiction: {str(e)}'
+        }), 500
+
+@app.route('/what_if', methods=['POST'])
+def what_if():
+    """
+    Courbes de sensibilité du score pour chaque feature du questionnaire
+    
+    Input JSON format:
+    {
+        "features": [val_0, val_1, ..., val_199],
+        "features_to_vary": [{"var_index": 174, "values": [10, 15, 20]}, {"var_index": 6}, ...]
+                            (optionnel, défaut: les features de feature_mapping.json)
+        "n_points": 11  (optionnel, points entre p10 et p90 si "values" est absent)
+    }
+    
+    Toutes les courbes sont empilées dans une seule matrice, scorée en un appel.
+    """
+    try:
+        bundle = current_bundle()
+        if bundle is None:
+            return jsonify({
+                'error': 'Modèle non chargé'
+            }), 503
+        
+        data = request.get_json()
+        try:
+            X = service.parse_features(data['features'])
+            n_points = int(data.get('n_points', service.WHAT_IF_POINTS))
+            if n_points < 2:
+                raise ValueError('n_points doit être au moins 2')
+            grids = service.what_if_grids(data.get('features_to_vary'), n_points, bundle.feature_mapping)
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({
+                'error': f'Format invalide: {str(e)}'
+            }), 400
         
-        # Faire la prédiction
-        probability = model.predict_proba(df_scaled)[0]
-        prob_transaction = probability[1]
-        prediction = 1 if prob_transaction >= threshold else 0
+        n_rows = 1 + sum(len(values) for _, values in grids)
+        if n_rows > service.WHAT_IF_MAX_ROWS:
+            return jsonify({
+                'error': f'Trop de points: {n_rows} lignes (maximum {service.WHAT_IF_MAX_ROWS})'
+            }), 400
+        
+        # Matrice de perturbations: ligne 0 = profil, puis une ligne par point de grille
+        perturbed = np.repeat(X, n_rows, axis=0)
+        row = 1
+        for index, values in grids:
+            perturbed[row:row + len(values), index] = values
+            row += len(values)
+        mark_stage('parse')
         
-        # Niveau de confiance
-        distance_from_threshold = abs(prob_transaction - threshold)
-        if distance_from_threshold > 0.3:
-            confidence_level = "HIGH"
-        elif distance_from_threshold > 0.1:
-            confidence_level = "MEDIUM"
-        else:
-            confidence_level = "LOW"
+        p_transaction = bundle.predict_proba(perturbed)[:, 1]
+        scores = service.probability_to_score(p_transaction, bundle.metadata)
+        mark_stage('predict')
         
-        # Score de risque
-        risk_score = 1 - prob_transaction if prediction == 1 else prob_transaction
+        curves = []
+        row = 1
+        for index, values in grids:
+            curve_probs = p_transaction[row:row + len(values)]
+            curve = {
+                'var_index': index,
+                'feature': f'var_{index}',
+                'values': values.tolist(),
+                'probabilities': curve_probs.tolist()
+            }
+            if scores is not None:
+                curve_scores = scores[row:row + len(values)]
+                curve['scores'] = curve_scores.tolist()
+                curve['impact_points'] = float(curve_scores.max() - curve_scores.min())
+            curves.append(curve)
+            row += len(values)
         
         return jsonify({
-            'prediction': int(prediction),
-            'probability': {
-                'no_transaction': float(probability[0]),
-                'transaction': float(probability[1])
+            'base': {
+                'probability': float(p_transaction[0]),
+                'score': float(scores[0]) if scores is not None else None
             },
-            'probability_percent': f"{prob_transaction*100:.2f}%",
-            'decision': 'CREDIT_ACCEPTED' if prediction == 1 else 'CREDIT_REJECTED',
-            'threshold_used': threshold,
-            'confidence_level': confidence_level,
-            'risk_score': float(risk_score),
-            'message': f"Probabilité de transaction: {prob_transaction*100:.1f}% (seuil: {threshold*100:.0f}%)"
+            'curves': curves,
+            'n_rows_scored': n_rows,
+            'model_version': bundle.version
         })
     
     except Exception as e:
+        record_exception(e)
         return jsonify({
-            'error': f'Erreur lors de la prédiction: {str(e)}'
+            'error': f'Erreur lors de l\'analyse: {str(e)}'
         }), 500
 
 @app.route('/predict_batch', methods=['POST'])
@@ -275,54 +361,139 @@ def predict_batch():
     {
         "features": [[val_0, val_1, ..., val_199], [...], ...]
     }
+    
+    Formats binaires (Content-Type / Accept), voir batch_formats.py:
+    application/x-npy, application/x-float32, application/vnd.apache.arrow.stream
+    
+    Streaming (Content-Type: application/x-ndjson, ?chunk_size=N):
+    une ligne JSON par observation en entrée, une ligne de résultat par
+    observation en sortie, puis un trailer {"trailer": true, "total": ...}
+    
+    Réponse colonnaire (?format=columnar ou "format": "columnar" dans le JSON):
+    {"prediction": [...], "p_transaction": [...], "confidence": [...], "total": n}
+    avec probabilities_only=true, seul p_transaction est renvoyé
+    
+    Tier (?tier=fast ou "tier" dans le JSON): voir /predict, tier utilisé
+    dans l'en-tête X-Prediction-Tier
     """
     try:
-        if model is None:
+        bundle = current_bundle()
+        if bundle is None:
             return jsonify({
                 'error': 'Modèle non chargé.'
             }), 503
         
-        data = request.get_json()
-        features_list = data['features']
-        
-        # Convertir en DataFrame
-        feature_names = [f'var_{i}' for i in range(200)]
-        df = pd.DataFrame(features_list, columns=feature_names)
+        # Négociation du format d'entrée et de sortie
+        try:
+            input_format = batch_formats.request_format(request.mimetype)
+            tier = request_tier(input_format, bundle)
+            if input_format == 'ndjson':
+                chunk_size = int(request.args.get('chunk_size', service.STREAM_CHUNK_SIZE))
+                if not 1 <= chunk_size <= service.STREAM_MAX_CHUNK_SIZE:
+                    raise ValueError(f'chunk_size doit être entre 1 et {service.STREAM_MAX_CHUNK_SIZE}')
+                return Response(stream_with_context(service.stream_predictions(request.stream, chunk_size,
+                                                                               bundle, tier)),
+                                mimetype=batch_formats.NDJSON_MIMETYPE)
+            
+            output_format = batch_formats.response_format(request.accept_mimetypes, input_format)
+            if input_format == 'json':
+                X = service.parse_features(request.get_json()['features'], batch=True)
+            else:
+                X = batch_formats.decode(input_format, request.get_data())
+        except batch_formats.UnsupportedFormat as e:
+            return jsonify({
+                'error': str(e)
+            }), 415
+        except ValueError as e:
+            return jsonify({
+                'error': f'Format invalide: {str(e)}'
+            }), 400
+        mark_stage('parse')
+        metrics.observe_batch('predict_batch', X.shape[0])
         
-        # Appliquer le scaler
-        if scaler is not None:
-            df_scaled = scaler.transform(df)
-        else:
-            df_scaled = df.values
+        # Prédictions (un seul passage du modèle)
+        probabilities = bundle.predict_proba(X, tier)
+        mark_stage('predict')
         
-        # Prédictions
-        predictions = model.predict(df_scaled)
-        probabilities = model.predict_proba(df_scaled)
+        if output_format != 'json':
+            body, mimetype = batch_formats.encode(output_format, probabilities)
+            return Response(body, mimetype=mimetype)
         
-        results = []
-        for i, (pred, prob) in enumerate(zip(predictions, probabilities)):
-            results.append({
-                'index': i,
-                'prediction': int(pred),
-                'probability': {
-                    'no_transaction': float(prob[0]),
-                    'transaction': float(prob[1])
-                },
-                'confidence': float(max(prob) * 100)
-            })
+        # Réponse JSON colonnaire (?format=columnar), construite depuis les tableaux NumPy
+        if request_option('format', input_format) == 'columnar':
+            probabilities_only = str(request_option('probabilities_only', input_format, 'false')).lower() in ('1', 'true')
+            body = batch_formats.encode_columnar(probabilities, probabilities_only)
+            return Response(body, mimetype='application/json')
         
-        return jsonify({
-            'predictions': results,
-            'total': len(results)
-        })
+        return batch_rows_response(probabilities)
     
     except Exception as e:
+        record_exception(e)
         return jsonify({
             'error': f'Erreur: {str(e)}'
         }), 500
 
-# Charger le modèle au démarrage
-load_model()
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    Métriques Prometheus (format texte): latences par route et par étape, tailles
+    de lots, requêtes et erreurs par version du modèle. Sous gunicorn, agrégées
+    sur tous les workers (voir metrics.py)
+    """
+    rendered = metrics.render()
+    if rendered is None:
+        return jsonify({
+            'error': 'Métriques désactivées (METRICS_ENABLED=0 ou prometheus_client absent)'
+        }), 404
+    body, content_type = rendered
+    return Response(body, content_type=content_type)
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """
+    Recharge le modèle à chaud (en-tête X-Admin-Token = ADMIN_TOKEN)
+    
+    Le rechargement tourne en arrière-plan (202); avec ?wait=1 la réponse
+    attend la fin et contient le rapport du contrôle. Les requêtes en cours
+    se terminent sur l'ancien bundle.
+    
+    Avec plusieurs workers gunicorn, seul le worker qui reçoit la requête
+    recharge: préférer MODEL_WATCH_INTERVAL, que chaque worker applique.
+    """
+    if not service.ADMIN_TOKEN:
+        return jsonify({
+            'error': 'Rechargement désactivé (ADMIN_TOKEN non défini)'
+        }), 404
+    
+    token = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode(), service.ADMIN_TOKEN.encode()):
+        return jsonify({
+            'error': 'Jeton invalide'
+        }), 403
+    
+    if service.reload_lock.locked():
+        return jsonify({
+            'error': 'Rechargement déjà en cours',
+            'reload': service.reload_status
+        }), 409
+    
+    if str(request.args.get('wait', '0')).lower() in ('1', 'true'):
+        status = service.reload_model('admin')
+        if status is None:
+            return jsonify({
+                'error': 'Rechargement déjà en cours',
+                'reload': service.reload_status
+            }), 409
+        return jsonify(status), 422 if status['state'] == 'failed' else 200
+    
+    threading.Thread(target=service.reload_model, args=('admin',), name='model-reload', daemon=True).start()
+    return jsonify({
+        'state': 'accepted',
+        'active_version': service.active_bundle.version if service.active_bundle else None
+    }), 202
+
+# Charger le modèle au démarrage (voir service.start)
+service.start()
 
 if __name__ == '__main__':
     print("\n🚀 Démarrage de l'API Flask...")
@@ -330,9 +501,12 @@ if __name__ == '__main__':
     print("\n📋 Endpoints disponibles:")
     print("   GET  /         - Page d'accueil")
     print("   GET  /health   - État de l'API")
+    print("   GET  /ready    - Modèle chargé et préchauffé (temps de démarrage)")
     print("   GET  /model-info - Informations sur le modèle")
     print("   POST /predict  - Prédiction unique")
     print("   POST /predict_batch - Prédictions multiples")
+    print("   GET  /metrics  - Métriques Prometheus")
+    print("   POST /admin/reload - Rechargement du modèle (ADMIN_TOKEN)")
     print("\n⏹️  Ctrl+C pour arrêter\n")
     
     port = int(os.environ.get('PORT', 5001))
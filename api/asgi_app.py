@@ -0,0 +1,359 @@
+"""
+API ASGI (Starlette) pour les prédictions de transactions Santander
+
+Mêmes routes et mêmes réponses que app.py pour /, /health, /ready,
+/model-info, /predict, /predict_with_threshold et /predict_batch. Les
+requêtes sont traitées de façon asynchrone; le scoring (et, pour les lots,
+le décodage et l'encodage) est délégué à un pool de ASGI_INFERENCE_THREADS
+threads: LightGBM et NumPy relâchent le GIL pendant le calcul.
+
+Les autres routes (/what_if, /admin/reload)
+restent servies par l'application Flask. /metrics expose les métriques
+Prometheus des routes servies ici (voir metrics.py).
+
+Usage:
+    cd api && uvicorn asgi_app:app --host 0.0.0.0 --port 5001
+"""
+import service  # en premier: démarre le chronomètre du démarrage (/ready)
+
+import asyncio
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import batch_formats
+import metrics
+
+# Taille du pool de threads d'inférence
+ASGI_INFERENCE_THREADS = int(os.environ.get('ASGI_INFERENCE_THREADS', 4))
+
+executor = ThreadPoolExecutor(max_workers=ASGI_INFERENCE_THREADS, thread_name_prefix='inference')
+
+
+async def run_inference(fn, *args):
+    """Exécute fn(*args) dans le pool d'inférence sans bloquer la boucle"""
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+async def current_bundle(wait=True):
+    """Bundle actif, capturé pour toute la durée de la requête (voir service.get_bundle)"""
+    bundle = service.get_bundle(wait=False)
+    if bundle is None and wait and not service.ready_event.is_set():
+        bundle = await asyncio.get_running_loop().run_in_executor(None, service.get_bundle)
+    return bundle
+
+
+def response_headers(bundle, tier=None):
+    """En-têtes X-Model-Version et X-Prediction-Tier (comme app.add_model_version)"""
+    headers = {'X-Model-Version': bundle.version}
+    if tier is not None:
+        headers['X-Prediction-Tier'] = tier
+    return headers
+
+
+def request_tier(request, data, bundle):
+    """Tier demandé (?tier=fast ou "tier" du corps JSON), voir service.resolve_tier"""
+    tier = request.query_params.get('tier')
+    if tier is None and isinstance(data, dict):
+        tier = data.get('tier')
+    return service.resolve_tier(tier, bundle)
+
+
+def json_response(payload, status_code=200, bundle=None, tier=None):
+    """Réponse JSON encodée comme jsonify (clés triées, compact), avec X-Model-Version"""
+    headers = response_headers(bundle, tier) if bundle is not None else None
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':')) + '\n'
+    return Response(body, status_code=status_code, media_type='application/json', headers=headers)
+
+
+def mark_stage(request, stage):
+    """Fin de l'étape stage de la requête (voir app.mark_stage)"""
+    timer = getattr(request.state, 'stage_timer', None)
+    if timer is not None:
+        timer.mark(stage)
+
+
+def prediction_endpoint(handler):
+    """
+    Mesure le temps jusqu'à la première prédiction réussie, et les latences par
+    étape (serialize: fin du handler, réponse encodée) comme app.py
+    """
+    name = handler.__name__
+
+    async def endpoint(request):
+        timer = request.state.stage_timer = metrics.StageTimer(name) if metrics.enabled else None
+        response = await handler(request)
+        if timer is not None:
+            if timer.stages:
+                timer.mark('serialize')
+            timer.finish(response.status_code, response.headers.get('x-model-version'),
+                         getattr(request.state, 'exception', None))
+        service.record_first_prediction(name, response.status_code)
+        return response
+    return endpoint
+
+
+async def home(request):
+    """Page d'accueil de l'API"""
+    bundle = await current_bundle(wait=False)
+    return json_response({
+        'message': 'API Santander Customer Transaction Prediction',
+        'status': 'active',
+        'endpoints': {
+            '/': 'GET - Page d\'accueil',
+            '/health': 'GET - Vérifier l\'état de l\'API',
+            '/ready': 'GET - Modèle chargé et préchauffé',
+            '/predict': 'POST - Faire une prédiction'
+        },
+        'model_loaded': bundle is not None,
+        'scaler_loaded': bundle is not None and bundle.scaler is not None,
+        'model_version': bundle.version if bundle is not None else None
+    }, bundle=bundle)
+
+
+async def health(request):
+    """Endpoint de santé de l'API (répond sans attendre le chargement du modèle)"""
+    return json_response(service.health_payload(), bundle=service.get_bundle(wait=False))
+
+
+async def ready(request):
+    """Disponibilité du worker: 200 une fois le modèle chargé et préchauffé, 503 avant"""
+    payload, status_code = service.ready_payload()
+    return json_response(payload, status_code, service.get_bundle(wait=False))
+
+
+async def model_info(request):
+    """Endpoint d'informations sur le modèle"""
+    bundle = await current_bundle()
+    if bundle is None:
+        return json_response({
+            'error': 'Modèle non chargé'
+        }, 503)
+    return json_response(service.model_info_payload(bundle), bundle=bundle)
+
+
+@prediction_endpoint
+async def predict(request):
+    """Endpoint de prédiction (voir app.predict)"""
+    try:
+        bundle = await current_bundle()
+        if bundle is None:
+            return json_response({
+                'error': 'Modèle non chargé. Entraînez d\'abord un modèle.'
+            }, 503)
+
+        data = await request.json()
+
+        if 'features' not in data:
+            return json_response({
+                'error': 'Format invalide. Attendu: {"features": [...]}'
+            }, 400, bundle)
+
+        try:
+            X = service.parse_features(data['features'])
+            tier = request_tier(request, data, bundle)
+        except ValueError as e:
+            return json_response({
+                'error': str(e)
+            }, 400, bundle)
+        mark_stage(request, 'parse')
+
+        probability = await run_inference(service.score_row, X, bundle, tier)
+        mark_stage(request, 'predict')
+
+        payload = service.prediction_payload(probability)
+        payload['model_version'] = bundle.version
+        payload['tier'] = tier
+        return json_response(payload, bundle=bundle, tier=tier)
+
+    except Exception as e:
+        request.state.exception = e
+        return json_response({
+            'error': f'Erreur lors de la prédiction: {str(e)}'
+        }, 500)
+
+
+@prediction_endpoint
+async def predict_with_threshold(request):
+    """Endpoint de prédiction avec seuil ajustable (voir app.predict_with_threshold)"""
+    try:
+        bundle = await current_bundle()
+        if bundle is None:
+            return json_response({
+                'error': 'Modèle non chargé'
+            }, 503)
+
+        data = await request.json()
+
+        if 'features' not in data:
+            return json_response({
+                'error': 'Format invalide. Attendu: {"features": [...], "threshold": 0.6}'
+            }, 400, bundle)
+
+        threshold = float(data.get('threshold', 0.5))
+
+        if not 0 <= threshold <= 1:
+            return json_response({
+                'error': 'Le seuil doit être entre 0 et 1'
+            }, 400, bundle)
+
+        try:
+            X = service.parse_features(data['features'])
+            tier = request_tier(request, data, bundle)
+        except ValueError as e:
+            return json_response({
+                'error': str(e)
+            }, 400, bundle)
+        mark_stage(request, 'parse')
+
+        probability = await run_inference(service.score_row, X, bundle, tier)
+        mark_stage(request, 'predict')
+
+        payload = service.threshold_payload(probability, threshold)
+        payload['model_version'] = bundle.version
+        payload['tier'] = tier
+        return json_response(payload, bundle=bundle, tier=tier)
+
+    except Exception as e:
+        request.state.exception = e
+        return json_response({
+            'error': f'Erreur lors de la prédiction: {str(e)}'
+        }, 500)
+
+
+def score_batch(body, input_format, accept, query, bundle, timer=None):
+    """
+    Décodage, scoring et encodage d'un lot (exécuté dans le pool d'inférence)
+    timer: metrics.StageTimer de la requête (étapes parse et predict)
+    Retourne (corps, mimetype, code HTTP, tier utilisé)
+    """
+    def error(message, status_code):
+        return json.dumps({'error': message}) + '\n', 'application/json', status_code, None
+
+    def option(name, default=None):
+        if name in query:
+            return query[name]
+        if isinstance(data, dict):
+            return data.get(name, default)
+        return default
+
+    try:
+        output_format = batch_formats.response_format(accept, input_format)
+        data = None
+        if input_format == 'json':
+            data = json.loads(body)
+            X = service.parse_features(data['features'], batch=True)
+        else:
+            X = batch_formats.decode(input_format, body)
+        tier = service.resolve_tier(option('tier'), bundle)
+    except batch_formats.UnsupportedFormat as e:
+        return error(str(e), 415)
+    except ValueError as e:
+        return error(f'Format invalide: {str(e)}', 400)
+    if timer is not None:
+        timer.mark('parse')
+    metrics.observe_batch('predict_batch', X.shape[0])
+
+    probabilities = bundle.predict_proba(X, tier)
+    if timer is not None:
+        timer.mark('predict')
+
+    if output_format != 'json':
+        return batch_formats.encode(output_format, probabilities) + (200, tier)
+
+    if option('format') == 'columnar':
+        probabilities_only = str(option('probabilities_only', 'false')).lower() in ('1', 'true')
+        return batch_formats.encode_columnar(probabilities, probabilities_only), 'application/json', 200, tier
+
+    body = json.dumps(service.batch_rows_payload(probabilities), sort_keys=True, separators=(',', ':'))
+    return body + '\n', 'application/json', 200, tier
+
+
+@prediction_endpoint
+async def predict_batch(request):
+    """
+    Endpoint pour des prédictions en batch (voir app.predict_batch)
+
+    En mode NDJSON, le corps de la requête est lu en entier avant d'être
+    scoré par paquets: seule la réponse est en streaming.
+    """
+    try:
+        bundle = await current_bundle()
+        if bundle is None:
+            return json_response({
+                'error': 'Modèle non chargé.'
+            }, 503)
+
+        content_type = request.headers.get('content-type', '')
+        try:
+            input_format = batch_formats.request_format(content_type.split(';')[0].strip())
+            if input_format == 'ndjson':
+                tier = request_tier(request, None, bundle)
+                chunk_size = int(request.query_params.get('chunk_size', service.STREAM_CHUNK_SIZE))
+                if not 1 <= chunk_size <= service.STREAM_MAX_CHUNK_SIZE:
+                    raise ValueError(f'chunk_size doit être entre 1 et {service.STREAM_MAX_CHUNK_SIZE}')
+        except batch_formats.UnsupportedFormat as e:
+            return json_response({
+                'error': str(e)
+            }, 415)
+        except ValueError as e:
+            return json_response({
+                'error': f'Format invalide: {str(e)}'
+            }, 400)
+
+        body = await request.body()
+
+        if input_format == 'ndjson':
+            lines = service.stream_predictions(io.BytesIO(body), chunk_size, bundle, tier)
+            return StreamingResponse(lines, media_type=batch_formats.NDJSON_MIMETYPE,
+                                     headers=response_headers(bundle, tier))
+
+        accept = parse_accept_header(request.headers.get('accept'), MIMEAccept)
+        content, mimetype, status_code, tier = await run_inference(
+            score_batch, body, input_format, accept, request.query_params, bundle, request.state.stage_timer)
+        return Response(content, status_code=status_code, media_type=mimetype,
+                        headers=response_headers(bundle, tier))
+
+    except Exception as e:
+        request.state.exception = e
+        return json_response({
+            'error': f'Erreur: {str(e)}'
+        }, 500)
+
+
+async def prometheus_metrics(request):
+    """Métriques Prometheus (voir app.prometheus_metrics)"""
+    rendered = metrics.render()
+    if rendered is None:
+        return json_response({
+            'error': 'Métriques désactivées (METRICS_ENABLED=0 ou prometheus_client absent)'
+        }, 404)
+    body, content_type = rendered
+    return Response(body, headers={'Content-Type': content_type})
+
+
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/health', health),
+        Route('/ready', ready),
+        Route('/model-info', model_info),
+        Route('/predict', predict, methods=['POST']),
+        Route('/predict_with_threshold', predict_with_threshold, methods=['POST']),
+        Route('/predict_batch', predict_batch, methods=['POST']),
+        Route('/metrics', prometheus_metrics),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])]
+)
+
+# Charger le modèle au démarrage (voir service.start)
+service.start()
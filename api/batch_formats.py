@@ -0,0 +1,247 @@
+"""
+Formats binaires pour /predict_batch
+
+Formats acceptés (en-tête Content-Type):
+- application/json                    {"features": [[...], ...]} (défaut)
+- application/x-npy                   tableau NumPy .npy (n, 200), float32 ou float64
+- application/x-float32               uint32 little-endian (nombre de lignes)
+                                      puis n * 200 float32 little-endian
+- application/vnd.apache.arrow.stream flux Arrow IPC, colonnes var_0 ... var_199
+                                      (nécessite pyarrow)
+- application/x-ndjson                une ligne JSON par observation, lue et scorée
+                                      par paquets (réponse NDJSON en streaming)
+
+Les corps .npy et float32 sont lus sans copie (np.frombuffer sur le corps de
+la requête). La réponse utilise le format demandé par l'en-tête Accept, ou à
+défaut celui de la requête. En binaire, la réponse contient les probabilités:
+- .npy:    matrice float64 (n, 2) [no_transaction, transaction]
+- float32: uint32 (n) puis n * 2 float32
+- Arrow:   colonnes prediction, no_transaction, transaction, confidence
+
+La réponse JSON peut aussi être colonnaire (?format=columnar): des tableaux
+prediction / p_transaction / confidence construits directement depuis NumPy
+et encodés avec orjson s'il est installé.
+"""
+import io
+import json
+import struct
+
+import numpy as np
+
+N_FEATURES = 200
+
+FORMATS = {
+    'json': 'application/json',
+    'npy': 'application/x-npy',
+    'float32': 'application/x-float32',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+MIMETYPES = {mimetype: name for name, mimetype in FORMATS.items()}
+
+# Format streaming: la réponse est toujours en NDJSON
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+RAW_HEADER = struct.Struct('<I')
+
+
+class UnsupportedFormat(Exception):
+    """Format inconnu ou dépendance optionnelle absente"""
+
+
+def request_format(mimetype):
+    """Nom du format correspondant au Content-Type (json si absent)"""
+    if not mimetype:
+        return 'json'
+    if mimetype == NDJSON_MIMETYPE:
+        return 'ndjson'
+    if mimetype not in MIMETYPES:
+        accepted = ', '.join(list(FORMATS.values()) + [NDJSON_MIMETYPE])
+        raise UnsupportedFormat(f"Content-Type non supporté: {mimetype}. Acceptés: {accepted}")
+    return MIMETYPES[mimetype]
+
+
+def response_format(accept_mimetypes, default):
+    """Format de réponse négocié avec l'en-tête Accept"""
+    if not accept_mimetypes or accept_mimetypes.best in (None, '*/*'):
+        return default
+    # Le format de la requête passe en premier en cas d'égalité
+    candidates = [FORMATS[default]] + [m for m in FORMATS.values() if m != FORMATS[default]]
+    best = accept_mimetypes.best_match(candidates)
+    return MIMETYPES[best] if best else default
+
+
+def _import_orjson():
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+
+def columnar_payload(probabilities, probabilities_only=False):
+    """Réponse colonnaire (tableaux NumPy) à partir de predict_proba (n, 2)"""
+    # orjson n'accepte que des tableaux contigus
+    payload = {'p_transaction': np.ascontiguousarray(probabilities[:, 1])}
+    if not probabilities_only:
+        payload['prediction'] = (probabilities[:, 1] > probabilities[:, 0]).astype(np.int8)
+        payload['confidence'] = probabilities.max(axis=1) * 100
+    payload['total'] = len(probabilities)
+    return payload
+
+
+def encode_columnar(probabilities, probabilities_only=False):
+    """Sérialise la réponse colonnaire en JSON (bytes), sans boucle Python par ligne"""
+    payload = columnar_payload(np.asarray(probabilities, dtype=np.float64), probabilities_only)
+    orjson = _import_orjson()
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    payload = {key: value.tolist() if isinstance(value, np.ndarray) else value
+               for key, value in payload.items()}
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def _check_matrix(X):
+    if X.ndim != 2 or X.shape[1] != N_FEATURES:
+        raise ValueError(f'Attendu une matrice (n, {N_FEATURES}), reçu {X.shape}')
+    if X.dtype.kind != 'f':
+        raise ValueError(f'Type non supporté: {X.dtype} (float32 ou float64 attendu)')
+    return X
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+    except ImportError:
+        raise UnsupportedFormat("Le format Arrow nécessite pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def decode_npy(body):
+    """Lit un tableau .npy sans copie"""
+    stream = io.BytesIO(body)
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    else:
+        raise ValueError(f'Version .npy non supportée: {version}')
+    if dtype.hasobject:
+        raise ValueError('Les tableaux .npy d\'objets ne sont pas acceptés')
+
+    count = int(np.prod(shape))
+    if len(body) - stream.tell() != count * dtype.itemsize:
+        raise ValueError('Taille du corps incohérente avec l\'en-tête .npy')
+
+    X = np.frombuffer(body, dtype=dtype, count=count, offset=stream.tell())
+    if fortran_order:
+        X = X.reshape(shape[::-1]).T
+    else:
+        X = X.reshape(shape)
+    return _check_matrix(X)
+
+
+def decode_float32(body):
+    """Lit le format brut: uint32 (n) puis n * 200 float32 little-endian"""
+    if len(body) < RAW_HEADER.size:
+        raise ValueError('Corps trop court pour l\'en-tête')
+    (n_rows,) = RAW_HEADER.unpack_from(body)
+    expected = RAW_HEADER.size + n_rows * N_FEATURES * 4
+    if len(body) != expected:
+        raise ValueError(f'Taille du corps invalide: {len(body)} octets, attendu {expected} pour {n_rows} lignes')
+    X = np.frombuffer(body, dtype='<f4', count=n_rows * N_FEATURES, offset=RAW_HEADER.size)
+    return X.reshape(n_rows, N_FEATURES)
+
+
+def decode_arrow(body):
+    """Lit un flux Arrow IPC (colonnes var_0 ... var_199)"""
+    pa = _import_pyarrow()
+    table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+
+    names = [f'var_{i}' for i in range(N_FEATURES)]
+    if not set(names).issubset(table.column_names):
+        raise ValueError('Colonnes attendues: var_0 ... var_199')
+
+    X = np.empty((table.num_rows, N_FEATURES), dtype=np.float64)
+    for j, name in enumerate(names):
+        X[:, j] = table.column(name).to_numpy()
+    return X
+
+
+def iter_ndjson_chunks(stream, chunk_size, on_error):
+    """
+    Lit un flux NDJSON ligne par ligne et produit des paquets (indices, matrice)
+    d'au plus `chunk_size` lignes valides. Chaque ligne est soit une liste de
+    200 valeurs, soit un objet {"features": [...]}.
+
+    Le tampon (chunk_size, 200) est réutilisé d'un paquet à l'autre: le
+    consommateur doit avoir fini de l'utiliser avant de demander le suivant.
+    Les lignes invalides sont signalées à on_error(index, message) et ignorées.
+    """
+    buffer = np.empty((chunk_size, N_FEATURES), dtype=np.float64)
+    indices = []
+    index = 0
+
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+            if isinstance(row, dict):
+                row = row['features']
+            if not isinstance(row, list) or len(row) != N_FEATURES:
+                raise ValueError(f'{N_FEATURES} features attendues')
+            buffer[len(indices)] = row
+        except (ValueError, KeyError, TypeError) as e:
+            on_error(index, str(e))
+        else:
+            indices.append(index)
+            if len(indices) == chunk_size:
+                yield indices, buffer
+                indices = []
+        index += 1
+
+    if indices:
+        yield indices, buffer[:len(indices)]
+
+
+def decode(fmt, body):
+    """Convertit le corps d'une requête binaire en matrice (n, 200)"""
+    if fmt == 'npy':
+        return decode_npy(body)
+    if fmt == 'float32':
+        return decode_float32(body)
+    if fmt == 'arrow':
+        return decode_arrow(body)
+    raise UnsupportedFormat(f'Format non supporté: {fmt}')
+
+
+def encode(fmt, probabilities):
+    """Sérialise les probabilités (n, 2); retourne (corps, mimetype)"""
+    probabilities = np.ascontiguousarray(probabilities, dtype=np.float64)
+
+    if fmt == 'npy':
+        buffer = io.BytesIO()
+        np.lib.format.write_array(buffer, probabilities, allow_pickle=False)
+        return buffer.getvalue(), FORMATS['npy']
+
+    if fmt == 'float32':
+        body = RAW_HEADER.pack(len(probabilities)) + probabilities.astype('<f4').tobytes()
+        return body, FORMATS['float32']
+
+    if fmt == 'arrow':
+        pa = _import_pyarrow()
+        table = pa.table({
+            'prediction': np.argmax(probabilities, axis=1).astype(np.int8),
+            'no_transaction': probabilities[:, 0],
+            'transaction': probabilities[:, 1],
+            'confidence': probabilities.max(axis=1) * 100,
+        })
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), FORMATS['arrow']
+
+    raise UnsupportedFormat(f'Format non supporté: {fmt}')
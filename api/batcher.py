@@ -0,0 +1,143 @@
+"""
+Micro-batching des prédictions unitaires
+
+Regroupe les requêtes concurrentes (/predict, /predict_with_threshold) en une
+seule matrice, scorée par un unique appel au modèle. Le lot est envoyé dès
+qu'il atteint `max_batch_size` lignes ou que `max_wait_ms` est écoulé depuis
+l'arrivée de la première requête.
+
+Chaque ligne peut porter un contexte (le bundle de modèle capturé par la
+requête): les lignes d'un même lot sont regroupées par contexte, si bien
+qu'un rechargement du modèle pendant l'attente ne change pas le modèle qui
+score une requête déjà en cours.
+"""
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Regroupe des lignes soumises par plusieurs threads et les score en lot"""
+
+    def __init__(self, score_fn, max_batch_size=32, max_wait_ms=2.0):
+        """
+        score_fn: fonction (matrice n x 200, contexte) -> predict_proba (n x 2)
+        max_batch_size: nombre maximum de lignes par lot
+        max_wait_ms: attente maximale (ms) avant d'envoyer un lot incomplet
+        """
+        self.score_fn = score_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+        # Compteurs
+        self._stats_lock = threading.Lock()
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_errors = 0
+        self.batch_sizes = Counter()
+
+    def submit(self, row, context=None):
+        """Soumet une ligne de features et retourne un Future (probabilités)"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((row, context, future))
+        return future
+
+    def predict(self, row, context=None, timeout=None):
+        """Soumet une ligne et attend ses probabilités [p0, p1]"""
+        return self.submit(row, context).result(timeout=timeout)
+
+    def _ensure_worker(self):
+        """Démarre le thread de traitement (à la demande, et après un fork)"""
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == pid and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                # Processus forké (worker gunicorn): repartir d'une file neuve
+                self._queue = queue.Queue()
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Boucle principale: collecte un lot puis le score"""
+        q = self._queue
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(q.get(timeout=remaining))
+                    else:
+                        batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._process(batch)
+
+    def _process(self, batch):
+        """Score un lot et transmet à chaque appelant son propre résultat"""
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        # Un passage du modèle par contexte (un seul en dehors d'un rechargement)
+        groups = {}
+        for item in batch:
+            groups.setdefault(id(item[1]), []).append(item)
+
+        for group in groups.values():
+            try:
+                X = np.vstack([row for row, _, _ in group])
+                probabilities = self.score_fn(X, group[0][1])
+            except Exception as e:
+                for _, _, future in group:
+                    future.set_exception(e)
+                with self._stats_lock:
+                    self.n_errors += 1
+                continue
+
+            for i, (_, _, future) in enumerate(group):
+                future.set_result(probabilities[i])
+
+        with self._stats_lock:
+            self.n_requests += len(batch)
+            self.n_batches += 1
+            self.batch_sizes[len(batch)] += 1
+
+    def stats(self):
+        """Compteurs sur les tailles de lots atteintes"""
+        with self._stats_lock:
+            sizes = dict(sorted(self.batch_sizes.items()))
+            n_requests = self.n_requests
+            n_batches = self.n_batches
+            n_errors = self.n_errors
+
+        return {
+            'enabled': True,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'requests': n_requests,
+            'batches': n_batches,
+            'errors': n_errors,
+            'avg_batch_size': n_requests / n_batches if n_batches else 0.0,
+            'max_batch_size_seen': max(sizes) if sizes else 0,
+            'batch_size_histogram': {str(size): count for size, count in sizes.items()}
+        }
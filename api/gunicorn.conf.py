@@ -0,0 +1,72 @@
+"""
+Configuration gunicorn de l'API (lue automatiquement depuis api/)
+
+preload_app: le maître importe l'application et charge le modèle une seule
+fois, puis forke les workers, qui partagent ses pages mémoire (copy-on-write).
+La forêt compilée est en plus projetée depuis des fichiers .npy en lecture
+seule (MODEL_MMAP): ces pages-là ne peuvent jamais être dupliquées.
+
+Pour ne pas casser le copy-on-write:
+- le ramasse-miettes est désactivé dans le maître, puis gc.freeze() place
+  tous les objets existants dans une génération permanente juste avant le
+  fork: les collectes des workers ne réécrivent plus leurs en-têtes;
+- les threads (surveillance des fichiers, micro-batcher) sont démarrés dans
+  chaque worker après le fork, jamais dans le maître.
+
+PRELOAD_APP=0 revient à un chargement indépendant par worker.
+
+Métriques Prometheus (metrics.py): chaque worker écrit les siennes dans
+PROMETHEUS_MULTIPROC_DIR, que /metrics agrège. Le répertoire est fixé ici,
+avant l'import de l'application: sans valeur fournie, un répertoire
+temporaire est créé (puis supprimé à l'arrêt); un répertoire fourni est
+vidé au démarrage (les fichiers d'un run précédent fausseraient les
+compteurs). child_exit retire les jauges des workers terminés.
+"""
+import gc
+import glob
+import os
+import shutil
+import tempfile
+
+preload_app = os.environ.get('PRELOAD_APP', '1') == '1'
+
+if preload_app:
+    # Lu par app.py: chargement synchrone dans le maître, threads démarrés par post_fork
+    os.environ['APP_PRELOAD'] = '1'
+    gc.disable()
+
+metrics_enabled = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+# Une seule fois par maître: le fichier de config est relu à chaque SIGHUP
+if metrics_enabled and os.environ.get('METRICS_DIR_READY') != '1':
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='santander-metrics-')
+        os.environ['METRICS_DIR_TEMPORARY'] = '1'
+    else:
+        os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+        for path in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+            os.remove(path)
+    os.environ['METRICS_DIR_READY'] = '1'
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+        import service
+        service.init_worker()
+
+
+def child_exit(server, worker):
+    if metrics_enabled:
+        import metrics
+        metrics.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    if os.environ.get('METRICS_DIR_TEMPORARY') == '1':
+        shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
@@ -0,0 +1,158 @@
+"""
+Métriques Prometheus de l'API (GET /metrics, format texte)
+
+- santander_request_duration_seconds{endpoint}: latence des routes de prédiction
+- santander_stage_duration_seconds{endpoint, stage}: latence par étape
+    parse:     lecture du corps, décodage JSON, conversion en matrice NumPy
+    predict:   normalisation et modèle (attente du micro-batcher ou du pool de
+               threads ASGI comprise). Avec le moteur compilé, le scaler est
+               replié dans les seuils: il n'y a pas d'étape de normalisation
+    serialize: construction de la réponse et encodage JSON
+- santander_batch_rows{endpoint}: lignes par requête de /predict_batch, et par
+  lot du micro-batcher (endpoint="microbatch")
+- santander_requests_total{endpoint, status, model_version}
+- santander_errors_total{endpoint, status, exception}: réponses 4xx / 5xx,
+  avec la classe de l'exception interceptée par la route (500)
+- santander_model_info{model_version, engine, pid}: bundle actif de chaque worker
+
+Plusieurs workers gunicorn: chaque processus écrit ses valeurs dans des
+fichiers projetés en mémoire sous PROMETHEUS_MULTIPROC_DIR (positionné par
+gunicorn.conf.py avant l'import de l'application), et /metrics agrège les
+fichiers de tous les workers, y compris ceux des workers terminés (compteurs
+et histogrammes restent cumulatifs; child_exit retire leurs jauges). Sans
+cette variable, seul le registre du processus est exposé.
+
+Coût: pendant la requête, StageTimer ne fait que lire l'horloge; les
+observations sont écrites une fois la réponse construite, via des
+enfants de métriques mis en cache (pas de labels() par requête). Budget
+mesuré par scripts/benchmark_api.py --metrics: OVERHEAD_BUDGET_US par requête.
+
+METRICS_ENABLED=0 (ou prometheus_client absent) désactive l'instrumentation.
+"""
+import os
+import time
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+# Budget du coût de l'instrumentation par requête instrumentée (µs)
+OVERHEAD_BUDGET_US = 50
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1000, 10000, 100000, 1000000)
+
+
+def _import_prometheus_client():
+    try:
+        import prometheus_client
+    except ImportError:
+        return None
+    return prometheus_client
+
+
+prometheus_client = _import_prometheus_client() if METRICS_ENABLED else None
+enabled = prometheus_client is not None
+
+if METRICS_ENABLED and not enabled:
+    print("⚠️ prometheus_client absent: métriques désactivées (pip install prometheus-client)")
+
+if enabled:
+    from prometheus_client import Counter, Gauge, Histogram
+
+    REQUEST_DURATION = Histogram('santander_request_duration_seconds', 'Latence des routes de prédiction',
+                                 ['endpoint'], buckets=LATENCY_BUCKETS)
+    STAGE_DURATION = Histogram('santander_stage_duration_seconds', 'Latence par étape des routes de prédiction',
+                               ['endpoint', 'stage'], buckets=LATENCY_BUCKETS)
+    BATCH_ROWS = Histogram('santander_batch_rows', 'Lignes scorées par requête ou par lot du micro-batcher',
+                           ['endpoint'], buckets=BATCH_BUCKETS)
+    REQUESTS = Counter('santander_requests', 'Requêtes des routes de prédiction',
+                       ['endpoint', 'status', 'model_version'])
+    ERRORS = Counter('santander_errors', 'Réponses en erreur des routes de prédiction',
+                     ['endpoint', 'status', 'exception'])
+    MODEL_INFO = Gauge('santander_model_info', 'Bundle actif (1) du worker', ['model_version', 'engine'],
+                       multiprocess_mode='liveall')
+
+# Enfants de métriques par combinaison de labels (labels() coûte plus qu'une lecture de dict)
+_children = {}
+_active_model = None
+
+
+def _child(metric, *labels):
+    key = (metric._name, labels)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = metric.labels(*labels)
+    return child
+
+
+class StageTimer:
+    """
+    Chronomètre d'une requête: mark(stage) note la durée écoulée depuis la marque
+    précédente; finish() écrit toutes les observations une fois la réponse prête
+    """
+    __slots__ = ('endpoint', 'start', 'last', 'stages')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = self.last = time.perf_counter()
+        self.stages = []
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+
+    def finish(self, status, model_version=None, exception=None):
+        """status: code HTTP; exception: exception interceptée par la route (réponse 500)"""
+        if not enabled:
+            return
+        endpoint = self.endpoint
+        _child(REQUEST_DURATION, endpoint).observe(time.perf_counter() - self.start)
+        for stage, seconds in self.stages:
+            _child(STAGE_DURATION, endpoint, stage).observe(seconds)
+        status = str(status)
+        _child(REQUESTS, endpoint, status, model_version or '').inc()
+        if status[0] in '45':
+            _child(ERRORS, endpoint, status, type(exception).__name__ if exception is not None else '').inc()
+
+
+def observe_batch(endpoint, n_rows):
+    """Taille d'un lot scoré"""
+    if enabled:
+        _child(BATCH_ROWS, endpoint).observe(n_rows)
+
+
+def set_active_model(bundle):
+    """Bundle actif du worker (santander_model_info)"""
+    global _active_model
+    if not enabled:
+        return
+    if _active_model is not None:
+        _child(MODEL_INFO, *_active_model).set(0)
+    _active_model = (bundle.version, bundle.engine) if bundle is not None else None
+    if _active_model is not None:
+        _child(MODEL_INFO, *_active_model).set(1)
+
+
+def render():
+    """
+    Corps et type de contenu de /metrics: agrégation des fichiers de tous les
+    workers en mode multiprocessus, registre du processus sinon
+    Retourne None si les métriques sont désactivées
+    """
+    if not enabled:
+        return None
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Retire les jauges d'un worker terminé (hook child_exit de gunicorn.conf.py)"""
+    if enabled and os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,446 @@
+"""
+Bundle immuable (modèle, scaler, métadonnées) servi par l'API
+
+Chaque chargement produit un nouveau ModelBundle: rien n'est modifié en
+place. Un rechargement à chaud construit, préchauffe et vérifie le nouveau
+bundle en arrière-plan, puis l'API remplace la référence active en une seule
+affectation. Une requête capture le bundle actif à son arrivée et le garde
+jusqu'à la fin: elle se termine sur l'ancien modèle même si un échange a lieu
+entre-temps.
+
+La version du bundle est le début du hash SHA-256 de tous les fichiers
+chargés: modèle, scaler, model_metadata.json, feature_mapping.json et tier
+rapide. Un scaler réentraîné seul, ou une transformation de score modifiée,
+change aussi la version: le rechargement à chaud l'applique.
+
+Démarrage à froid: avec le moteur compilé, le modèle (best_model.npz) et le
+scaler (scaler.npz) sont lus sans pickle; joblib, scikit-learn et LightGBM
+ne sont alors jamais importés. best_model.npz enregistre le hash des .pkl
+dont il a été exporté: s'il ne correspond plus (compile_model.py non relancé
+après un entraînement), la forêt est compilée depuis best_model.pkl.
+
+Tier rapide: fast_model.npz (élève distillé du modèle servi, voir
+scripts/distill_model.py) est chargé avec le bundle s'il existe. Il prend
+les features brutes et n'est activé que si best_model.pkl est bien le
+professeur dont il a été distillé (hash de fast_model.json).
+
+Mémoire partagée: la forêt servie (scaler replié) peut être écrite une fois
+par version du modèle et du scaler dans un répertoire de .npy
+(shared_root/<version>) puis projetée
+en mémoire en lecture seule: tous les workers partagent les mêmes pages.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from tree_engine import CompiledForest, PARITY_TOLERANCE
+
+N_FEATURES = 200
+
+# Lot de contrôle: lignes tirées autour de la moyenne du scaler (graine fixe)
+CANARY_ROWS = 256
+CANARY_SEED = 20240501
+
+SCALER_FORMAT_VERSION = 1
+
+
+class BundleCheckError(Exception):
+    """Le nouveau bundle ne passe pas le contrôle sur le lot de contrôle"""
+
+
+class ModelBundle(namedtuple('ModelBundle', [
+        'model', 'scaler', 'scaler_mean', 'scaler_inv_scale', 'metadata',
+        'feature_mapping', 'version', 'engine', 'model_path', 'loaded_at',
+        'fast_model', 'fast_metadata'])):
+    """
+    model: LGBMClassifier (moteur lightgbm) ou CompiledForest (moteur compiled)
+    scaler_mean / scaler_inv_scale: normalisation fusionnée, None si le
+    scaler est replié dans les seuils du modèle compilé (ou absent)
+    fast_model: CompiledForest du tier rapide sur les features brutes, None
+    s'il est absent ou distillé d'un autre modèle (raison dans fast_metadata)
+    """
+    __slots__ = ()
+
+    def predict_proba(self, X, tier='full'):
+        """
+        Applique la normalisation puis le modèle sur une matrice (n, 200)
+        Retourne predict_proba (n, 2) en un seul passage du modèle
+        tier: 'full' (modèle servi) ou 'fast' (élève distillé, si chargé)
+        """
+        if tier == 'fast':
+            return self.fast_model.predict_proba(X)
+        if self.scaler_mean is not None:
+            X = np.subtract(X, self.scaler_mean)
+            X *= self.scaler_inv_scale
+        return self.model.predict_proba(X)
+
+    def describe(self):
+        """Résumé du bundle pour /model-info et /admin/reload"""
+        return {
+            'model_version': self.version,
+            'engine': self.engine,
+            'model_file': os.path.basename(self.model_path),
+            'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.loaded_at))
+        }
+
+    def describe_tiers(self):
+        """Les deux tiers de prédiction pour /model-info: taille, AUC et parité du tier rapide"""
+        metadata = self.fast_metadata or {}
+        teacher = metadata.get('teacher', {})
+        fast = {'available': self.fast_model is not None}
+        if 'unavailable_reason' in metadata:
+            fast['unavailable_reason'] = metadata['unavailable_reason']
+        if self.fast_model is not None:
+            fast.update({
+                'n_estimators': self.fast_model.n_estimators,
+                'max_depth': self.fast_model.max_depth,
+                'n_nodes': self.fast_model.n_nodes,
+                'created_at': metadata.get('created_at'),
+                'auc': metadata.get('auc'),
+                'parity': metadata.get('parity'),
+                'latency_ms': metadata.get('latency', {}).get('student_ms'),
+            })
+        return {
+            'default': 'full',
+            'full': {
+                'available': True,
+                'n_estimators': getattr(self.model, 'n_estimators', None),
+                'auc': teacher.get('auc', self.metadata.get('roc_auc_score')),
+                'latency_ms': metadata.get('latency', {}).get('teacher_ms'),
+            },
+            'fast': fast,
+        }
+
+
+class ScalerParams(namedtuple('ScalerParams', ['mean_', 'scale_'])):
+    """Paramètres d'un StandardScaler lus depuis scaler.npz (sans scikit-learn)"""
+    __slots__ = ()
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+
+def save_scaler(scaler, path):
+    """Sauvegarde moyenne et échelle d'un StandardScaler en .npz (sans pickle)"""
+    np.savez(path, format_version=np.int32(SCALER_FORMAT_VERSION),
+             mean=np.asarray(scaler.mean_, dtype=np.float64),
+             scale=np.asarray(scaler.scale_, dtype=np.float64))
+
+
+def load_scaler(path):
+    """Charge un scaler sauvegardé avec save_scaler()"""
+    with np.load(path, allow_pickle=False) as data:
+        version = int(data['format_version'])
+        if version != SCALER_FORMAT_VERSION:
+            raise ValueError(f"Version de format non supportée: {version}")
+        return ScalerParams(data['mean'], data['scale'])
+
+
+def load_pickle(path):
+    """joblib.load, importé à la demande (il entraîne scikit-learn / LightGBM)"""
+    import joblib
+    return joblib.load(path)
+
+
+def files_version(*paths):
+    """Version d'un ensemble d'artefacts: début du hash SHA-256 de leurs contenus"""
+    digest = hashlib.sha256()
+    for path in paths:
+        if path is None or not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def load_json(path, default):
+    """Charge un fichier JSON optionnel"""
+    if not os.path.exists(path):
+        print(f"⚠️ {os.path.basename(path)} non trouvé.")
+        return default
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def share_forest(model, shared_root, version):
+    """
+    Projette la forêt servie en mémoire depuis shared_root/<version>, en l'y
+    écrivant si besoin (répertoire temporaire puis renommage atomique: plusieurs
+    workers peuvent le faire en même temps). Les versions précédentes sont
+    supprimées: un fichier déjà projeté reste lisible jusqu'à sa fermeture.
+    """
+    directory = os.path.join(shared_root, version)
+    if not CompiledForest.shared_complete(directory):
+        # Répertoire incomplet ou d'une révision précédente (voir SHARED_REVISION): réécrit
+        if os.path.exists(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+        tmp = f'{directory}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        model.save_shared(tmp)
+        try:
+            os.rename(tmp, directory)
+        except OSError:
+            # Écrit par un autre worker entre-temps
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    for name in os.listdir(shared_root):
+        if name != version and re.fullmatch(r'[0-9a-f]{12}', name):
+            shutil.rmtree(os.path.join(shared_root, name), ignore_errors=True)
+
+    return CompiledForest.load_shared(directory)
+
+
+def prepare_scaling(model, scaler):
+    """
+    Précalcule la normalisation du StandardScaler.
+    Avec le moteur compilé, le scaler est replié dans les seuils des arbres.
+    Retourne (modèle, scaler_mean, scaler_inv_scale)
+    """
+    if scaler is None or model is None:
+        return model, None, None
+
+    if isinstance(model, CompiledForest):
+        try:
+            model = model.fold_scaler(scaler.mean_, scaler.scale_)
+            print("✅ Scaler replié dans les seuils du modèle compilé")
+            return model, None, None
+        except ValueError as e:
+            print(f"⚠️ Scaler non replié ({e}), normalisation fusionnée utilisée")
+
+    scaler_mean = np.asarray(scaler.mean_, dtype=np.float64)
+    scaler_inv_scale = 1.0 / np.asarray(scaler.scale_, dtype=np.float64)
+    return model, scaler_mean, scaler_inv_scale
+
+
+def load_fast_tier(fast_model_path, fast_metadata_path, model_path):
+    """
+    Charge l'élève distillé (tier rapide) et son rapport de distillation
+    Le tier n'est pas activé si best_model.pkl n'est plus son professeur
+    Retourne (CompiledForest ou None, métadonnées ou None)
+    """
+    if fast_model_path is None or not os.path.exists(fast_model_path):
+        return None, None
+
+    metadata = load_json(fast_metadata_path, {}) if fast_metadata_path is not None else {}
+    teacher_sha256 = metadata.get('teacher', {}).get('model_sha256')
+    if teacher_sha256 is None:
+        reason = 'fast_model.json absent ou sans hash du professeur'
+    elif os.path.exists(model_path) and not teacher_sha256.startswith(files_version(model_path)):
+        reason = 'distillé d\'un autre modèle que best_model.pkl: relancer scripts/distill_model.py'
+    else:
+        forest = CompiledForest.load(fast_model_path)
+        print(f"✅ Tier rapide chargé ({forest.n_estimators} arbres, profondeur {forest.max_depth})")
+        return forest, metadata
+
+    print(f"⚠️ Tier rapide désactivé: {reason}")
+    return None, dict(metadata, unavailable_reason=reason)
+
+
+def compiled_stale_reason(compiled_model_path, model_path, scaler_path, native_scaler_path):
+    """
+    Vérifie que best_model.npz a été exporté des best_model.pkl, scaler.pkl et
+    scaler.npz présents (hash enregistré par scripts/compile_model.py)
+    Retourne None si c'est le cas ou si best_model.pkl est absent (rien à
+    comparer), la raison sinon
+    """
+    if not os.path.exists(model_path):
+        return None
+    source_version = CompiledForest.source_version(compiled_model_path)
+    if source_version is None:
+        return 'best_model.npz sans hash de provenance'
+    if source_version != files_version(model_path, scaler_path, native_scaler_path):
+        return 'best_model.npz ou scaler.npz exporté d\'un autre best_model.pkl / scaler.pkl'
+    return None
+
+
+def load_bundle(engine, model_path, scaler_path, metadata_path, feature_mapping_path,
+                compiled_model_path, native_scaler_path=None, timings=None, shared_root=None,
+                fast_model_path=None, fast_metadata_path=None):
+    """
+    Charge un bundle complet depuis le disque
+    Avec le moteur compilé, best_model.npz et native_scaler_path (scaler.npz) sont
+    préférés aux pickles s'ils en ont été exportés (compiled_stale_reason), et la
+    forêt est projetée en mémoire depuis shared_root si celui-ci est fourni.
+    fast_model_path / fast_metadata_path: tier rapide optionnel (voir load_fast_tier)
+    timings: dictionnaire optionnel, complété par la durée (ms) de chaque étape
+    Retourne None si aucun modèle n'est disponible
+    """
+    if timings is None:
+        timings = {}
+    start = time.perf_counter()
+
+    stale_reason = None
+    if engine == 'compiled' and os.path.exists(compiled_model_path):
+        stale_reason = compiled_stale_reason(compiled_model_path, model_path, scaler_path, native_scaler_path)
+
+    if engine == 'compiled' and os.path.exists(compiled_model_path) and stale_reason is None:
+        model = CompiledForest.load(compiled_model_path)
+        source = compiled_model_path
+        print(f"✅ Modèle compilé chargé avec succès ({model.n_estimators} arbres)")
+    elif os.path.exists(model_path):
+        model = load_pickle(model_path)
+        source = model_path
+        if engine == 'compiled':
+            # Pas d'artefact .npz à jour: compiler à la volée depuis le booster
+            model = CompiledForest.from_booster(model)
+            print(f"⚠️ {stale_reason or 'best_model.npz absent'}: modèle compilé depuis best_model.pkl "
+                  "(relancer scripts/compile_model.py)")
+        print("✅ Modèle chargé avec succès")
+    else:
+        print("⚠️ Modèle non trouvé. Entraînez d'abord un modèle.")
+        return None
+
+    timings['model_load_ms'] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+
+    scaler = None
+    scaler_source = None
+    # scaler.npz seulement avec le best_model.npz exporté en même temps que lui
+    if (source == compiled_model_path and native_scaler_path is not None
+            and os.path.exists(native_scaler_path)):
+        scaler = load_scaler(native_scaler_path)
+        scaler_source = native_scaler_path
+        print("✅ Scaler chargé avec succès (scaler.npz)")
+    elif os.path.exists(scaler_path):
+        scaler = load_pickle(scaler_path)
+        scaler_source = scaler_path
+        print("✅ Scaler chargé avec succès")
+    else:
+        print("⚠️ Scaler non trouvé.")
+
+    model, scaler_mean, scaler_inv_scale = prepare_scaling(model, scaler)
+    timings['scaler_load_ms'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    fast_model, fast_metadata = load_fast_tier(fast_model_path, fast_metadata_path, model_path)
+    # Tous les fichiers chargés font la version: un élève redistillé, des métadonnées ou
+    # un mapping modifiés seuls sont aussi appliqués par le rechargement (et vident le cache)
+    fast_paths = (fast_model_path, fast_metadata_path) if fast_model is not None else ()
+    version = files_version(source, scaler_source, metadata_path, feature_mapping_path, *fast_paths)
+    timings['fast_tier_load_ms'] = (time.perf_counter() - start) * 1000
+
+    if shared_root is not None and isinstance(model, CompiledForest):
+        start = time.perf_counter()
+        # Forêt partagée indexée sur le modèle et le scaler seuls: pas de réécriture
+        # quand seules les métadonnées changent
+        forest_version = files_version(source, scaler_source)
+        try:
+            model = share_forest(model, shared_root, forest_version)
+            print(f"✅ Modèle projeté en mémoire partagée ({os.path.join(shared_root, forest_version)})")
+        except OSError as e:
+            print(f"⚠️ Mémoire partagée indisponible ({e}), modèle gardé en mémoire privée")
+        timings['shared_map_ms'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+
+    # Métadonnées: transformation probabilité -> score, questions du formulaire
+    metadata = load_json(metadata_path, {})
+    feature_mapping = load_json(feature_mapping_path, [])
+    timings['metadata_load_ms'] = (time.perf_counter() - start) * 1000
+
+    return ModelBundle(
+        model=model,
+        scaler=scaler,
+        scaler_mean=scaler_mean,
+        scaler_inv_scale=scaler_inv_scale,
+        metadata=metadata,
+        feature_mapping=feature_mapping,
+        version=version,
+        engine=engine,
+        model_path=source,
+        loaded_at=time.time(),
+        fast_model=fast_model,
+        fast_metadata=fast_metadata
+    )
+
+
+def canary_batch(scaler, n_rows=CANARY_ROWS):
+    """
+    Lot de contrôle déterministe, dans l'échelle des features brutes
+    Le dernier quart contient des valeurs manquantes (NaN isolés, dernière ligne
+    entièrement NaN): le routage de NaN fait partie de la parité contrôlée
+    """
+    rng = np.random.default_rng(CANARY_SEED)
+    Z = rng.normal(size=(n_rows, N_FEATURES))
+    missing = rng.random(size=Z.shape) < 0.05
+    missing[:n_rows - n_rows // 4] = False
+    missing[-1] = True
+    if scaler is not None:
+        Z = np.asarray(scaler.mean_) + Z * np.asarray(scaler.scale_)
+    Z[missing] = np.nan
+    return Z
+
+
+def check_bundle(bundle, reference=None, reference_model_path=None, reference_scaler_path=None):
+    """
+    Préchauffe le bundle et le contrôle sur le lot de contrôle:
+    - probabilités de forme (n, 2), finies, dans [0, 1], de somme 1
+    - moteur compilé: parité avec le modèle et le scaler picklés (si présents)
+      à PARITY_TOLERANCE, ce qui détecte un .npz non régénéré
+    - écart avec le bundle actif (reference), pour information
+
+    Lève BundleCheckError si le contrôle échoue, retourne un rapport sinon
+    """
+    X = canary_batch(bundle.scaler)
+
+    start = time.perf_counter()
+    probabilities = bundle.predict_proba(X)
+    warmup_ms = (time.perf_counter() - start) * 1000
+
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    if probabilities.shape != (len(X), 2):
+        raise BundleCheckError(f'Forme des probabilités invalide: {probabilities.shape}')
+    if not np.isfinite(probabilities).all():
+        raise BundleCheckError('Probabilités non finies sur le lot de contrôle')
+    if probabilities.min() < 0 or probabilities.max() > 1:
+        raise BundleCheckError('Probabilités hors de [0, 1] sur le lot de contrôle')
+    if np.abs(probabilities.sum(axis=1) - 1).max() > 1e-6:
+        raise BundleCheckError('Les probabilités ne somment pas à 1')
+
+    report = {
+        'canary_rows': len(X),
+        'warmup_ms': warmup_ms,
+        'mean_p_transaction': float(probabilities[:, 1].mean())
+    }
+
+    if bundle.fast_model is not None:
+        fast = np.asarray(bundle.predict_proba(X, 'fast'), dtype=np.float64)
+        if fast.shape != probabilities.shape or not np.isfinite(fast).all() or fast.min() < 0 or fast.max() > 1:
+            raise BundleCheckError('Probabilités du tier rapide invalides sur le lot de contrôle')
+        report['fast_tier'] = {
+            'max_abs_diff': float(np.abs(fast[:, 1] - probabilities[:, 1]).max()),
+            'mean_abs_diff': float(np.abs(fast[:, 1] - probabilities[:, 1]).mean())
+        }
+
+    # Les .npz doivent correspondre aux .pkl livrés avec eux (compile_model.py non relancé ?)
+    if (isinstance(bundle.model, CompiledForest) and reference_model_path is not None
+            and bundle.model_path != reference_model_path and os.path.exists(reference_model_path)):
+        scaler = bundle.scaler
+        if reference_scaler_path is not None and os.path.exists(reference_scaler_path):
+            scaler = load_pickle(reference_scaler_path)
+        X_scaled = X if scaler is None else scaler.transform(X)
+        expected = load_pickle(reference_model_path).predict_proba(X_scaled)
+        parity = float(np.abs(probabilities - expected).max())
+        report['engine_parity'] = parity
+        if parity > PARITY_TOLERANCE:
+            raise BundleCheckError(
+                f'Le modèle compilé diffère du modèle picklé (écart max {parity:.2e}): '
+                'relancer scripts/compile_model.py')
+
+    if reference is not None:
+        previous = reference.predict_proba(X)
+        report['drift_vs_active'] = {
+            'max_abs_diff': float(np.abs(probabilities[:, 1] - previous[:, 1]).max()),
+            'mean_abs_diff': float(np.abs(probabilities[:, 1] - previous[:, 1]).mean()),
+            'decision_changes': int(((probabilities[:, 1] > probabilities[:, 0])
+                                     != (previous[:, 1] > previous[:, 0])).sum())
+        }
+
+    return report
@@ -0,0 +1,95 @@
+"""
+Cache LRU des prédictions unitaires
+
+La clé est un hash (BLAKE2b) des octets du vecteur de features canonicalisé
+(float64, -0.0 ramené à 0.0, NaN unifiés) et de la version du modèle: un
+rechargement du modèle ne peut donc jamais servir une probabilité périmée.
+La taille est bornée (éviction LRU) et un TTL optionnel peut être appliqué.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PredictionCache:
+    """Cache LRU thread-safe: hash du vecteur de features -> probabilités"""
+
+    def __init__(self, max_size=4096, ttl=0.0):
+        """
+        max_size: nombre maximum d'entrées
+        ttl: durée de vie des entrées en secondes (0 = illimitée)
+        """
+        self.max_size = max(1, int(max_size))
+        self.ttl = max(0.0, float(ttl))
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Compteurs
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(row, model_version):
+        """Clé de cache d'un vecteur de features pour une version de modèle"""
+        row = np.asarray(row, dtype=np.float64) + 0.0  # -0.0 -> 0.0
+        if np.isnan(row).any():
+            row = np.where(np.isnan(row), np.nan, row)
+        digest = hashlib.blake2b(np.ascontiguousarray(row).tobytes(), digest_size=16)
+        digest.update(str(model_version).encode())
+        return digest.digest()
+
+    def get(self, key):
+        """Probabilités en cache, ou None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Ajoute une entrée, en évinçant la moins récemment utilisée si besoin"""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Vide le cache (rechargement du modèle)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Compteurs hits / misses / évictions"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': True,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
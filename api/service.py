@@ -0,0 +1,594 @@
+"""
+Service de prédiction commun aux points d'entrée de l'API
+
+- app.py:      application Flask (WSGI, gunicorn), historique
+- asgi_app.py: application ASGI (uvicorn), inférence dans un pool de threads
+
+Ce module ne dépend d'aucun framework web: configuration (variables
+d'environnement), cycle de vie du modèle (chargement, préchauffage,
+rechargement à chaud), scoring et construction des réponses JSON.
+"""
+import time
+STARTUP_T0 = time.perf_counter()  # origine des temps de démarrage (/ready)
+
+import json
+import numpy as np
+import os
+import threading
+
+import batch_formats
+import metrics
+import model_bundle
+from batcher import MicroBatcher
+from prediction_cache import PredictionCache
+
+# Chemins des modèles (compatible local et Render)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.environ.get('MODEL_PATH', os.path.join(BASE_DIR, '..', 'models', 'best_model.pkl'))
+SCALER_PATH = os.environ.get('SCALER_PATH', os.path.join(BASE_DIR, '..', 'models', 'scaler.pkl'))
+METADATA_PATH = os.environ.get('METADATA_PATH', os.path.join(BASE_DIR, '..', 'models', 'model_metadata.json'))
+FEATURE_MAPPING_PATH = os.environ.get('FEATURE_MAPPING_PATH', os.path.join(BASE_DIR, '..', 'models', 'feature_mapping.json'))
+COMPILED_MODEL_PATH = os.environ.get('COMPILED_MODEL_PATH', os.path.join(BASE_DIR, '..', 'models', 'best_model.npz'))
+SCALER_NPZ_PATH = os.environ.get('SCALER_NPZ_PATH', os.path.join(BASE_DIR, '..', 'models', 'scaler.npz'))
+
+# Tier rapide (option tier=fast): élève distillé par scripts/distill_model.py
+FAST_MODEL_PATH = os.environ.get('FAST_MODEL_PATH', os.path.join(BASE_DIR, '..', 'models', 'fast_model.npz'))
+FAST_METADATA_PATH = os.environ.get('FAST_METADATA_PATH', os.path.join(BASE_DIR, '..', 'models', 'fast_model.json'))
+TIERS = ('full', 'fast')
+
+# Moteur d'inférence: 'compiled' (tableaux NumPy sans pickle, voir tree_engine.py) ou 'lightgbm' (modèle picklé)
+MODEL_ENGINE = os.environ.get('MODEL_ENGINE', 'compiled')
+
+# Démarrage: chargement du modèle en arrière-plan (/health répond tout de suite),
+# les prédictions attendent la fin du chargement au plus READY_TIMEOUT secondes
+BACKGROUND_LOAD = os.environ.get('BACKGROUND_LOAD', '1') == '1'
+READY_TIMEOUT = float(os.environ.get('READY_TIMEOUT', 30))
+
+# Modèle partagé entre workers: forêt servie projetée en mémoire (mmap, lecture seule)
+# depuis MODEL_MMAP_DIR/<version>. APP_PRELOAD est positionné par gunicorn.conf.py
+# (preload_app): le modèle est alors chargé une fois par le maître avant les forks.
+MODEL_MMAP = os.environ.get('MODEL_MMAP', '1') == '1'
+MODEL_MMAP_DIR = os.environ.get('MODEL_MMAP_DIR', os.path.join(BASE_DIR, '..', 'models', 'mmap'))
+APP_PRELOAD = os.environ.get('APP_PRELOAD', '0') == '1'
+
+# Micro-batching des requêtes unitaires (optionnel, utile avec des workers multi-threads)
+MICROBATCH_ENABLED = os.environ.get('MICROBATCH_ENABLED', '0') == '1'
+MICROBATCH_MAX_SIZE = int(os.environ.get('MICROBATCH_MAX_SIZE', 32))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get('MICROBATCH_MAX_WAIT_MS', 2))
+
+# Streaming NDJSON de /predict_batch: lignes scorées par paquet, erreurs conservées dans le trailer
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 1000))
+STREAM_MAX_CHUNK_SIZE = 100000
+STREAM_MAX_ERRORS = 1000
+
+# Cache LRU des prédictions unitaires (0 = désactivé), TTL optionnel en secondes
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 0))
+
+# /what_if: points par courbe par défaut et nombre maximum de lignes scorées par requête
+WHAT_IF_POINTS = int(os.environ.get('WHAT_IF_POINTS', 11))
+WHAT_IF_MAX_ROWS = int(os.environ.get('WHAT_IF_MAX_ROWS', 5000))
+
+# Rechargement à chaud: jeton de /admin/reload (désactivé si absent) et
+# surveillance des fichiers du modèle toutes les N secondes (0 = désactivée)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 0))
+
+N_FEATURES = 200
+
+# Bundle actif (modèle, scaler, métadonnées), remplacé en bloc au rechargement.
+# Les handlers le lisent une seule fois par requête (voir model_bundle.py).
+active_bundle = None
+batcher = None
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL) if PREDICTION_CACHE_SIZE > 0 else None
+
+# Un seul rechargement à la fois; état du dernier rechargement pour /model-info
+reload_lock = threading.Lock()
+reload_status = {'state': 'idle'}
+
+# Chronologie du démarrage (ms depuis STARTUP_T0), exposée par /ready
+startup = {'phases': {}}
+ready_event = threading.Event()
+started = False
+worker_started = False
+
+# Endpoints dont la première réponse réussie fixe time_to_first_prediction_ms
+PREDICTION_ENDPOINTS = {'predict', 'predict_with_threshold', 'predict_batch', 'what_if'}
+
+def load_bundle(timings=None):
+    """Charge un nouveau bundle depuis les chemins configurés"""
+    return model_bundle.load_bundle(MODEL_ENGINE, MODEL_PATH, SCALER_PATH, METADATA_PATH,
+                                    FEATURE_MAPPING_PATH, COMPILED_MODEL_PATH,
+                                    SCALER_NPZ_PATH, timings,
+                                    MODEL_MMAP_DIR if MODEL_MMAP else None,
+                                    FAST_MODEL_PATH, FAST_METADATA_PATH)
+
+def activate_bundle(bundle):
+    """Remplace le bundle actif (une seule affectation, atomique pour les handlers)"""
+    global active_bundle
+    active_bundle = bundle
+    # Avec preload_app, le maître ne publie pas de version: ses workers le font
+    if worker_started:
+        metrics.set_active_model(bundle)
+    
+    # Les entrées en cache appartiennent à l'ancien modèle
+    # (leurs clés incluent la version: ce nettoyage libère seulement la mémoire)
+    if prediction_cache is not None:
+        prediction_cache.clear()
+
+def warm_up(bundle):
+    """Inférences synthétiques (une ligne, puis un lot) avant de se déclarer prêt"""
+    X = model_bundle.canary_batch(bundle.scaler, 64)
+    bundle.predict_proba(X[:1])
+    bundle.predict_proba(X)
+    if bundle.fast_model is not None:
+        bundle.predict_proba(X[:1], 'fast')
+
+def load_model():
+    """Charge le modèle et le scaler, préchauffe, puis signale que le worker est prêt"""
+    phases = startup['phases']
+    try:
+        start = time.perf_counter()
+        bundle = load_bundle(phases)
+        if bundle is not None:
+            start = time.perf_counter()
+            warm_up(bundle)
+            phases['warmup_ms'] = (time.perf_counter() - start) * 1000
+            print(f"✅ Modèle actif: version {bundle.version}")
+        activate_bundle(bundle)
+    except Exception as e:
+        startup['error'] = str(e)
+        print(f"❌ Erreur lors du chargement: {e}")
+    finally:
+        startup['ready_ms'] = (time.perf_counter() - STARTUP_T0) * 1000
+        ready_event.set()
+
+def wait_until_ready(timeout=None):
+    """Attend la fin du chargement initial (scripts, tests); True si un modèle est actif"""
+    ready_event.wait(timeout)
+    return active_bundle is not None
+
+def reload_model(trigger):
+    """
+    Recharge le modèle sans interrompre le service: le nouveau bundle est
+    chargé, préchauffé et contrôlé sur le lot de contrôle, puis échangé.
+    En cas d'échec, le bundle actif reste en place.
+    Retourne l'état du rechargement (voir reload_status)
+    """
+    global reload_status
+    if not reload_lock.acquire(blocking=False):
+        return None
+    
+    try:
+        previous = active_bundle
+        status = {
+            'state': 'running',
+            'trigger': trigger,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'previous_version': previous.version if previous else None
+        }
+        reload_status = status
+        start = time.perf_counter()
+        try:
+            bundle = load_bundle()
+            if bundle is None:
+                raise model_bundle.BundleCheckError('Aucun modèle à charger')
+            status['candidate_version'] = bundle.version
+            # Contrôle même à version égale: un .pkl modifié sans .npz régénéré est signalé
+            status['check'] = model_bundle.check_bundle(bundle, previous, MODEL_PATH, SCALER_PATH)
+            if previous is not None and bundle.version == previous.version:
+                status['state'] = 'unchanged'
+            else:
+                activate_bundle(bundle)
+                status['state'] = 'swapped'
+                print(f"🔄 Modèle rechargé ({trigger}): {status['previous_version']} -> {bundle.version}")
+        except Exception as e:
+            status['state'] = 'failed'
+            status['error'] = str(e)
+            print(f"❌ Rechargement refusé ({trigger}): {e}")
+        status['duration_ms'] = (time.perf_counter() - start) * 1000
+        reload_status = dict(status)
+        return reload_status
+    finally:
+        reload_lock.release()
+
+def watched_signature():
+    """(taille, date de modification) des fichiers dont dépend le bundle"""
+    signature = []
+    for path in (COMPILED_MODEL_PATH, MODEL_PATH, SCALER_NPZ_PATH, SCALER_PATH,
+                 METADATA_PATH, FEATURE_MAPPING_PATH, FAST_MODEL_PATH, FAST_METADATA_PATH):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+def watch_model_files(interval):
+    """
+    Surveille les artefacts et recharge quand ils changent.
+    Un changement n'est pris en compte qu'une fois stable sur deux relevés
+    consécutifs, pour ne pas lire un fichier en cours d'écriture.
+    """
+    loaded = watched_signature()
+    pending = None
+    while True:
+        time.sleep(interval)
+        current = watched_signature()
+        if current == loaded:
+            pending = None
+        elif current != pending:
+            pending = current
+        else:
+            status = reload_model('file_watch')
+            if status is not None:
+                loaded = current
+                pending = None
+
+def start_model_watcher():
+    """Démarre la surveillance des fichiers (un thread par processus)"""
+    thread = threading.Thread(target=watch_model_files, args=(MODEL_WATCH_INTERVAL,),
+                              name='model-watcher', daemon=True)
+    thread.start()
+    print(f"✅ Surveillance des fichiers du modèle activée (toutes les {MODEL_WATCH_INTERVAL:g} s)")
+
+def get_bundle(wait=True):
+    """
+    Bundle actif, à capturer une fois pour toute la durée d'une requête.
+    Pendant le chargement initial, attend au plus READY_TIMEOUT secondes.
+    """
+    bundle = active_bundle
+    if bundle is None and wait and not ready_event.is_set():
+        ready_event.wait(READY_TIMEOUT)
+        bundle = active_bundle
+    return bundle
+
+def record_first_prediction(endpoint, status_code):
+    """Mesure le temps jusqu'à la première prédiction réussie du worker"""
+    if ('time_to_first_prediction_ms' not in startup and status_code == 200
+            and endpoint in PREDICTION_ENDPOINTS):
+        startup['time_to_first_prediction_ms'] = (time.perf_counter() - STARTUP_T0) * 1000
+        startup['first_prediction_endpoint'] = endpoint
+
+def init_worker():
+    """
+    Démarre les threads propres à un worker (appelé par post_fork de
+    gunicorn.conf.py): les threads du maître ne survivent pas au fork.
+    Le micro-batcher redémarre seul (contrôle du pid).
+    """
+    global worker_started
+    worker_started = True
+    if active_bundle is not None:
+        metrics.set_active_model(active_bundle)
+    if MODEL_WATCH_INTERVAL > 0:
+        start_model_watcher()
+
+def parse_features(features, batch=False):
+    """
+    Convertit les features JSON en matrice NumPy float64 (n, 200)
+    Lève ValueError si la forme est invalide
+    """
+    X = np.array(features, dtype=np.float64, ndmin=2)
+    if X.ndim != 2 or (not batch and X.shape[0] != 1):
+        raise ValueError('Format des features invalide')
+    if X.shape[1] != N_FEATURES:
+        raise ValueError(f'Nombre de features invalide. Attendu: {N_FEATURES}, Reçu: {X.shape[1]}')
+    return X
+
+def resolve_tier(tier, bundle):
+    """
+    Tier demandé ('full' par défaut, 'fast'). Sans élève chargé (absent ou
+    distillé d'un autre modèle), tier=fast est servi par le modèle complet:
+    la réponse indique le tier réellement utilisé.
+    Lève ValueError si le tier est inconnu
+    """
+    tier = 'full' if tier is None else str(tier).lower()
+    if tier not in TIERS:
+        raise ValueError(f"Tier inconnu: {tier}. Attendu: {' ou '.join(TIERS)}")
+    if tier == 'fast' and bundle.fast_model is None:
+        return 'full'
+    return tier
+
+def score_matrix(X, bundle=None):
+    """
+    Applique la normalisation puis le modèle sur une matrice (n, 200)
+    Retourne predict_proba (n, 2) en un seul passage du modèle
+    """
+    if bundle is None:
+        bundle = active_bundle
+    metrics.observe_batch('microbatch', X.shape[0])
+    return bundle.predict_proba(X)
+
+def score_row(X, bundle, tier='full'):
+    """
+    Retourne les probabilités [p0, p1] pour une matrice (1, 200)
+    Consulte d'abord le cache, puis le micro-batcher s'il est actif.
+    Le tier rapide ne passe pas par le micro-batcher: l'attente du lot
+    dépasserait le temps de l'élève lui-même.
+    """
+    key = None
+    if prediction_cache is not None:
+        key = PredictionCache.key(X[0], bundle.version if tier == 'full' else f'{bundle.version}:{tier}')
+        probability = prediction_cache.get(key)
+        if probability is not None:
+            return probability
+    
+    if tier != 'full':
+        probability = bundle.predict_proba(X, tier)[0]
+    elif batcher is not None:
+        probability = batcher.predict(X[0], bundle)
+    else:
+        probability = bundle.predict_proba(X)[0]
+    
+    if key is not None:
+        prediction_cache.put(key, probability)
+    return probability
+
+def probability_to_score(probabilities, metadata):
+    """Transforme des probabilités en score 0-100 (scoring_transform de model_metadata.json)"""
+    transform = metadata.get('scoring_transform')
+    if not transform:
+        return None
+    p_min = transform['p_min']
+    p_max = transform['p_max']
+    clipped = np.clip(probabilities, p_min, p_max)
+    return (clipped - p_min) / (p_max - p_min) * 100
+
+def what_if_grids(features_to_vary, n_points, feature_mapping):
+    """
+    Grilles de valeurs par feature: valeurs explicites, sinon n_points entre
+    p10 et p90 (feature_mapping.json). Par défaut: les features du questionnaire.
+    Lève ValueError si une feature ou une liste de valeurs est invalide
+    """
+    mapping = {item['var_index']: item for item in feature_mapping}
+    if features_to_vary is None:
+        features_to_vary = [{'var_index': item['var_index']} for item in feature_mapping]
+    
+    grids = []
+    for item in features_to_vary:
+        if not isinstance(item, dict):
+            item = {'var_index': item}
+        index = int(item['var_index'])
+        if not 0 <= index < N_FEATURES:
+            raise ValueError(f'Index de feature invalide: {index}')
+        
+        if item.get('values') is not None:
+            values = item['values']
+            if not isinstance(values, list) or not values:
+                raise ValueError(f'"values" de var_{index} doit être une liste non vide de nombres')
+            try:
+                values = np.asarray(values, dtype=np.float64)
+            except (ValueError, TypeError):
+                raise ValueError(f'"values" de var_{index} doit contenir des nombres finis')
+            if values.ndim != 1 or not np.isfinite(values).all():
+                raise ValueError(f'"values" de var_{index} doit contenir des nombres finis')
+        elif index in mapping:
+            values = np.linspace(mapping[index]['p10'], mapping[index]['p90'], n_points)
+        else:
+            raise ValueError(f'Pas de plage p10-p90 connue pour var_{index}: fournir "values"')
+        grids.append((index, values))
+    return grids
+
+def threshold_decision(prob_transaction, threshold):
+    """Applique le seuil de décision et calcule le niveau de confiance"""
+    prediction = 1 if prob_transaction >= threshold else 0
+    
+    # Niveau de confiance
+    distance_from_threshold = abs(prob_transaction - threshold)
+    if distance_from_threshold > 0.3:
+        confidence_level = "HIGH"
+    elif distance_from_threshold > 0.1:
+        confidence_level = "MEDIUM"
+    else:
+        confidence_level = "LOW"
+    
+    # Score de risque
+    risk_score = 1 - prob_transaction if prediction == 1 else prob_transaction
+    
+    return prediction, confidence_level, risk_score
+
+def prediction_payload(probability):
+    """Réponse de /predict pour des probabilités [p0, p1]"""
+    prediction = int(np.argmax(probability))
+    
+    # Calculer la confiance
+    confidence = max(probability) * 100
+    
+    return {
+        'prediction': prediction,
+        'probability': {
+            'no_transaction': float(probability[0]),
+            'transaction': float(probability[1])
+        },
+        'confidence': float(confidence),
+        'message': 'Transaction prédite' if prediction == 1 else 'Pas de transaction prédite'
+    }
+
+def threshold_payload(probability, threshold):
+    """Réponse de /predict_with_threshold pour des probabilités [p0, p1]"""
+    prob_transaction = probability[1]
+    prediction, confidence_level, risk_score = threshold_decision(prob_transaction, threshold)
+    
+    return {
+        'prediction': int(prediction),
+        'probability': {
+            'no_transaction': float(probability[0]),
+            'transaction': float(probability[1])
+        },
+        'probability_percent': f"{prob_transaction*100:.2f}%",
+        'decision': 'CREDIT_ACCEPTED' if prediction == 1 else 'CREDIT_REJECTED',
+        'threshold_used': threshold,
+        'confidence_level': confidence_level,
+        'risk_score': float(risk_score),
+        'message': f"Probabilité de transaction: {prob_transaction*100:.1f}% (seuil: {threshold*100:.0f}%)"
+    }
+
+def stream_predictions(stream, chunk_size, bundle, tier='full'):
+    """
+    Générateur NDJSON: score le flux par paquets de chunk_size lignes et
+    termine par un trailer avec les totaux et les erreurs par ligne.
+    La mémoire reste bornée par la taille d'un paquet.
+    """
+    errors = []
+    n_errors = 0
+    total = 0
+    n_chunks = 0
+    
+    def on_error(index, message):
+        nonlocal n_errors
+        n_errors += 1
+        if len(errors) < STREAM_MAX_ERRORS:
+            errors.append({'index': index, 'error': message})
+    
+    trailer = {'trailer': True}
+    try:
+        for indices, X in batch_formats.iter_ndjson_chunks(stream, chunk_size, on_error):
+            probabilities = bundle.predict_proba(X, tier)
+            lines = []
+            for index, prob in zip(indices, probabilities.tolist()):
+                lines.append(json.dumps({
+                    'index': index,
+                    'prediction': int(prob[1] > prob[0]),
+                    'probability': {
+                        'no_transaction': prob[0],
+                        'transaction': prob[1]
+                    },
+                    'confidence': max(prob) * 100
+                }))
+            total += len(indices)
+            n_chunks += 1
+            yield '\n'.join(lines) + '\n'
+    except Exception as e:
+        trailer['error'] = f'Erreur: {str(e)}'
+    metrics.observe_batch('predict_batch', total)
+    
+    trailer.update({
+        'tier': tier,
+        'total': total,
+        'chunks': n_chunks,
+        'chunk_size': chunk_size,
+        'n_errors': n_errors,
+        'errors': errors,
+        'errors_truncated': n_errors > len(errors)
+    })
+    yield json.dumps(trailer) + '\n'
+
+def batch_rows_payload(probabilities):
+    """Réponse historique de /predict_batch: un dictionnaire par ligne"""
+    results = []
+    for i, prob in enumerate(probabilities.tolist()):
+        results.append({
+            'index': i,
+            'prediction': int(prob[1] > prob[0]),
+            'probability': {
+                'no_transaction': prob[0],
+                'transaction': prob[1]
+            },
+            'confidence': max(prob) * 100
+        })
+    
+    return {
+        'predictions': results,
+        'total': len(results)
+    }
+
+def cache_stats():
+    """Compteurs du cache de prédictions"""
+    if prediction_cache is None:
+        return {'enabled': False}
+    return prediction_cache.stats()
+
+def batcher_stats():
+    """Compteurs du micro-batching"""
+    if batcher is None:
+        return {'enabled': False}
+    return batcher.stats()
+
+def health_payload():
+    """Réponse de /health (sans attendre le chargement du modèle)"""
+    bundle = get_bundle(wait=False)
+    if bundle:
+        model_status = 'loaded'
+    else:
+        model_status = 'not_loaded' if ready_event.is_set() else 'loading'
+    return {
+        'status': 'healthy',
+        'model_status': model_status,
+        'scaler_status': 'loaded' if bundle and bundle.scaler else 'not_loaded',
+        'model_version': bundle.version if bundle else None,
+        'microbatch': batcher_stats(),
+        'prediction_cache': cache_stats()
+    }
+
+def ready_payload():
+    """Réponse de /ready et code HTTP (200 une fois le modèle chargé et préchauffé, 503 avant)"""
+    bundle = get_bundle(wait=False)
+    is_ready = ready_event.is_set() and bundle is not None
+    payload = dict(startup)
+    payload['phases'] = dict(startup['phases'])
+    payload['ready'] = is_ready
+    payload['engine'] = MODEL_ENGINE
+    payload['model_version'] = bundle.version if bundle else None
+    payload['uptime_ms'] = (time.perf_counter() - STARTUP_T0) * 1000
+    return payload, 200 if is_ready else 503
+
+def model_info_payload(bundle):
+    """Réponse de /model-info: métadonnées du modèle chargé"""
+    model = bundle.model
+    model_type = type(model).__name__
+    
+    # Informations selon le type de modèle
+    info = {
+        'model_type': model_type,
+        'n_features': 200,
+        'feature_names': [f'var_{i}' for i in range(200)],
+        'training_framework': 'scikit-learn',
+        'scaler': 'StandardScaler' if bundle.scaler else 'None',
+        'target': 'binary_classification',
+        'classes': [0, 1],
+        'class_names': ['No Transaction', 'Transaction']
+    }
+    
+    # Ajouter des infos spécifiques selon le modèle
+    if hasattr(model, 'coef_'):
+        info['n_coefficients'] = len(model.coef_[0])
+        info['intercept'] = float(model.intercept_[0])
+    
+    if hasattr(model, 'n_estimators'):
+        info['n_estimators'] = model.n_estimators
+    
+    if hasattr(model, 'max_depth'):
+        info['max_depth'] = model.max_depth
+    
+    # Version active (hash des fichiers chargés) et dernier rechargement
+    info.update(bundle.describe())
+    info['tiers'] = bundle.describe_tiers()
+    info['reload'] = reload_status
+    
+    return info
+
+def start():
+    """
+    Démarre le service (une fois par processus, appelé à l'import des points
+    d'entrée app.py et asgi_app.py): chargement du modèle en arrière-plan
+    (le worker accepte les connexions pendant le chargement, /ready passe à
+    200 une fois préchauffé) et micro-batcher.
+    Avec preload_app, le maître charge avant de forker: les workers héritent du modèle.
+    """
+    global started, batcher
+    if started:
+        return
+    started = True
+    startup['phases']['imports_ms'] = (time.perf_counter() - STARTUP_T0) * 1000
+    
+    if BACKGROUND_LOAD and not APP_PRELOAD:
+        threading.Thread(target=load_model, name='model-loader', daemon=True).start()
+    else:
+        load_model()
+    
+    if not APP_PRELOAD:
+        init_worker()
+    
+    if MICROBATCH_ENABLED:
+        batcher = MicroBatcher(score_matrix, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS)
+        print(f"✅ Micro-batching activé (lot max: {MICROBATCH_MAX_SIZE}, attente max: {MICROBATCH_MAX_WAIT_MS} ms)")
@@ -0,0 +1,335 @@
+"""
+Moteur d'inférence compilé pour les modèles LightGBM (GBDT binaire)
+
+Le dump du booster est lu une seule fois et tous les arbres sont aplatis dans
+des tableaux NumPy contigus (feature, seuil, enfants, valeur des feuilles).
+Un lot est évalué niveau par niveau: à chaque itération, toutes les lignes
+avancent d'un niveau dans tous les arbres à la fois.
+
+Les feuilles pointent sur elles-mêmes, ce qui permet de faire exactement
+`max_depth` itérations sans test de fin. L'artefact est un fichier `.npz`
+sans pickle (np.load(..., allow_pickle=False)).
+
+Valeurs manquantes: hors splits "NaN", LightGBM remplace NaN par 0. Une fois
+le scaler replié (fold_scaler), ce 0 normalisé correspond à la moyenne du
+scaler en échelle brute: nan_value garde, par feature, la valeur brute qui
+remplace NaN (0 sans scaler replié). Les splits en 0 ont un seuil de
+±K_ZERO_THRESHOLD: replié, le seuil négatif reste strictement sous la moyenne.
+
+Pour le partage entre workers, save_shared() écrit la forêt prête à servir
+(index natifs et enfants entrelacés compris) en fichiers .npy non compressés:
+load_shared() les projette en mémoire en lecture seule (mmap), et tous les
+processus partagent les mêmes pages du cache disque.
+"""
+import json
+import os
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# Révision des répertoires de save_shared() (forêt repliée): un répertoire d'une révision
+# précédente est réécrit (2: nan_value et seuils en 0 repliés sous la moyenne)
+SHARED_REVISION = 2
+
+# Types de valeurs manquantes LightGBM
+MISSING_NONE = 0
+MISSING_ZERO = 1
+MISSING_NAN = 2
+MISSING_TYPES = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+
+# Seuil en dessous duquel LightGBM considère une valeur comme nulle
+K_ZERO_THRESHOLD = 1e-35
+
+# Nombre de lignes évaluées à la fois (borne la mémoire des matrices n x n_trees)
+BLOCK_ROWS = 2048
+
+# Écart maximal toléré avec LGBMClassifier.predict_proba
+PARITY_TOLERANCE = 1e-9
+
+
+class CompiledForest:
+    """Forêt d'arbres aplatie en tableaux NumPy, évaluée de façon vectorisée"""
+
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'default_left',
+              'missing_type', 'leaf_value', 'roots')
+
+    # Tableaux dérivés, stockés aussi par save_shared() pour ne pas être recalculés
+    SHARED_ARRAYS = ARRAYS + ('nan_value', 'feature_index', 'children', 'root_index')
+
+    def __init__(self, feature, threshold, left, right, default_left, missing_type,
+                 leaf_value, roots, max_depth, n_features, sigmoid=1.0, nan_value=None,
+                 feature_index=None, children=None, root_index=None):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.default_left = np.ascontiguousarray(default_left, dtype=bool)
+        self.missing_type = np.ascontiguousarray(missing_type, dtype=np.int8)
+        self.leaf_value = np.ascontiguousarray(leaf_value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.sigmoid = float(sigmoid)
+        # Valeur brute qui remplace NaN hors splits "NaN" (optionnelle dans les .npz)
+        if nan_value is None:
+            nan_value = np.zeros(self.n_features)
+        self.nan_value = np.ascontiguousarray(nan_value, dtype=np.float64)
+
+        # Index natifs et enfants entrelacés [gauche, droite]: un seul gather par niveau
+        # (fournis par load_shared(): projetés en mémoire, sans copie par processus)
+        if feature_index is None:
+            feature_index = self.feature.astype(np.intp)
+        if children is None:
+            children = np.column_stack([self.left, self.right]).ravel().astype(np.intp)
+        if root_index is None:
+            root_index = self.roots.astype(np.intp)
+        self._feature = feature_index
+        self._children = children
+        self._roots = root_index
+
+        # Les splits "Zero" nécessitent le chemin lent même sans NaN en entrée
+        self._has_zero_missing = bool((self.missing_type == MISSING_ZERO).any())
+
+    @property
+    def n_estimators(self):
+        """Nombre d'arbres"""
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        """Nombre total de noeuds (internes + feuilles)"""
+        return len(self.feature)
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_booster(cls, booster):
+        """Compile un lightgbm.Booster (ou un LGBMClassifier entraîné)"""
+        if hasattr(booster, 'booster_'):
+            booster = booster.booster_
+
+        dump = booster.dump_model()
+        objective = dump['objective'].split()
+        # cross_entropy: élève distillé sur des probabilités (distill_model.py), même sigmoïde
+        if objective[0] not in ('binary', 'cross_entropy') or dump['num_tree_per_iteration'] != 1:
+            raise ValueError(f"Objectif non supporté: {dump['objective']}")
+        if dump.get('average_output'):
+            raise ValueError("Les modèles à sortie moyennée (random forest) ne sont pas supportés")
+
+        sigmoid = 1.0
+        for token in objective[1:]:
+            if token.startswith('sigmoid:'):
+                sigmoid = float(token.split(':', 1)[1])
+
+        nodes = {name: [] for name in cls.ARRAYS if name != 'roots'}
+        roots = []
+        max_depth = 0
+
+        for tree in dump['tree_info']:
+            roots.append(len(nodes['feature']))
+            # Parcours en profondeur, chaque noeud reçoit l'indice suivant
+            stack = [(tree['tree_structure'], 0, None, None)]
+            while stack:
+                node, depth, parent, side = stack.pop()
+                idx = len(nodes['feature'])
+                if parent is not None:
+                    nodes[side][parent] = idx
+
+                if 'split_index' in node:
+                    if node['decision_type'] != '<=':
+                        raise ValueError("Les splits catégoriels ne sont pas supportés")
+                    nodes['feature'].append(node['split_feature'])
+                    nodes['threshold'].append(node['threshold'])
+                    nodes['left'].append(-1)
+                    nodes['right'].append(-1)
+                    nodes['default_left'].append(node['default_left'])
+                    nodes['missing_type'].append(MISSING_TYPES[node['missing_type']])
+                    nodes['leaf_value'].append(0.0)
+                    stack.append((node['right_child'], depth + 1, idx, 'right'))
+                    stack.append((node['left_child'], depth + 1, idx, 'left'))
+                else:
+                    # Feuille: boucle sur elle-même
+                    nodes['feature'].append(0)
+                    nodes['threshold'].append(np.inf)
+                    nodes['left'].append(idx)
+                    nodes['right'].append(idx)
+                    nodes['default_left'].append(True)
+                    nodes['missing_type'].append(MISSING_NONE)
+                    nodes['leaf_value'].append(node['leaf_value'])
+                    max_depth = max(max_depth, depth)
+
+        return cls(roots=roots, max_depth=max_depth,
+                   n_features=dump['max_feature_idx'] + 1, sigmoid=sigmoid, **nodes)
+
+    def fold_scaler(self, mean, scale):
+        """
+        Intègre un StandardScaler dans les seuils des splits:
+        (x - mean) / scale <= t  <=>  x <= t * scale + mean  (scale > 0)
+        Retourne une nouvelle forêt qui prend directement les features brutes.
+        NaN reste routé comme le 0 normalisé, soit la moyenne en échelle brute.
+        """
+        if self._has_zero_missing:
+            raise ValueError("Les splits 'Zero' ne peuvent pas être repliés dans les seuils")
+        mean = np.asarray(mean, dtype=np.float64)
+        scale = np.asarray(scale, dtype=np.float64)
+        if (scale <= 0).any():
+            raise ValueError("Le scaler doit avoir des échelles strictement positives")
+
+        # Les feuilles gardent un seuil infini (inf * scale + mean = inf)
+        threshold = self.threshold * scale[self.feature] + mean[self.feature]
+        # Seuils négatifs minuscules (-K_ZERO_THRESHOLD: split en 0) arrondis à la moyenne:
+        # la moyenne (0 normalisé, NaN compris) doit rester à droite
+        below_mean = np.nextafter(mean[self.feature], -np.inf)
+        threshold = np.where((self.threshold < 0) & (threshold >= mean[self.feature]), below_mean, threshold)
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        arrays['threshold'] = threshold
+        return CompiledForest(max_depth=self.max_depth, n_features=self.n_features,
+                              sigmoid=self.sigmoid, nan_value=self.nan_value * scale + mean, **arrays)
+
+    # ------------------------------------------------------------------
+    # Sérialisation
+    # ------------------------------------------------------------------
+    def save(self, path, source_version=None):
+        """
+        Sauvegarde la forêt dans un fichier .npz compressé (sans pickle)
+        source_version: hash des fichiers dont la forêt a été exportée (voir source_version())
+        """
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        if source_version is not None:
+            arrays['source_version'] = np.str_(source_version)
+        np.savez_compressed(
+            path,
+            format_version=np.int32(FORMAT_VERSION),
+            max_depth=np.int32(self.max_depth),
+            n_features=np.int32(self.n_features),
+            sigmoid=np.float64(self.sigmoid),
+            nan_value=self.nan_value,
+            **arrays
+        )
+
+    @staticmethod
+    def source_version(path):
+        """Hash des fichiers sources enregistré par save(), None s'il est absent"""
+        with np.load(path, allow_pickle=False) as data:
+            return str(data['source_version']) if 'source_version' in data.files else None
+
+    @classmethod
+    def load(cls, path):
+        """Charge une forêt sauvegardée avec save()"""
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data['format_version'])
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Version de format non supportée: {version}")
+            arrays = {name: data[name] for name in cls.ARRAYS}
+            # Absent des .npz écrits avant nan_value: NaN remplacé par 0
+            nan_value = data['nan_value'] if 'nan_value' in data.files else None
+            return cls(max_depth=int(data['max_depth']),
+                       n_features=int(data['n_features']),
+                       sigmoid=float(data['sigmoid']),
+                       nan_value=nan_value,
+                       **arrays)
+
+    def save_shared(self, directory):
+        """
+        Écrit la forêt prête à servir dans `directory`: un .npy non compressé
+        par tableau (index dérivés compris) et meta.json
+        """
+        os.makedirs(directory, exist_ok=True)
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        arrays.update(nan_value=self.nan_value, feature_index=self._feature, children=self._children, root_index=self._roots)
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f'{name}.npy'), array, allow_pickle=False)
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'format_version': FORMAT_VERSION, 'shared_revision': SHARED_REVISION,
+                       'max_depth': self.max_depth, 'n_features': self.n_features, 'sigmoid': self.sigmoid}, f)
+
+    @classmethod
+    def shared_complete(cls, directory):
+        """Vrai si directory contient tous les fichiers écrits par save_shared(), de la révision actuelle"""
+        meta_path = os.path.join(directory, 'meta.json')
+        if not os.path.exists(meta_path) or not all(os.path.exists(os.path.join(directory, f'{name}.npy'))
+                                                    for name in cls.SHARED_ARRAYS):
+            return False
+        with open(meta_path) as f:
+            return json.load(f).get('shared_revision') == SHARED_REVISION
+
+    @classmethod
+    def load_shared(cls, directory, mmap_mode='r'):
+        """
+        Charge une forêt écrite par save_shared(), projetée en mémoire (lecture seule
+        par défaut): les workers partagent les pages au lieu d'en avoir chacun une copie
+        """
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"Version de format non supportée: {meta['format_version']}")
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode,
+                                allow_pickle=False)
+                  for name in cls.SHARED_ARRAYS}
+        return cls(max_depth=meta['max_depth'], n_features=meta['n_features'],
+                   sigmoid=meta['sigmoid'], **arrays)
+
+    # ------------------------------------------------------------------
+    # Inférence
+    # ------------------------------------------------------------------
+    def _check_input(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Attendu une matrice (n, {self.n_features}), reçu {X.shape}")
+        return X
+
+    def _walk(self, X, roots):
+        """Descend toutes les lignes de X dans les arbres `roots`, niveau par niveau"""
+        n, n_features = X.shape
+        node = np.broadcast_to(roots, (n, len(roots))).copy()
+        row_offset = (np.arange(n) * n_features)[:, None]
+        X_flat = X.ravel()
+        handle_missing = self._has_zero_missing or bool(np.isnan(X).any())
+
+        for _ in range(self.max_depth):
+            values = X_flat[row_offset + self._feature[node]]
+            if handle_missing:
+                go_right = self._go_right_missing(values, node)
+            else:
+                go_right = values > self.threshold[node]
+            node = self._children[2 * node + go_right]
+
+        return node
+
+    def _go_right_missing(self, values, node):
+        """Décision de split avec la gestion des valeurs manquantes de LightGBM"""
+        missing_type = self.missing_type[node]
+        is_nan = np.isnan(values)
+        # Hors splits "NaN", LightGBM remplace NaN par 0 (nan_value en échelle brute)
+        values = np.where(is_nan & (missing_type != MISSING_NAN), self.nan_value[self._feature[node]], values)
+        is_missing = (((missing_type == MISSING_ZERO) & (np.abs(values) <= K_ZERO_THRESHOLD))
+                      | ((missing_type == MISSING_NAN) & is_nan))
+        return np.where(is_missing, ~self.default_left[node], ~(values <= self.threshold[node]))
+
+    def predict_leaves(self, X):
+        """Indices (globaux) des feuilles atteintes, matrice (n, n_trees)"""
+        X = self._check_input(X)
+        return self._walk(X, self._roots)
+
+    def predict_margin(self, X):
+        """Somme brute des feuilles (log-odds) pour chaque ligne"""
+        X = self._check_input(X)
+        margin = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], BLOCK_ROWS):
+            block = X[start:start + BLOCK_ROWS]
+            leaves = self._walk(block, self._roots)
+            margin[start:start + len(block)] = self.leaf_value[leaves].sum(axis=1)
+        return margin
+
+    def predict_proba(self, X):
+        """Probabilités (n, 2), comme LGBMClassifier.predict_proba"""
+        p1 = 1.0 / (1.0 + np.exp(-self.sigmoid * self.predict_margin(X)))
+        return np.column_stack([1.0 - p1, p1])
+
+    def predict(self, X):
+        """Classe prédite (argmax des probabilités)"""
+        return np.argmax(self.predict_proba(X), axis=1)
@@ -5,6 +5,7 @@ import { Observable, retry, timeout, catchError, throwError } from 'rxjs';
 export interface PredictionRequest {
   features: number[];
   threshold?: number;
+  tier?: 'full' | 'fast';
 }
 
 export interface PredictionResponse {
@@ -19,6 +20,7 @@ export interface PredictionResponse {
   threshold_used?: number;
   confidence_level?: string;
   risk_score?: number;
+  tier?: 'full' | 'fast';
   message: string;
 }
 
@@ -91,9 +93,12 @@ export class ApiService {
     );
   }
 
-  // Méthode pour "réveiller" l'API (warm up)
+  // Méthode pour "réveiller" l'API (warm up): /ready répond 200 une fois le modèle chargé et préchauffé
   warmUp(): void {
-    this.http.get(`${this.apiUrl}/health`).subscribe({
+    this.http.get(`${this.apiUrl}/ready`).pipe(
+      timeout(60000),
+      retry({ count: 5, delay: 2000 })
+    ).subscribe({
       next: () => console.log('API is warm'),
       error: () => console.log('API warming up...')
     });
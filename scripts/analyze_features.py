@@ -5,6 +5,7 @@ import pandas as pd
 import numpy as np
 import joblib
 import json
+from data_cache import load_frame
 
 # Charger le modèle et les données
 model = joblib.load('../models/best_model.pkl')
@@ -43,7 +44,7 @@ print(importance_df.head(20).to_string(index=False))
 
 # Charger quelques exemples du dataset pour voir les plages de valeurs
 print("\n📈 Chargement du dataset pour analyser les distributions...")
-train = pd.read_csv('../data/train.csv')
+train = load_frame('train')
 
 # Analyser les TOP 20 features
 top_features = importance_df.head(20)['feature'].tolist()
@@ -0,0 +1,262 @@
+"""
+Script pour mesurer la latence des endpoints de prédiction de l'API
+
+Les requêtes passent par le client de test Flask (dans le même processus):
+on mesure le coût du traitement côté serveur, sans le réseau.
+
+Usage:
+    python scripts/benchmark_api.py [--api-dir api] [--batch-sizes 100 1000]
+    python scripts/benchmark_api.py --formats [--format-sizes 1000 10000 100000]
+    (coût de sérialisation des réponses de /predict_batch seul)
+    python scripts/benchmark_api.py --startup [--startup-runs 5]
+    (démarrage à froid: chaque mesure lance un interpréteur neuf)
+    python scripts/benchmark_api.py --metrics
+    (coût de l'instrumentation Prometheus, comparé à metrics.OVERHEAD_BUDGET_US)
+
+Avant les mesures, /what_if est contrôlé: une requête valide répond 200, des
+"values" vides ou non numériques répondent 400 (le script s'arrête sinon).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+warnings.filterwarnings('ignore')
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile_ms(timings, q):
+    return float(np.percentile(timings, q) * 1000)
+
+
+def bench(client, url, payload, repeat):
+    """Latences (s) de `repeat` appels POST"""
+    # Échauffement
+    for _ in range(min(10, repeat)):
+        client.post(url, json=payload)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.post(url, json=payload)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_json()
+    return timings
+
+
+def check_what_if(client, row):
+    """Contrôle des réponses de /what_if: 200 pour une requête valide, 400 pour des "values" invalides"""
+    response = client.post('/what_if', json={'features': row})
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['curves'], response.get_json()
+
+    for values in ([], ['abc'], [1.0, None], [float('inf')], 'abc'):
+        payload = {'features': row, 'features_to_vary': [{'var_index': 0, 'values': values}]}
+        response = client.post('/what_if', json=payload)
+        assert response.status_code == 400, (values, response.status_code, response.get_json())
+        assert 'error' in response.get_json()
+    print("   ✅ /what_if: requête valide 200, \"values\" invalides 400")
+
+
+def bench_formats(api_app, sizes, rng, repeat=5):
+    """
+    Compare la sérialisation des réponses de /predict_batch:
+    JSON ligne par ligne (historique) et JSON colonnaire, à probabilités égales.
+    """
+    import batch_formats
+
+    print(f"\n   Encodeur JSON colonnaire: {'orjson' if batch_formats._import_orjson() else 'json (stdlib)'}")
+    modes = [
+        ('lignes (dict par ligne)',
+         lambda P: api_app.batch_rows_response(P).get_data()),
+        ('colonnaire',
+         lambda P: batch_formats.encode_columnar(P)),
+        ('colonnaire, probabilités seules',
+         lambda P: batch_formats.encode_columnar(P, probabilities_only=True)),
+    ]
+
+    for n in sizes:
+        p1 = rng.uniform(size=n)
+        probabilities = np.column_stack([1 - p1, p1])
+        print(f"\n   {n:,} lignes")
+
+        with api_app.app.test_request_context():
+            for label, encode in modes:
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    body = encode(probabilities)
+                    timings.append(time.perf_counter() - start)
+                print(f"   {label:34} p50={percentile_ms(timings, 50):9.2f} ms   "
+                      f"réponse={len(body) / 1024:9.0f} Ko")
+
+
+# Exécuté dans un interpréteur neuf: import de l'API puis première prédiction
+STARTUP_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app
+client = app.app.test_client()
+t_import = time.perf_counter()
+health = client.get('/health')
+t_health = time.perf_counter()
+response = client.post('/predict', json={'features': [0.0] * 200})
+t_predict = time.perf_counter()
+assert response.status_code == 200, response.get_json()
+print(json.dumps({
+    'import_ms': (t_import - t0) * 1000,
+    'health_ms': (t_health - t0) * 1000,
+    'first_prediction_ms': (t_predict - t0) * 1000,
+    'modules': len(sys.modules),
+    'sklearn_imported': 'sklearn' in sys.modules,
+    'ready': client.get('/ready').get_json()
+}))
+"""
+
+
+def bench_startup(api_dir, runs):
+    """
+    Démarrage à froid: interpréteur neuf -> /health -> première prédiction
+    Le temps total inclut le lancement de l'interpréteur (mesuré par ce processus)
+    """
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', STARTUP_SNIPPET, api_dir],
+                                capture_output=True, text=True, check=True).stdout
+        total_ms = (time.perf_counter() - start) * 1000
+        result = json.loads(output.strip().splitlines()[-1])
+        result['total_ms'] = total_ms
+        results.append(result)
+
+    def median(key):
+        return float(np.median([r[key] for r in results]))
+
+    phases = results[-1]['ready']['phases']
+    print(f"\n   {runs} démarrages, médianes:")
+    print(f"   import de l'API (dont chargement synchrone)  {median('import_ms'):9.1f} ms")
+    print(f"   première réponse /health                      {median('health_ms'):9.1f} ms")
+    print(f"   première prédiction (depuis l'interpréteur)   {median('first_prediction_ms'):9.1f} ms")
+    print(f"   première prédiction (lancement du processus)  {median('total_ms'):9.1f} ms")
+    print(f"   modules importés: {results[-1]['modules']}, scikit-learn importé: "
+          f"{'oui' if results[-1]['sklearn_imported'] else 'non'}")
+    print("   phases (/ready, dernier démarrage): " +
+          ", ".join(f"{name}={value:.1f}" for name, value in phases.items()))
+
+
+def bench_metrics(client, row, repeat, model_version):
+    """
+    Coût de l'instrumentation (metrics.py), en mode multiprocessus comme sous gunicorn:
+    1. instrumentation seule d'une requête /predict (chronomètre, 3 étapes, compteurs)
+    2. /predict de bout en bout, requêtes alternées avec et sans instrumentation
+    """
+    import metrics
+
+    n = repeat * 10
+    start = time.perf_counter()
+    for _ in range(n):
+        timer = metrics.StageTimer('predict')
+        timer.mark('parse')
+        timer.mark('predict')
+        timer.mark('serialize')
+        timer.finish(200, model_version)
+    per_request_us = (time.perf_counter() - start) / n * 1e6
+
+    # Alternance requête par requête: les deux séries subissent les mêmes perturbations
+    payload = {'features': row}
+    bench(client, '/predict', payload, 10)
+    timings = {False: [], True: []}
+    for i in range(2 * repeat):
+        enabled = metrics.enabled = bool(i % 2)
+        start = time.perf_counter()
+        client.post('/predict', json=payload)
+        timings[enabled].append(time.perf_counter() - start)
+    metrics.enabled = True
+
+    print_row('/predict sans métriques', timings[False])
+    print_row('/predict avec métriques', timings[True])
+    p50_off, p50_on = percentile_ms(timings[False], 50), percentile_ms(timings[True], 50)
+    print(f"   écart p50 de bout en bout: {(p50_on - p50_off) * 1000:+.1f} µs "
+          f"({(p50_on - p50_off) / p50_off * 100:+.1f}%)")
+    status = '✅' if per_request_us <= metrics.OVERHEAD_BUDGET_US else '❌'
+    print(f"   instrumentation seule: {per_request_us:.1f} µs par requête "
+          f"(budget: {metrics.OVERHEAD_BUDGET_US} µs) {status}")
+
+
+def print_row(label, timings):
+    print(f"   {label:38} p50={percentile_ms(timings, 50):8.3f} ms   "
+          f"p99={percentile_ms(timings, 99):8.3f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark des endpoints de prédiction")
+    parser.add_argument('--api-dir', default=os.path.join(BASE_DIR, 'api'))
+    parser.add_argument('--repeat', type=int, default=300)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--formats', action='store_true',
+                        help="Compare les réponses ligne par ligne et colonnaires")
+    parser.add_argument('--format-sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--startup', action='store_true',
+                        help="Mesure le démarrage à froid et le temps jusqu'à la première prédiction")
+    parser.add_argument('--startup-runs', type=int, default=5)
+    parser.add_argument('--metrics', action='store_true',
+                        help="Mesure le coût de l'instrumentation Prometheus")
+    args = parser.parse_args()
+
+    if args.startup:
+        print("=" * 70)
+        print(f"🚀 DÉMARRAGE À FROID (moteur: {os.environ.get('MODEL_ENGINE', 'compiled')})")
+        print("=" * 70)
+        bench_startup(os.path.abspath(args.api_dir), args.startup_runs)
+        sys.exit(0)
+
+    if args.metrics and not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Mode multiprocessus (fichiers projetés en mémoire), comme sous gunicorn
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='santander-metrics-')
+
+    sys.path.insert(0, os.path.abspath(args.api_dir))
+    import app as api_app
+    api_app.service.wait_until_ready()
+
+    client = api_app.app.test_client()
+    rng = np.random.default_rng(42)
+
+    print("=" * 70)
+    print(f"⏱️  BENCHMARK API (moteur: {os.environ.get('MODEL_ENGINE', 'compiled')})")
+    print("=" * 70)
+
+    if args.formats:
+        bench_formats(api_app, args.format_sizes, rng)
+        sys.exit(0)
+
+    scaler = api_app.service.get_bundle().scaler
+    mean = scaler.mean_ if scaler is not None else np.zeros(200)
+    scale = scaler.scale_ if scaler is not None else np.ones(200)
+
+    def random_rows(n):
+        return (mean + rng.normal(size=(n, 200)) * scale).tolist()
+
+    row = random_rows(1)[0]
+    if args.metrics:
+        bench_metrics(client, row, args.repeat, api_app.service.get_bundle().version)
+        sys.exit(0)
+
+    check_what_if(client, row)
+
+    print_row('/predict', bench(client, '/predict', {'features': row}, args.repeat))
+    print_row('/predict_with_threshold',
+              bench(client, '/predict_with_threshold', {'features': row, 'threshold': 0.3}, args.repeat))
+    print_row('/what_if (questionnaire)', bench(client, '/what_if', {'features': row}, max(5, args.repeat // 10)))
+
+    for n in args.batch_sizes:
+        repeat = max(5, args.repeat * 10 // n)
+        print_row(f'/predict_batch ({n} lignes)',
+                  bench(client, '/predict_batch', {'features': random_rows(n)}, repeat))
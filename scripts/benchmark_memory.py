@@ -0,0 +1,117 @@
+"""
+Script pour mesurer la mémoire des workers gunicorn de l'API
+
+Lance gunicorn avec 1, 4 et 8 workers, envoie des prédictions (pour que
+chaque worker ait servi des requêtes), puis lit /proc/<pid>/smaps_rollup:
+- RSS: mémoire résidente du processus, pages partagées comprises
+- PSS: pages partagées divisées par le nombre de processus qui les partagent
+  (la somme des PSS est la mémoire réellement consommée)
+
+Linux uniquement.
+
+Usage:
+    python scripts/benchmark_memory.py [--workers 1 4 8]
+    MODEL_ENGINE=lightgbm PRELOAD_APP=0 MODEL_MMAP=0 python scripts/benchmark_memory.py
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(BASE_DIR, 'api')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def memory_kb(pid):
+    """(RSS, PSS) en Ko d'un processus"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0][:-1]] = int(parts[1])
+    return values['Rss'], values['Pss']
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+
+def wait_ready(url, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'{url}/ready', timeout=5) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError('API non prête')
+
+
+def post_predict(url, features):
+    request = urllib.request.Request(f'{url}/predict', data=json.dumps({'features': features}).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.load(response)
+
+
+def measure(n_workers, n_requests):
+    """Lance gunicorn, le sollicite, et retourne la mémoire du maître et des workers"""
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(n_workers), '--log-level', 'warning'],
+        cwd=API_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(url)
+        # Chaque worker doit avoir chargé (ou hérité) puis utilisé le modèle
+        for i in range(n_requests):
+            post_predict(url, [float(i % 7)] * 200)
+        workers = children(process.pid)
+        while len(workers) < n_workers:
+            time.sleep(0.2)
+            workers = children(process.pid)
+        for _ in range(n_requests):
+            post_predict(url, [0.5] * 200)
+        time.sleep(0.5)
+
+        return memory_kb(process.pid), [memory_kb(pid) for pid in workers]
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mémoire des workers gunicorn")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    print("=" * 78)
+    print(f"🧠 MÉMOIRE DES WORKERS (moteur: {os.environ.get('MODEL_ENGINE', 'compiled')}, "
+          f"preload: {os.environ.get('PRELOAD_APP', '1')}, mmap: {os.environ.get('MODEL_MMAP', '1')})")
+    print("=" * 78)
+    print(f"\n   {'workers':>7} {'RSS/worker':>12} {'PSS/worker':>12} {'PSS maître':>12} {'PSS total':>12}")
+
+    for n in args.workers:
+        (master_rss, master_pss), workers = measure(n, args.requests)
+        rss = sum(r for r, _ in workers) / len(workers)
+        pss = sum(p for _, p in workers) / len(workers)
+        total = master_pss + sum(p for _, p in workers)
+        print(f"   {n:>7} {rss / 1024:>9.1f} Mo {pss / 1024:>9.1f} Mo "
+              f"{master_pss / 1024:>9.1f} Mo {total / 1024:>9.1f} Mo")
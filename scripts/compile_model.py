@@ -0,0 +1,149 @@
+"""
+Script pour compiler best_model.pkl en moteur d'inférence NumPy (best_model.npz)
+
+Les fichiers générés sont utilisés par l'API avec MODEL_ENGINE=compiled:
+- best_model.npz: arbres aplatis (parité vérifiée avec LGBMClassifier.predict_proba)
+- scaler.npz: moyenne et échelle du StandardScaler
+L'API démarre alors sans pickle ni import de scikit-learn / LightGBM.
+
+best_model.npz enregistre le hash de best_model.pkl, scaler.pkl et scaler.npz
+au moment de l'export: au démarrage, l'API sert best_model.pkl si ce hash ne
+correspond plus (artefacts compilés non régénérés). retrain_final.py et
+retrain_incremental.py appellent export_compiled() après avoir écrit les .pkl.
+"""
+import os
+import sys
+import time
+import joblib
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR = os.path.join(BASE_DIR, 'models')
+sys.path.insert(0, os.path.join(BASE_DIR, 'api'))
+
+from model_bundle import files_version, load_scaler, save_scaler
+from tree_engine import CompiledForest, PARITY_TOLERANCE
+
+MODEL_PATH = os.path.join(MODELS_DIR, 'best_model.pkl')
+SCALER_PATH = os.path.join(MODELS_DIR, 'scaler.pkl')
+OUTPUT_PATH = os.path.join(MODELS_DIR, 'best_model.npz')
+SCALER_OUTPUT_PATH = os.path.join(MODELS_DIR, 'scaler.npz')
+
+
+def time_call(fn, X, repeat=200):
+    """Latence médiane (ms) d'un appel"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(X)
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000
+
+
+def replace_file(path, write):
+    """Écrit path via un fichier temporaire renommé (remplacement atomique)"""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def control_batch(n_features):
+    """
+    Lot de contrôle dans l'espace normalisé (sortie du StandardScaler), avec des
+    valeurs manquantes: NaN isolés sur 500 lignes, puis 10 lignes entièrement NaN
+    """
+    rng = np.random.default_rng(42)
+    X_check = rng.normal(size=(5000, n_features)) * 1.5
+    X_check[:500][rng.random(size=(500, n_features)) < 0.05] = np.nan
+    X_check[500:510] = np.nan
+    return X_check
+
+
+def export_compiled(model, scaler, model_path=MODEL_PATH, scaler_path=SCALER_PATH,
+                    output_path=OUTPUT_PATH, scaler_output_path=SCALER_OUTPUT_PATH):
+    """
+    Compile le modèle, vérifie la parité avec predict_proba (lot de contrôle, puis
+    scaler replié) et écrit scaler.npz puis best_model.npz, chacun remplacé
+    atomiquement (fichiers ouverts: np.savez n'ajoute pas d'extension au nom
+    temporaire). model_path et scaler_path doivent déjà contenir le modèle et le
+    scaler exportés: leur hash est enregistré dans best_model.npz.
+
+    Lève ValueError si la parité n'est pas respectée (rien n'est écrit)
+    Retourne (forêt, rapport de parité)
+    """
+    forest = CompiledForest.from_booster(model)
+    X_check = control_batch(forest.n_features)
+
+    expected = model.predict_proba(X_check)
+    got = forest.predict_proba(X_check)
+    report = {
+        'rows': len(X_check),
+        'nan_rows': int(np.isnan(X_check).any(axis=1).sum()),
+        'max_diff': float(np.abs(expected - got).max()),
+        'same_class': bool((expected.argmax(axis=1) == got.argmax(axis=1)).all()),
+    }
+    if report['max_diff'] > PARITY_TOLERANCE or not report['same_class']:
+        raise ValueError(f"parité non respectée (écart max {report['max_diff']:.2e})")
+
+    if scaler is not None:
+        # Forêt servie par l'API: scaler replié dans les seuils, NaN routés comme la moyenne
+        X_raw = scaler.inverse_transform(X_check)
+        report['folded_diff'] = float(np.abs(forest.fold_scaler(scaler.mean_, scaler.scale_).predict_proba(X_raw)
+                                             - model.predict_proba(scaler.transform(X_raw))).max())
+        if report['folded_diff'] > PARITY_TOLERANCE:
+            raise ValueError(f"parité non respectée avec le scaler replié (écart max {report['folded_diff']:.2e})")
+
+        def write_scaler(path):
+            with open(path, 'wb') as f:
+                save_scaler(scaler, f)
+
+        replace_file(scaler_output_path, write_scaler)
+        X_raw = X_raw[:100]
+        assert np.allclose(load_scaler(scaler_output_path).transform(X_raw), scaler.transform(X_raw), equal_nan=True)
+
+    def write_forest(path):
+        with open(path, 'wb') as f:
+            forest.save(f, source_version=files_version(model_path, scaler_path, scaler_output_path))
+
+    replace_file(output_path, write_forest)
+    reloaded = CompiledForest.load(output_path)
+    assert np.array_equal(reloaded.predict_proba(X_check[:100]), got[:100])
+    return forest, report
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("⚙️  COMPILATION DU MODÈLE EN TABLEAUX NUMPY")
+    print("=" * 60)
+
+    model = joblib.load(MODEL_PATH)
+    scaler = joblib.load(SCALER_PATH) if os.path.exists(SCALER_PATH) else None
+    try:
+        forest, report = export_compiled(model, scaler)
+    except ValueError as e:
+        print(f"\n❌ {e}, fichiers non sauvegardés")
+        sys.exit(1)
+    print(f"\n🌲 {forest.n_estimators} arbres, {forest.n_nodes:,} noeuds, profondeur max {forest.max_depth}")
+
+    print(f"\n🔍 Parité sur {report['rows']:,} lignes (dont {report['nan_rows']} avec NaN):")
+    print(f"   Écart max des probabilités: {report['max_diff']:.2e} (tolérance: {PARITY_TOLERANCE:.0e})")
+    print(f"   Classes identiques: {'oui' if report['same_class'] else 'NON'}")
+    if scaler is not None:
+        print(f"\n📐 Scaler exporté: {SCALER_OUTPUT_PATH}")
+        print(f"   Parité avec le scaler replié: écart max {report['folded_diff']:.2e}")
+
+    X_check = control_batch(forest.n_features)
+
+    print("\n⏱️  Latence médiane (1 ligne):")
+    print(f"   LightGBM predict_proba: {time_call(model.predict_proba, X_check[:1]):.3f} ms")
+    print(f"   Moteur compilé:         {time_call(forest.predict_proba, X_check[:1]):.3f} ms")
+    print("⏱️  Latence médiane (1000 lignes):")
+    print(f"   LightGBM predict_proba: {time_call(model.predict_proba, X_check[:1000], 20):.3f} ms")
+    print(f"   Moteur compilé:         {time_call(forest.predict_proba, X_check[:1000], 20):.3f} ms")
+
+    print("\n💾 Taille des artefacts:")
+    print(f"   best_model.pkl: {os.path.getsize(MODEL_PATH) / 1024:.0f} Ko")
+    print(f"   best_model.npz: {os.path.getsize(OUTPUT_PATH) / 1024:.0f} Ko")
+    if os.path.exists(SCALER_OUTPUT_PATH):
+        print(f"   scaler.npz:     {os.path.getsize(SCALER_OUTPUT_PATH) / 1024:.0f} Ko")
+    print(f"\n✅ {OUTPUT_PATH}")
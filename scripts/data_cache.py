@@ -0,0 +1,194 @@
+"""
+Cache binaire des jeux de données Santander (train.csv, test.csv)
+
+Au premier chargement, le CSV est converti en tableaux .npy dans
+data/cache/<nom>-<version>/, où la version hache la taille et la date de
+modification du CSV:
+- features.npy: matrice float32 (n, 200) en ordre colonne (Fortran): chaque
+  colonne var_i est contiguë
+- target.npy:   cible int8 (train uniquement)
+- ids.npy:      ID_code
+- meta.json:    taille et date de modification du CSV source
+Les chargements suivants projettent ces fichiers en mémoire (np.load avec
+mmap_mode): quasi instantanés, et les pages sont partagées entre processus.
+Le cache est reconstruit dès que la taille ou la date du CSV change.
+
+Plusieurs processus peuvent construire le même cache en même temps: chacun
+écrit dans son répertoire temporaire, renommé en data/cache/<nom>-<version>
+(renommage atomique). Si un autre l'a publié entre-temps, le sien est jeté.
+Un répertoire publié n'est jamais réécrit. Les versions précédentes sont
+supprimées, et un fichier déjà projeté reste lisible jusqu'à sa fermeture.
+
+Usage dans les scripts et notebooks:
+    from data_cache import load_dataset, load_frame
+    data = load_dataset('train')      # data.X, data.target, data.ids
+    train = load_frame('train')       # DataFrame ID_code, target, var_0 ... var_199
+
+Construction du cache et comparaison avec pd.read_csv:
+    python scripts/data_cache.py [--datasets train test]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+
+N_FEATURES = 200
+FEATURE_NAMES = [f'var_{i}' for i in range(N_FEATURES)]
+CACHE_FORMAT_VERSION = 1
+
+Dataset = namedtuple('Dataset', ['X', 'target', 'ids', 'feature_names'])
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {'source_size': stat.st_size, 'source_mtime': stat.st_mtime,
+            'format_version': CACHE_FORMAT_VERSION}
+
+
+def cache_dir(name, data_dir=DATA_DIR, signature=None):
+    """Répertoire du cache de <name>.csv pour sa signature (actuelle par défaut)"""
+    if signature is None:
+        signature = source_signature(os.path.join(data_dir, f'{name}.csv'))
+    version = hashlib.sha256(json.dumps(signature, sort_keys=True).encode()).hexdigest()[:12]
+    return os.path.join(data_dir, 'cache', f'{name}-{version}')
+
+
+def cache_is_fresh(name, data_dir=DATA_DIR):
+    """Vrai si le cache de la version actuelle du CSV source est publié"""
+    return os.path.exists(os.path.join(cache_dir(name, data_dir), 'meta.json'))
+
+
+def prune_versions(name, data_dir, keep):
+    """Supprime les caches de <name> autres que keep (et le répertoire data/cache/<name> d'avant les versions)"""
+    root = os.path.join(data_dir, 'cache')
+    for entry in os.listdir(root):
+        if entry != keep and (entry == name or re.fullmatch(rf'{re.escape(name)}-[0-9a-f]{{12}}', entry)):
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+def build_cache(name, data_dir=DATA_DIR):
+    """
+    Convertit <name>.csv en tableaux .npy, écrits dans un répertoire temporaire puis
+    publiés par renommage atomique (sans effet si un autre processus l'a déjà fait)
+    Retourne le répertoire du cache
+    """
+    source = os.path.join(data_dir, f'{name}.csv')
+    signature = source_signature(source)
+    start = time.perf_counter()
+
+    frame = pd.read_csv(source, dtype={column: np.float32 for column in FEATURE_NAMES})
+    directory = cache_dir(name, data_dir, signature)
+    tmp_dir = f'{directory}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    np.save(os.path.join(tmp_dir, 'features.npy'), np.asfortranarray(frame[FEATURE_NAMES].to_numpy(np.float32)))
+    if 'target' in frame.columns:
+        np.save(os.path.join(tmp_dir, 'target.npy'), frame['target'].to_numpy(np.int8))
+    if 'ID_code' in frame.columns:
+        np.save(os.path.join(tmp_dir, 'ids.npy'), frame['ID_code'].to_numpy(dtype=str))
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(dict(signature, n_rows=len(frame), created_at=time.strftime('%Y-%m-%dT%H:%M:%S')), f, indent=2)
+
+    try:
+        os.rename(tmp_dir, directory)
+    except OSError:
+        # Publié par un autre processus entre-temps (même signature, même contenu)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    prune_versions(name, data_dir, keep=os.path.basename(directory))
+    print(f"💾 Cache {name}: {len(frame):,} lignes converties en {time.perf_counter() - start:.1f} s ({directory})")
+    return directory
+
+
+def load_dataset(name='train', data_dir=DATA_DIR, mmap_mode='r'):
+    """
+    Charge un jeu de données depuis le cache (construit ou reconstruit si besoin)
+    X est projeté en mémoire en lecture seule (mmap_mode=None pour une copie en RAM)
+    """
+    directory = cache_dir(name, data_dir)
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        directory = build_cache(name, data_dir)
+
+    def optional(filename):
+        path = os.path.join(directory, filename)
+        return np.load(path, mmap_mode=mmap_mode) if os.path.exists(path) else None
+
+    return Dataset(X=np.load(os.path.join(directory, 'features.npy'), mmap_mode=mmap_mode),
+                   target=optional('target.npy'), ids=optional('ids.npy'), feature_names=list(FEATURE_NAMES))
+
+
+def load_frame(name='train', data_dir=DATA_DIR):
+    """DataFrame équivalent à pd.read_csv('<name>.csv'), features en float32 (sans copie de la matrice)"""
+    data = load_dataset(name, data_dir)
+    frame = pd.DataFrame(data.X, columns=data.feature_names, copy=False)
+    if data.target is not None:
+        frame.insert(0, 'target', data.target)
+    if data.ids is not None:
+        frame.insert(0, 'ID_code', data.ids)
+    return frame
+
+
+BENCH_SNIPPET = """
+import sys, time
+sys.path.insert(0, {scripts_dir!r})
+start = time.perf_counter()
+import pandas as pd
+from data_cache import load_frame
+
+def peak_rss_kb():
+    # VmHWM est propre au processus (ru_maxrss hérite du pic du parent)
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmHWM'))
+
+rss0 = peak_rss_kb()
+if {mode!r} == 'csv':
+    frame = pd.read_csv({source!r})
+else:
+    frame = load_frame({name!r}, {data_dir!r})
+means = frame[[f'var_{{i}}' for i in range(200)]].mean()
+elapsed = time.perf_counter() - start
+print(elapsed, (peak_rss_kb() - rss0) / 1024,
+      frame.memory_usage(deep=True).sum() / 2**20)
+"""
+
+
+def bench_load(name, data_dir, mode):
+    """Chargement + moyenne de chaque colonne dans un interpréteur neuf: (s, pic RSS ajouté en Mo, DataFrame en Mo)"""
+    code = BENCH_SNIPPET.format(scripts_dir=os.path.dirname(os.path.abspath(__file__)), mode=mode, name=name,
+                                data_dir=data_dir, source=os.path.join(data_dir, f'{name}.csv'))
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return [float(value) for value in output.stdout.split()[-3:]]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cache binaire des jeux de données")
+    parser.add_argument('--datasets', nargs='+', default=['train', 'test'])
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("💾 CACHE BINAIRE DES DONNÉES")
+    print("=" * 70)
+
+    for name in args.datasets:
+        if not os.path.exists(os.path.join(args.data_dir, f'{name}.csv')):
+            print(f"\n⚠️ {name}.csv non trouvé")
+            continue
+        print(f"\n📊 {name}")
+        if not cache_is_fresh(name, args.data_dir):
+            build_cache(name, args.data_dir)
+        for mode, label in (('csv', 'pd.read_csv (float64)'), ('cache', 'load_frame (mmap float32)')):
+            seconds, rss_mb, frame_mb = bench_load(name, args.data_dir, mode)
+            print(f"   {label:28} {seconds:6.2f} s   pic RSS +{rss_mb:7.1f} Mo   DataFrame {frame_mb:7.1f} Mo")
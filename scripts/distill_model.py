@@ -0,0 +1,223 @@
+"""
+Distillation du modèle servi en un petit modèle rapide (tier « fast » de l'API)
+
+Le modèle complet (best_model.pkl, le « professeur ») sert la décision
+finale. Pour le retour instantané du questionnaire, on entraîne un
+« élève » beaucoup plus petit: quelques arbres peu profonds ajustés sur les
+probabilités du professeur (objectif cross_entropy de LightGBM, étiquettes
+continues) sur les lignes d'entraînement du split de retrain_final.py.
+Avec --max-depth 1, chaque arbre est une souche: l'élève devient un modèle
+additif par feature.
+
+L'élève est entraîné directement sur les features brutes (les arbres sont
+insensibles à la normalisation): fast_model.npz se passe de scaler.
+L'arrêt précoce surveille l'écart aux probabilités du professeur sur la
+validation du split.
+
+Fichiers écrits (remplacement atomique):
+- models/fast_model.npz: forêt compilée (tree_engine.CompiledForest)
+- models/fast_model.json: AUC de l'élève et du professeur sur la validation,
+  écart de parité (probabilités et points de score), accord des décisions
+  aux seuils recommandés, latences, et hash du professeur. L'API n'active
+  pas le tier fast si best_model.pkl ne correspond plus à ce hash (modèle
+  réentraîné depuis): relancer ce script après retrain_final.py ou
+  retrain_incremental.py.
+
+Usage:
+    python scripts/distill_model.py [--trees 60] [--num-leaves 8] [--max-depth 3]
+    python scripts/distill_model.py --max-depth 1 --trees 200   # modèle additif par feature
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import joblib
+import lightgbm as lgb
+import numpy as np
+from sklearn.metrics import roc_auc_score
+
+from compile_model import time_call
+from feature_impact import probability_to_score
+from pipeline import file_digest
+from retrain_final import BASE_DIR, MODELS_DIR, load_data, pipeline
+from retrain_incremental import MODEL_PATH, SCALER_PATH, METADATA_PATH, replace_file
+
+sys.path.insert(0, os.path.join(BASE_DIR, 'api'))
+from model_bundle import files_version
+from tree_engine import CompiledForest
+
+FAST_MODEL_PATH = os.path.join(MODELS_DIR, 'fast_model.npz')
+FAST_METADATA_PATH = os.path.join(MODELS_DIR, 'fast_model.json')
+
+
+def parity_report(p_student, p_teacher, p_min, p_max, thresholds):
+    """Écart élève / professeur: probabilités, points de score et accord des décisions"""
+    diff = np.abs(p_student - p_teacher)
+    score_student = probability_to_score(p_student, p_min, p_max)
+    score_teacher = probability_to_score(p_teacher, p_min, p_max)
+    points = np.abs(score_student - score_teacher)
+    return {
+        'max_abs_diff': float(diff.max()),
+        'mean_abs_diff': float(diff.mean()),
+        'p99_abs_diff': float(np.percentile(diff, 99)),
+        'max_score_points': float(points.max()),
+        'mean_score_points': float(points.mean()),
+        'p99_score_points': float(np.percentile(points, 99)),
+        'decision_agreement': {name: float(((score_student >= threshold) == (score_teacher >= threshold)).mean())
+                               for name, threshold in thresholds.items()},
+    }
+
+
+def main(args):
+    teacher = joblib.load(MODEL_PATH)
+    scaler = joblib.load(SCALER_PATH)
+    with open(METADATA_PATH, 'r') as f:
+        metadata = json.load(f)
+    transform = metadata['scoring_transform']
+    p_min, p_max = transform['p_min'], transform['p_max']
+    thresholds = metadata.get('recommended_thresholds', {'normal': 50})
+    print(f"\n👩‍🏫 Professeur: {teacher.booster_.current_iteration()} arbres "
+          f"(version {files_version(MODEL_PATH, SCALER_PATH)})")
+
+    # ========================================================================
+    # Probabilités du professeur sur le split de retrain_final.py
+    # ========================================================================
+    split = pipeline.run('split')
+    _, X, y = load_data()
+    X_train = X.iloc[split['train_index']].to_numpy(np.float64)
+    X_val = X.iloc[split['val_index']].to_numpy(np.float64)
+    y_val = y.iloc[split['val_index']].to_numpy()
+
+    start = time.perf_counter()
+    p_teacher_train = teacher.predict_proba(scaler.transform(X_train))[:, 1]
+    p_teacher_val = teacher.predict_proba(scaler.transform(X_val))[:, 1]
+    print(f"   Probabilités du professeur: {len(X_train) + len(X_val):,} lignes en "
+          f"{time.perf_counter() - start:.1f} s")
+
+    # ========================================================================
+    # Élève: quelques arbres peu profonds sur les probabilités du professeur
+    # ========================================================================
+    params = {
+        'objective': 'cross_entropy',
+        'metric': 'cross_entropy',
+        'num_leaves': args.num_leaves,
+        'max_depth': args.max_depth,
+        'learning_rate': args.learning_rate,
+        'min_child_samples': args.min_child_samples,
+        'seed': args.seed,
+        'verbose': -1,
+    }
+    train_set = lgb.Dataset(X_train, label=p_teacher_train)
+    valid_set = lgb.Dataset(X_val, label=p_teacher_val, reference=train_set)
+    evals_result = {}
+    callbacks = [lgb.record_evaluation(evals_result)]
+    if args.early_stopping_rounds:
+        callbacks.append(lgb.early_stopping(args.early_stopping_rounds, verbose=False))
+
+    print(f"\n🎓 Élève: au plus {args.trees} arbres, {args.num_leaves} feuilles, profondeur {args.max_depth}...")
+    start = time.perf_counter()
+    booster = lgb.train(params, train_set, num_boost_round=args.trees, valid_sets=[valid_set],
+                        valid_names=['valid'], callbacks=callbacks)
+    train_seconds = time.perf_counter() - start
+    n_trained = len(evals_result['valid']['cross_entropy'])
+    best_iteration = booster.best_iteration if booster.best_iteration > 0 else n_trained
+    booster = lgb.Booster(model_str=booster.model_to_string(num_iteration=best_iteration))
+    student = CompiledForest.from_booster(booster)
+    print(f"   {student.n_estimators} arbres ({n_trained} essayés, {train_seconds:.1f} s), "
+          f"{student.n_nodes:,} noeuds, profondeur max {student.max_depth}")
+
+    # ========================================================================
+    # AUC, parité avec le professeur et latence
+    # ========================================================================
+    p_student_val = student.predict_proba(X_val)[:, 1]
+    teacher_auc = roc_auc_score(y_val, p_teacher_val)
+    student_auc = roc_auc_score(y_val, p_student_val)
+    parity = parity_report(p_student_val, p_teacher_val, p_min, p_max, thresholds)
+
+    # Latence à moteur égal: professeur compilé (scaler replié) contre élève
+    teacher_forest = CompiledForest.from_booster(teacher).fold_scaler(scaler.mean_, scaler.scale_)
+    latency = {
+        'teacher_ms': float(time_call(teacher_forest.predict_proba, X_val[:1])),
+        'student_ms': float(time_call(student.predict_proba, X_val[:1])),
+    }
+
+    print(f"\n🧪 Validation ({len(y_val):,} lignes):")
+    print(f"   AUC professeur: {teacher_auc:.4f} | élève: {student_auc:.4f} "
+          f"(perte tolérée: {args.max_auc_drop})")
+    print(f"   Écart des probabilités: max {parity['max_abs_diff']:.4f}, "
+          f"moyen {parity['mean_abs_diff']:.4f}, p99 {parity['p99_abs_diff']:.4f}")
+    print(f"   Écart de score: max {parity['max_score_points']:.1f} pts, "
+          f"moyen {parity['mean_score_points']:.2f} pts, p99 {parity['p99_score_points']:.1f} pts")
+    for name, agreement in parity['decision_agreement'].items():
+        print(f"   Décisions identiques au seuil {name} ({thresholds[name]}): {agreement * 100:.2f}%")
+    print(f"⏱️  Latence médiane (1 ligne): professeur {latency['teacher_ms']:.3f} ms, "
+          f"élève {latency['student_ms']:.3f} ms")
+
+    if student_auc < teacher_auc - args.max_auc_drop:
+        raise SystemExit(f"❌ L'élève perd {teacher_auc - student_auc:.4f} d'AUC: fast_model.npz non écrit")
+
+    # ========================================================================
+    # Sauvegarde (remplacements atomiques)
+    # ========================================================================
+    def write_forest(path):
+        # Fichier ouvert: np.savez n'ajoute pas d'extension au nom temporaire
+        with open(path, 'wb') as f:
+            student.save(f)
+
+    fast_metadata = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'tier': 'fast',
+        'input': 'raw_features',
+        'objective': 'cross_entropy',
+        'n_estimators': student.n_estimators,
+        'max_depth': student.max_depth,
+        'n_nodes': student.n_nodes,
+        'params': {name: params[name] for name in ('num_leaves', 'max_depth', 'learning_rate', 'min_child_samples')},
+        'training': {
+            'rows': len(X_train),
+            'best_iteration': int(best_iteration),
+            'iterations_trained': n_trained,
+            'max_iterations': args.trees,
+            'train_seconds': round(train_seconds, 3),
+        },
+        'teacher': {
+            'model_sha256': file_digest(MODEL_PATH),
+            'model_version': files_version(MODEL_PATH, SCALER_PATH),
+            'n_estimators': teacher.booster_.current_iteration(),
+            'auc': float(teacher_auc),
+        },
+        'validation_rows': len(y_val),
+        'auc': float(student_auc),
+        'parity': parity,
+        'latency': latency,
+    }
+
+    def write_metadata(path):
+        with open(path, 'w') as f:
+            json.dump(fast_metadata, f, indent=2)
+
+    replace_file(FAST_MODEL_PATH, write_forest)
+    print(f"\n   ✅ {FAST_MODEL_PATH} ({os.path.getsize(FAST_MODEL_PATH) / 1024:.0f} Ko)")
+    replace_file(FAST_METADATA_PATH, write_metadata)
+    print(f"   ✅ {FAST_METADATA_PATH}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Distillation du modèle servi en un petit modèle rapide")
+    parser.add_argument('--trees', type=int, default=60, help="Arbres de l'élève au plus")
+    parser.add_argument('--num-leaves', type=int, default=8)
+    parser.add_argument('--max-depth', type=int, default=3, help="1: modèle additif par feature (souches)")
+    parser.add_argument('--learning-rate', type=float, default=0.1)
+    parser.add_argument('--min-child-samples', type=int, default=100)
+    parser.add_argument('--early-stopping-rounds', type=int, default=20)
+    parser.add_argument('--max-auc-drop', type=float, default=0.05,
+                        help="Perte d'AUC tolérée par rapport au professeur")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("🎓 DISTILLATION DU MODÈLE RAPIDE")
+    print("=" * 70)
+    main(args)
@@ -0,0 +1,121 @@
+"""
+Impact des features sur le score, calculé en un seul appel au modèle
+
+Pour chaque feature et chaque quantile demandé, le profil de base est copié
+avec la feature remplacée par la valeur du quantile. Les n_features x
+n_quantiles profils sont empilés dans une seule matrice, normalisés et
+scorés en un seul predict_proba. On obtient pour chaque feature:
+- sa courbe de dépendance partielle (score aux différents quantiles)
+- son impact en points entre le quantile bas et le quantile haut (p10 / p90)
+- sa direction ('higher' si le score monte avec la valeur)
+
+Usage:
+    from feature_impact import feature_impacts, score_profiles
+    impacts = feature_impacts(model, scaler, X, p_min, p_max)
+    impacts.impact_points      # (200,)
+    impacts.curve(166)         # valeurs et scores de var_166
+    scores, probabilities = score_profiles(model, scaler, profiles, p_min, p_max)
+"""
+import numpy as np
+
+DEFAULT_QUANTILES = (0.05, 0.10, 0.25, 0.50, 0.75, 0.90, 0.95)
+
+
+def probability_to_score(probabilities, p_min, p_max):
+    """Transforme des probabilités en score 0-100"""
+    clipped = np.clip(probabilities, p_min, p_max)
+    return (clipped - p_min) / (p_max - p_min) * 100
+
+
+def score_profiles(model, scaler, profiles, p_min, p_max):
+    """(scores, probabilités) d'une matrice de profils, en un seul appel au modèle"""
+    profiles = np.atleast_2d(np.asarray(profiles, dtype=np.float64))
+    probabilities = model.predict_proba(scaler.transform(profiles))[:, 1]
+    return probability_to_score(probabilities, p_min, p_max), probabilities
+
+
+def perturbation_matrix(base_profile, values, features):
+    """
+    Profils empilés: bloc k = base_profile avec la feature features[k] prise à
+    chacune des valeurs values[:, features[k]]. Forme (len(features) * n_valeurs, n_features)
+    """
+    base_profile = np.asarray(base_profile, dtype=np.float64)
+    n_values = values.shape[0]
+    features = np.asarray(features)
+
+    profiles = np.tile(base_profile, (len(features) * n_values, 1))
+    rows = np.arange(len(features) * n_values)
+    columns = np.repeat(features, n_values)
+    profiles[rows, columns] = values[:, features].T.ravel()
+    return profiles
+
+
+class FeatureImpacts:
+    """Courbes de dépendance partielle et impacts (tableaux (n_quantiles, n_features))"""
+
+    def __init__(self, quantiles, values, probabilities, p_min, p_max, base_probability, low, high):
+        self.quantiles = np.asarray(quantiles)
+        self.values = values
+        self.probabilities = probabilities
+        self.scores = probability_to_score(probabilities, p_min, p_max)
+        self.base_probability = base_probability
+        self.base_score = float(probability_to_score(base_probability, p_min, p_max))
+        self.low_index = int(np.flatnonzero(np.isclose(self.quantiles, low))[0])
+        self.high_index = int(np.flatnonzero(np.isclose(self.quantiles, high))[0])
+
+    @property
+    def impact_points(self):
+        """Écart de score entre le quantile bas et le quantile haut, par feature"""
+        return np.abs(self.scores[self.high_index] - self.scores[self.low_index])
+
+    @property
+    def direction(self):
+        """'higher' si la probabilité au quantile haut dépasse celle au quantile bas"""
+        rising = self.probabilities[self.high_index] > self.probabilities[self.low_index]
+        return np.where(rising, 'higher', 'lower')
+
+    def curve(self, var_index):
+        """Courbe de dépendance partielle d'une feature"""
+        return {
+            'quantiles': self.quantiles.tolist(),
+            'values': self.values[:, var_index].tolist(),
+            'scores': self.scores[:, var_index].tolist(),
+        }
+
+    def to_records(self, feature_names=None):
+        """Une entrée JSON par feature, triées par impact décroissant"""
+        n_features = self.values.shape[1]
+        names = feature_names or [f'var_{i}' for i in range(n_features)]
+        impact_points = self.impact_points
+        direction = self.direction
+        records = [{
+            'feature': names[i],
+            'var_index': i,
+            'impact_points': float(impact_points[i]),
+            'direction': str(direction[i]),
+            'curve': self.curve(i),
+        } for i in range(n_features)]
+        return sorted(records, key=lambda record: record['impact_points'], reverse=True)
+
+
+def feature_impacts(model, scaler, X, p_min, p_max, base_profile=None, quantiles=DEFAULT_QUANTILES,
+                    low=0.10, high=0.90):
+    """
+    Impacts de toutes les features de X en un seul predict_proba
+    base_profile: profil de référence (par défaut la moyenne de X)
+    Les quantiles low et high (impact en points) sont ajoutés s'ils manquent
+    """
+    X = np.asarray(X)
+    quantiles = np.array(sorted(set(quantiles) | {low, high}))
+    if base_profile is None:
+        base_profile = X.mean(axis=0)
+
+    values = np.quantile(X, quantiles, axis=0)
+    n_features = X.shape[1]
+    profiles = perturbation_matrix(base_profile, values, np.arange(n_features))
+
+    # Le profil de base est scoré dans le même appel (dernière ligne)
+    _, probabilities = score_profiles(model, scaler, np.vstack([profiles, base_profile]), p_min, p_max)
+    grid = probabilities[:-1].reshape(n_features, len(quantiles)).T
+
+    return FeatureImpacts(quantiles, values, grid, p_min, p_max, float(probabilities[-1]), low, high)
@@ -0,0 +1,138 @@
+"""
+Entraînement LightGBM avec arrêt précoce, et Datasets binnés persistés
+
+train_early_stopping() entraîne un LGBMClassifier (fit avec eval_set) en
+surveillant l'AUC de validation. Il s'arrête quand elle ne progresse plus
+depuis early_stopping_rounds itérations; le Booster du modèle est alors
+tronqué à la meilleure itération par LightGBM. L'API et les scripts gardent
+predict_proba, booster_ et feature_importances_. C'est l'étape fit de
+retrain_final.py et retrain_incremental.py. Elle entraîne sur les tableaux
+normalisés: LGBMClassifier.fit n'accepte pas de Dataset LightGBM, et son
+résultat est déjà mis en cache par le pipeline (data/cache/stages/fit).
+
+Avant d'entraîner, LightGBM discrétise chaque feature en histogrammes
+(max_bin classes): 160k x 200 valeurs à trier et découper. binned_datasets()
+construit une fois les Datasets d'entraînement et de validation, puis les
+sauvegarde au format binaire de LightGBM dans <cache_dir>/<clé>/
+(train.bin, valid.bin). La clé hache les paramètres de discrétisation, la
+version de LightGBM et ce que fournit l'appelant (signature du CSV, indices
+du split, scaler...). Tant qu'elle ne change pas, les relances rechargent les
+fichiers binaires sans relire ni normaliser les données. tune_lgbm.py, qui
+entraîne des centaines de modèles par lgb.train sur les mêmes lignes, s'en
+sert pour ses plis.
+
+Usage:
+    from lgbm_training import train_early_stopping
+    model, training_info = train_early_stopping(params, X_train, y_train, X_val, y_val, early_stopping_rounds=50)
+
+    from lgbm_training import binned_datasets
+    train_set, valid_set, dataset_info = binned_datasets(cache_dir, key_parts, params, make_arrays)
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import lightgbm as lgb
+from lightgbm import LGBMClassifier
+
+# Paramètres (noms LGBMClassifier) utilisés par LightGBM pour construire les histogrammes
+DATASET_PARAM_NAMES = ('max_bin', 'min_data_in_bin', 'bin_construct_sample_cnt', 'min_child_samples',
+                       'feature_pre_filter', 'random_state')
+
+
+def dataset_params(params):
+    """Sous-ensemble des paramètres qui détermine le Dataset binné"""
+    selected = {name: params[name] for name in DATASET_PARAM_NAMES if name in params}
+    selected['verbose'] = -1
+    return selected
+
+
+def dataset_key(key_parts, params):
+    """Clé du Dataset binné (hash des entrées fournies et des paramètres de discrétisation)"""
+    description = {'key_parts': key_parts, 'dataset_params': dataset_params(params), 'lightgbm': lgb.__version__}
+    encoded = json.dumps(description, sort_keys=True, default=repr).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def binned_datasets(cache_dir, key_parts, params, make_arrays):
+    """
+    Datasets LightGBM (entraînement, validation) chargés depuis leur forme binaire
+    make_arrays: fonction () -> (X_train, y_train, X_val, y_val), appelée seulement si le
+                 cache est absent
+    Retourne (train_set, valid_set, infos)
+    """
+    key = dataset_key(key_parts, params)
+    directory = os.path.join(cache_dir, key)
+    train_path = os.path.join(directory, 'train.bin')
+    valid_path = os.path.join(directory, 'valid.bin')
+    start = time.perf_counter()
+
+    cached = os.path.exists(train_path) and os.path.exists(valid_path)
+    if not cached:
+        X_train, y_train, X_val, y_val = make_arrays()
+        train_set = lgb.Dataset(X_train, label=y_train, params=dataset_params(params))
+        # Même découpage en classes que l'entraînement (reference)
+        valid_set = lgb.Dataset(X_val, label=y_val, reference=train_set, params=dataset_params(params))
+
+        tmp_dir = f'{directory}.{os.getpid()}.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        train_set.save_binary(os.path.join(tmp_dir, 'train.bin'))
+        valid_set.save_binary(os.path.join(tmp_dir, 'valid.bin'))
+        try:
+            os.rename(tmp_dir, directory)
+        except OSError:
+            # Publié par un autre processus entre-temps (même clé, même contenu): jamais réécrit
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # Toujours rechargé depuis les fichiers binaires: premier run et relances entraînent à l'identique
+    train_set = lgb.Dataset(train_path, params=dataset_params(params))
+    valid_set = lgb.Dataset(valid_path, reference=train_set, params=dataset_params(params))
+    train_set.construct()
+    valid_set.construct()
+
+    info = {'key': key, 'path': directory, 'cached': cached, 'seconds': time.perf_counter() - start,
+            'n_train': train_set.num_data(), 'n_valid': valid_set.num_data()}
+    return train_set, valid_set, info
+
+
+def train_early_stopping(params, X_train, y_train, X_val, y_val, early_stopping_rounds=50, log_period=100,
+                         init_model=None):
+    """
+    Entraîne au plus params['n_estimators'] arbres en surveillant l'AUC de validation
+    early_stopping_rounds: patience (None ou 0: tous les arbres)
+    init_model: Booster dont l'entraînement est poursuivi (ses arbres sont gardés, au plus
+                params['n_estimators'] arbres ajoutés)
+    Retourne (LGBMClassifier tronqué à la meilleure itération, infos d'entraînement)
+    """
+    init_iterations = init_model.current_iteration() if init_model is not None else 0
+    callbacks = []
+    if log_period:
+        callbacks.append(lgb.log_evaluation(log_period))
+    if early_stopping_rounds:
+        callbacks.append(lgb.early_stopping(early_stopping_rounds, first_metric_only=True, verbose=False))
+
+    model = LGBMClassifier(**params)
+    start = time.perf_counter()
+    model.fit(X_train, y_train, eval_set=[(X_val, y_val)], eval_names=['valid'], eval_metric='auc',
+              init_model=init_model, callbacks=callbacks)
+    seconds = time.perf_counter() - start
+
+    # Après un arrêt précoce, LightGBM ne garde que les arbres jusqu'à la meilleure
+    # itération: les itérations effectuées se comptent dans l'historique d'évaluation
+    valid_auc = model.evals_result_['valid']['auc']
+    n_trained = init_iterations + len(valid_auc)
+    best_iteration = model.booster_.current_iteration()
+
+    info = {
+        'best_iteration': int(best_iteration),
+        'iterations_trained': int(n_trained),
+        'max_iterations': int(init_iterations + params['n_estimators']),
+        'early_stopping_rounds': early_stopping_rounds or None,
+        'stopped_early': n_trained < init_iterations + params['n_estimators'],
+        'valid_auc': float(valid_auc[best_iteration - init_iterations - 1]),
+        'train_seconds': round(seconds, 3),
+    }
+    return model, info
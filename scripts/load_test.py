@@ -0,0 +1,147 @@
+"""
+Test de charge: API Flask (gunicorn, workers synchrones) contre API ASGI
+(uvicorn, inférence dans un pool de threads), sur les mêmes cœurs
+
+Chaque serveur est lancé avec le même nombre de workers et épinglé sur les
+mêmes cœurs (os.sched_setaffinity). Le client ouvre `--concurrency`
+connexions simultanées pendant `--duration` secondes et mesure le débit et
+les latences p50 / p99. Les lignes envoyées sont toutes différentes: le
+cache de prédictions ne sert aucune réponse.
+
+Usage:
+    python scripts/load_test.py [--cores 0] [--concurrency 16] [--duration 10]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(BASE_DIR, 'api')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_command(kind, port, workers):
+    if kind == 'flask':
+        return [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+                '--workers', str(workers), '--log-level', 'warning']
+    return [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--port', str(port),
+            '--workers', str(workers), '--log-level', 'warning', '--no-access-log']
+
+
+def request(port, method, path, body=None):
+    """Une requête sur une connexion neuve (les workers gunicorn synchrones ferment la connexion)"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def wait_ready(port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if request(port, 'GET', '/ready') == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError('API non prête')
+
+
+def run_load(port, path, bodies, concurrency, duration):
+    """Débit (req/s) et latences (s) de `concurrency` clients pendant `duration` secondes"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(offset):
+        local = []
+        i = offset
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            status = request(port, 'POST', path, bodies[i % len(bodies)])
+            local.append(time.perf_counter() - start)
+            if status != 200:
+                with lock:
+                    errors[0] += 1
+            i += concurrency
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, np.array(latencies), errors[0]
+
+
+def bench_server(kind, args, scenarios):
+    port = free_port()
+    env = dict(os.environ, PREDICTION_CACHE_SIZE='0')
+    cores = set(args.cores)
+    process = subprocess.Popen(server_command(kind, port, len(cores)), cwd=API_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               preexec_fn=lambda: os.sched_setaffinity(0, cores))
+    try:
+        wait_ready(port)
+        results = {}
+        for label, path, bodies in scenarios:
+            run_load(port, path, bodies, args.concurrency, min(2.0, args.duration))  # échauffement
+            results[label] = run_load(port, path, bodies, args.concurrency, args.duration)
+        return results
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Test de charge Flask / ASGI")
+    parser.add_argument('--cores', type=int, nargs='+', default=sorted(os.sched_getaffinity(0))[:1],
+                        help="Cœurs attribués au serveur (un worker par cœur)")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    rows = rng.normal(size=(2000, 200)) * 5 + 10
+    scenarios = [
+        ('/predict', '/predict',
+         [json.dumps({'features': row}).encode() for row in rows.tolist()]),
+        (f'/predict_batch ({args.batch_size} lignes)', '/predict_batch',
+         [json.dumps({'features': rows[i:i + args.batch_size].tolist()}).encode()
+          for i in range(0, len(rows), args.batch_size)]),
+    ]
+
+    print("=" * 78)
+    print(f"🏋️  TEST DE CHARGE (cœurs: {args.cores}, {args.concurrency} clients, {args.duration:g} s, "
+          f"threads d'inférence ASGI: {os.environ.get('ASGI_INFERENCE_THREADS', 4)})")
+    print("=" * 78)
+
+    for kind, label in (('flask', 'Flask + gunicorn (sync)'), ('asgi', 'ASGI + uvicorn')):
+        print(f"\n   {label}")
+        for scenario, (throughput, latencies, errors) in bench_server(kind, args, scenarios).items():
+            print(f"   {scenario:28} {throughput:8.1f} req/s   p50={np.percentile(latencies, 50) * 1000:7.1f} ms   "
+                  f"p99={np.percentile(latencies, 99) * 1000:7.1f} ms   erreurs={errors}")
@@ -1,24 +1,50 @@
 """
 Script pour générer les valeurs par défaut optimisées
 qui donnent un score de base autour de 50-60/100
+
+Part des moyennes des profils acceptés et cherche (voir profile_search.py)
+le profil le plus proche dont le score tombe dans la plage cible, en ne
+modifiant que les features du questionnaire (ou celles de --features),
+dans les bornes p5-p95 des acceptés. Chaque étape score une population
+entière de candidats en un seul predict_proba.
+
+Usage:
+    python scripts/optimize_defaults.py [--target 50 60] [--features 166 12 ... | all]
+                                        [--population 256] [--max-steps 200]
 """
+import argparse
 import pandas as pd
 import numpy as np
 import joblib
 import json
 import os
+import warnings
+from data_cache import load_frame
+from feature_impact import score_profiles
+from profile_search import search_profile
+warnings.filterwarnings('ignore')
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 MODELS_DIR = os.path.join(BASE_DIR, 'models')
 
+parser = argparse.ArgumentParser(description="Valeurs par défaut optimisées")
+parser.add_argument('--target', type=float, nargs=2, default=[50.0, 60.0], metavar=('MIN', 'MAX'),
+                    help="Plage de score visée")
+parser.add_argument('--features', nargs='+',
+                    help="Index des features modifiables, ou 'all' (défaut: celles de feature_mapping.json)")
+parser.add_argument('--population', type=int, default=256, help="Candidats évalués par étape")
+parser.add_argument('--max-steps', type=int, default=200)
+parser.add_argument('--seed', type=int, default=42)
+args = parser.parse_args()
+
 print("=" * 60)
 print("🎯 GÉNÉRATION DES VALEURS PAR DÉFAUT OPTIMISÉES")
 print("=" * 60)
 
 # Charger les données et le modèle
 print("\n📥 Chargement...")
-train = pd.read_csv(os.path.join(DATA_DIR, 'train.csv'))
+train = load_frame('train', DATA_DIR)
 model = joblib.load(os.path.join(MODELS_DIR, 'best_model.pkl'))
 scaler = joblib.load(os.path.join(MODELS_DIR, 'scaler.pkl'))
 
@@ -29,14 +55,13 @@ accepted = train[train['target'] == 1]
 p_min = 0.006125
 p_max = 0.723838
 
-def probability_to_score(prob):
-    clipped = max(min(prob, p_max), p_min)
-    return ((clipped - p_min) / (p_max - p_min)) * 100
+def get_scores(profiles):
+    """(scores, probabilités) de plusieurs profils en un seul appel au modèle"""
+    return score_profiles(model, scaler, profiles, p_min, p_max)
 
-def get_score(features):
-    scaled = scaler.transform([features])
-    prob = model.predict_proba(scaled)[0, 1]
-    return probability_to_score(prob), prob
+def raw_scores(profiles):
+    """Score sans clip aux bornes 0-100 (la recherche garde une pente hors de la plage)"""
+    return (get_scores(profiles)[1] - p_min) / (p_max - p_min) * 100
 
 # Charger le mapping des features
 with open(os.path.join(MODELS_DIR, 'feature_mapping.json'), 'r') as f:
@@ -44,47 +69,49 @@ with open(os.path.join(MODELS_DIR, 'feature_mapping.json'), 'r') as f:
 
 # Commencer avec les moyennes des acceptés
 base_features = [float(accepted[f].mean()) for f in feature_names]
-score, prob = get_score(base_features)
+
+# Bornes et échelle de chaque feature: p5-p95 et écart-type des acceptés
+lower = accepted[feature_names].quantile(0.05).to_numpy(np.float64)
+upper = accepted[feature_names].quantile(0.95).to_numpy(np.float64)
+scale = accepted[feature_names].std().to_numpy(np.float64)
+if args.features == ['all']:
+    movable = list(range(len(feature_names)))
+elif args.features:
+    movable = [int(index) for index in args.features]
+else:
+    movable = [fm['var_index'] for fm in feature_mapping]
+
+(score,), (prob,) = get_scores([base_features])
 print(f"\n📊 Score de base (moyennes acceptés): {score:.1f}/100 (prob: {prob:.2%})")
 
-# Optimiser les top 20 features vers les valeurs optimales
-optimized = base_features.copy()
+print(f"\n🔧 Recherche d'un profil dans la plage {args.target[0]:.0f}-{args.target[1]:.0f}/100 "
+      f"({len(movable)} features modifiables, {args.population} candidats par étape)...")
+result = search_profile(raw_scores, base_features, lower, upper, scale, movable,
+                        tuple(args.target), population=args.population, max_steps=args.max_steps,
+                        seed=args.seed)
 
-print("\n🔧 Optimisation des top features...")
-for fm in feature_mapping:
-    var_idx = fm['var_index']
-    direction = fm['direction']
-    
-    # Pour chaque feature, utiliser une valeur intermédiaire entre la moyenne et l'optimale
-    if direction == 'higher':
-        # Valeur plus haute = mieux -> utiliser P65 des acceptés
-        optimal_val = accepted[f'var_{var_idx}'].quantile(0.65)
-    else:
-        # Valeur plus basse = mieux -> utiliser P35 des acceptés
-        optimal_val = accepted[f'var_{var_idx}'].quantile(0.35)
-    
-    optimized[var_idx] = float(optimal_val)
-
-score_opt, prob_opt = get_score(optimized)
-print(f"📊 Score après optimisation: {score_opt:.1f}/100 (prob: {prob_opt:.2%})")
-
-# Si le score est trop haut, on modère un peu
-if score_opt > 70:
-    # Mélanger avec les moyennes pour avoir ~55-60
-    alpha = 0.5  # 50% optimisé, 50% base
-    mixed = [alpha * optimized[i] + (1-alpha) * base_features[i] for i in range(200)]
-    score_mixed, prob_mixed = get_score(mixed)
-    print(f"📊 Score mixte (50/50): {score_mixed:.1f}/100 (prob: {prob_mixed:.2%})")
-    final_features = mixed
-else:
-    final_features = optimized
+print(f"   {result.steps} étapes, {result.evaluated:,} candidats évalués en {result.seconds:.2f} s "
+      f"({result.evaluated_per_second:,.0f} candidats/s), {'convergé' if result.converged else 'non convergé'}")
+if not result.in_band:
+    print(f"   ⚠️ Plage non atteinte: meilleur score {result.score:.1f}/100")
+
+shifts = {i: (result.profile[i] - base_features[i]) / scale[i] for i in movable}
+moves = sorted(movable, key=lambda i: abs(shifts[i]), reverse=True)
+print("\n   Feature      | Défaut    | Base      | Écart (σ)")
+print("   " + "-" * 48)
+for i in moves[:10]:
+    print(f"   var_{i:<8} | {result.profile[i]:9.3f} | {base_features[i]:9.3f} | {shifts[i]:+.2f}")
+
+final_features = [float(value) for value in result.profile]
+(final_score,), (final_prob,) = get_scores([final_features])
+print(f"\n📊 Score optimisé: {final_score:.1f}/100 (prob: {final_prob:.2%})")
 
 # Génération du TypeScript
 print("\n📝 Génération du fichier TypeScript...")
 
 ts_code = f'''// ===========================================================
 // FICHIER GÉNÉRÉ AUTOMATIQUEMENT LE {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M')}
-// VALEURS PAR DÉFAUT OPTIMISÉES POUR UN SCORE DE ~{get_score(final_features)[0]:.0f}/100
+// VALEURS PAR DÉFAUT OPTIMISÉES POUR UN SCORE DE ~{final_score:.0f}/100
 // ===========================================================
 
 /**
@@ -115,7 +142,7 @@ export const SCORE_THRESHOLDS = {{
 
 /**
  * Valeurs par défaut OPTIMISÉES pour les 200 features
- * Score de départ attendu: ~{get_score(final_features)[0]:.0f}/100
+ * Score de départ attendu: ~{final_score:.0f}/100
  */
 export const DEFAULT_FEATURES: number[] = [
 '''
@@ -213,7 +240,6 @@ with open(ts_path, 'w') as f:
 print(f"   ✅ {ts_path}")
 
 # Test final
-final_score, final_prob = get_score(final_features)
 print(f"\n📊 Score final des valeurs par défaut: {final_score:.1f}/100")
 print(f"   Probabilité: {final_prob:.2%}")
 
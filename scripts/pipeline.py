@@ -0,0 +1,177 @@
+"""
+Pipeline à étapes avec cache sur disque
+
+Chaque étape déclare ses entrées (autres étapes), ses paramètres, les
+fichiers qu'elle lit et ceux qu'elle écrit, et les fonctions ou modules
+qu'elle appelle (depends). Son résultat est sauvegardé (joblib) sous une
+clé qui hache:
+- le code source de la fonction de l'étape et de ses depends
+- ses paramètres
+- les clés des étapes dont elle dépend
+- la taille et la date des fichiers lus
+Une étape dont la clé n'a pas changé (et dont les fichiers écrits sont
+intacts) n'est pas recalculée, et ses dépendances ne sont même pas
+évaluées.
+
+Le code des autres fonctions n'est pas haché: une étape qui délègue à un
+helper (ou à un module) doit le déclarer dans depends, sinon modifier ce
+helper réutilise l'ancien résultat. Un module déclaré couvre toutes ses
+fonctions.
+
+Exemple:
+    pipeline = Pipeline(cache_dir)
+
+    @pipeline.stage('fit', inputs=['split'], params={'n_estimators': 500}, depends=[split_arrays, lgbm_training])
+    def fit(split, n_estimators):
+        ...
+
+    pipeline.run()                     # tout le pipeline
+    pipeline.run('fit', force=['fit'])  # une étape (et ce qu'il lui faut), recalculée
+"""
+import hashlib
+import inspect
+import json
+import os
+import time
+from collections import namedtuple
+
+import joblib
+
+Stage = namedtuple('Stage', ['name', 'fn', 'inputs', 'params', 'files', 'outputs', 'depends', 'cache'])
+
+
+def file_digest(path):
+    """SHA-256 du contenu d'un fichier (None s'il n'existe pas)"""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dependency_name(dependency):
+    """Nom qualifié d'une fonction ou d'un module (clé de son code source dans la clé de l'étape)"""
+    if inspect.ismodule(dependency):
+        return dependency.__name__
+    return f'{dependency.__module__}.{dependency.__qualname__}'
+
+
+class Pipeline:
+    """Étapes nommées, exécutées dans l'ordre des dépendances, avec résultats en cache"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.stages = {}
+        self._keys = {}
+
+    def stage(self, name, inputs=(), params=None, files=(), outputs=(), depends=(), cache=True):
+        """
+        Décorateur: fn(*résultats des entrées, **params)
+        files: fichiers lus (clé: taille et date), outputs: fichiers écrits (vérifiés au rechargement)
+        depends: fonctions ou modules appelés par l'étape (clé: leur code source)
+        """
+        def register(fn):
+            for dependency in inputs:
+                if dependency not in self.stages:
+                    raise ValueError(f"Étape {name}: entrée inconnue {dependency}")
+            self.stages[name] = Stage(name, fn, tuple(inputs), dict(params or {}), tuple(files),
+                                      tuple(outputs), tuple(depends), cache)
+            return fn
+        return register
+
+    def key(self, name):
+        """Clé de cache d'une étape (hash de son code et de ses depends, paramètres, entrées et fichiers)"""
+        if name not in self._keys:
+            stage = self.stages[name]
+            files = {}
+            for path in stage.files:
+                stat = os.stat(path)
+                files[os.path.basename(path)] = [stat.st_size, stat.st_mtime]
+            description = {
+                'name': name,
+                'code': inspect.getsource(stage.fn),
+                'depends': {dependency_name(dependency): inspect.getsource(dependency)
+                            for dependency in stage.depends},
+                'params': stage.params,
+                'inputs': {dependency: self.key(dependency) for dependency in stage.inputs},
+                'files': files,
+            }
+            encoded = json.dumps(description, sort_keys=True, default=repr).encode()
+            self._keys[name] = hashlib.sha256(encoded).hexdigest()[:16]
+        return self._keys[name]
+
+    def cache_path(self, name):
+        return os.path.join(self.cache_dir, name, f'{self.key(name)}.joblib')
+
+    def load_cached(self, name):
+        """(True, résultat) si l'étape est en cache et ses fichiers écrits intacts, sinon (False, None)"""
+        stage = self.stages[name]
+        path = self.cache_path(name)
+        if not stage.cache or not os.path.exists(path):
+            return False, None
+        entry = joblib.load(path)
+        if any(file_digest(output) != digest for output, digest in entry['outputs'].items()):
+            return False, None
+        return True, entry['result']
+
+    def run(self, target=None, force=()):
+        """
+        Exécute target (par défaut toutes les étapes finales) et ce dont elle dépend
+        force: étapes à recalculer même si elles sont en cache
+        """
+        for name in force:
+            if name not in self.stages:
+                raise ValueError(f"Étape inconnue: {name}")
+
+        results = {}
+
+        def evaluate(name):
+            if name in results:
+                return results[name]
+            stage = self.stages[name]
+
+            if name not in force:
+                cached, result = self.load_cached(name)
+                if cached:
+                    print(f"\n♻️  [{name}] en cache ({self.key(name)})")
+                    results[name] = result
+                    return result
+
+            arguments = [evaluate(dependency) for dependency in stage.inputs]
+            print(f"\n⚙️  [{name}]")
+            start = time.perf_counter()
+            result = stage.fn(*arguments, **stage.params)
+            elapsed = time.perf_counter() - start
+            print(f"   ⏱️  [{name}] {elapsed:.1f} s")
+
+            if stage.cache:
+                path = self.cache_path(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                entry = {'result': result, 'outputs': {output: file_digest(output) for output in stage.outputs},
+                         'seconds': elapsed, 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                joblib.dump(entry, tmp_path)
+                os.replace(tmp_path, path)
+
+            results[name] = result
+            return result
+
+        if target is not None:
+            return evaluate(target)
+        used = {dependency for stage in self.stages.values() for dependency in stage.inputs}
+        for name in self.stages:
+            if name not in used:
+                evaluate(name)
+        return results
+
+    def describe(self):
+        """Étapes, clés et état du cache"""
+        print(f"\n   {'étape':14} {'clé':18} {'cache':8} entrées")
+        for name, stage in self.stages.items():
+            if not stage.cache:
+                state = 'toujours'
+            else:
+                state = 'à jour' if self.load_cached(name)[0] else 'à faire'
+            print(f"   {name:14} {self.key(name):18} {state:8} {', '.join(stage.inputs) or '-'}")
@@ -0,0 +1,100 @@
+"""
+Recherche d'un profil de features dont le score tombe dans une plage cible
+
+Méthode de l'entropie croisée (variante diagonale de CMA-ES): à chaque
+étape, une population de profils candidats est tirée autour de la moyenne
+courante, scorée en un seul appel au modèle, et les meilleurs candidats
+(élite) donnent la nouvelle moyenne et le nouvel écart-type. Seules les
+features autorisées bougent, dans leurs bornes.
+
+Objectif à minimiser (par candidat):
+    distance du score à la plage cible (0 dans la plage) * penalty
+    + déplacement quadratique moyen par rapport au profil de base (en écarts-types)
+On obtient le profil le plus proche du profil de base qui atteint la cible.
+
+Usage:
+    from profile_search import search_profile
+    result = search_profile(score_fn, base, lower, upper, scale, movable, (55, 60))
+    result.profile, result.score, result.evaluated, result.evaluated_per_second
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+SearchResult = namedtuple('SearchResult', ['profile', 'score', 'objective', 'in_band', 'steps',
+                                           'evaluated', 'seconds', 'evaluated_per_second', 'converged'])
+
+
+def band_distance(scores, band):
+    """Distance des scores à la plage [low, high] (0 à l'intérieur)"""
+    low, high = band
+    return np.maximum(low - scores, 0) + np.maximum(scores - high, 0)
+
+
+def search_profile(score_fn, base, lower, upper, scale, movable, band, population=256, elite_fraction=0.1,
+                   max_steps=200, tol=1e-3, patience=5, penalty=10.0, initial_sigma=1.0, min_sigma=1e-3,
+                   seed=42):
+    """
+    score_fn: matrice (n, n_features) -> scores (n,), appelée une fois par étape. Un score
+              non borné (sans clip à 0-100) évite les plateaux où la recherche ne voit rien
+    base: profil de départ; lower / upper: bornes des features (n_features,)
+    scale: écart-type de chaque feature (le déplacement est mesuré dans cette unité)
+    movable: index des features que la recherche peut modifier
+    band: plage de score cible (low, high)
+    """
+    rng = np.random.default_rng(seed)
+    base = np.asarray(base, dtype=np.float64)
+    movable = np.asarray(movable)
+    scale = np.asarray(scale, dtype=np.float64)[movable]
+    z_lower = (np.asarray(lower, dtype=np.float64)[movable] - base[movable]) / scale
+    z_upper = (np.asarray(upper, dtype=np.float64)[movable] - base[movable]) / scale
+    n_elite = max(2, int(population * elite_fraction))
+
+    def evaluate(z):
+        """Scores et objectifs d'une population (déplacements z en écarts-types)"""
+        profiles = np.tile(base, (len(z), 1))
+        profiles[:, movable] += z * scale
+        scores = np.asarray(score_fn(profiles), dtype=np.float64)
+        objectives = band_distance(scores, band) * penalty + np.mean(z ** 2, axis=1)
+        return scores, objectives
+
+    # Le profil de base est évalué avec la première population
+    mean = np.zeros(len(movable))
+    sigma = np.full(len(movable), initial_sigma)
+    best = (np.inf, None, None)
+    evaluated = steps = stale = 0
+    converged = False
+    start = time.perf_counter()
+
+    for steps in range(1, max_steps + 1):
+        z = np.clip(mean + sigma * rng.standard_normal((population, len(movable))), z_lower, z_upper)
+        if steps == 1:
+            z[0] = 0
+        scores, objectives = evaluate(z)
+        evaluated += len(z)
+
+        order = np.argsort(objectives)
+        if objectives[order[0]] < best[0] - tol:
+            best = (objectives[order[0]], z[order[0]].copy(), scores[order[0]])
+            stale = 0
+        else:
+            stale += 1
+
+        elite = z[order[:n_elite]]
+        mean = elite.mean(axis=0)
+        sigma = np.maximum(elite.std(axis=0), min_sigma)
+
+        if stale >= patience or sigma.max() <= min_sigma:
+            converged = True
+            break
+
+    seconds = time.perf_counter() - start
+    objective, z_best, score = best
+    profile = base.copy()
+    profile[movable] += z_best * scale
+
+    return SearchResult(profile=profile, score=float(score), objective=float(objective),
+                        in_band=bool(band_distance(np.array([score]), band)[0] == 0), steps=steps,
+                        evaluated=evaluated, seconds=seconds, evaluated_per_second=evaluated / seconds,
+                        converged=converged)
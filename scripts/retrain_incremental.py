@@ -0,0 +1,212 @@
+"""
+Réentraînement incrémental: ajout d'arbres au modèle en service sur de nouvelles lignes
+
+Au lieu de tout réentraîner (retrain_final.py), on poursuit le boosting du
+best_model.pkl actuel (init_model de LightGBM) sur les nouvelles lignes
+étiquetées, avec au plus --max-trees arbres supplémentaires:
+
+1. Le scaler (scaler.pkl) reste figé. La dérive des nouvelles lignes par
+   rapport à lui est contrôlée: écart des moyennes (en écarts-types du
+   scaler) et rapport des écarts-types. Au-delà des tolérances, le script
+   s'arrête: il faut alors un réentraînement complet.
+2. Une fraction des nouvelles lignes (--new-holdout) sert à l'arrêt précoce
+   des arbres ajoutés.
+3. Contrôle avant promotion: l'AUC du nouveau modèle est comparée à celle du
+   modèle parent sur la validation de retrain_final.py (lignes jamais vues
+   à l'entraînement) et sur les nouvelles lignes réservées. Le nouveau
+   modèle n'est promu que s'il ne perd pas plus de --max-auc-drop sur aucune
+   des deux.
+4. Promotion: best_model.pkl (puis best_model.npz et scaler.npz s'il existe,
+   voir compile_model.py) sont écrits sous un nom temporaire puis renommés.
+   L'API en cours (surveillance des fichiers ou /admin/reload) ne lit donc
+   jamais un fichier partiel. model_metadata.json reçoit l'AUC, le nombre
+   d'arbres et une entrée de lignée: hash du parent, arbres ajoutés, lignes
+   utilisées, dérive.
+
+La transformation probabilité → score (p_min, p_max) et generated-defaults.ts
+ne changent pas: relancer retrain_final.py pour les recalculer.
+
+Usage:
+    python scripts/retrain_incremental.py --new-data data/new_2024_06.csv [--max-trees 100]
+    python scripts/retrain_incremental.py --new-data a.csv b.csv --dry-run   # contrôles sans promotion
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from compile_model import export_compiled, replace_file
+from data_cache import FEATURE_NAMES
+from lgbm_training import train_early_stopping
+from pipeline import file_digest
+from retrain_final import BASE_DIR, MODELS_DIR, load_data, pipeline
+
+sys.path.insert(0, os.path.join(BASE_DIR, 'api'))
+from model_bundle import files_version
+
+MODEL_PATH = os.path.join(MODELS_DIR, 'best_model.pkl')
+SCALER_PATH = os.path.join(MODELS_DIR, 'scaler.pkl')
+METADATA_PATH = os.path.join(MODELS_DIR, 'model_metadata.json')
+COMPILED_MODEL_PATH = os.path.join(MODELS_DIR, 'best_model.npz')
+
+
+def load_new_rows(paths):
+    """Nouvelles lignes étiquetées (colonnes target et var_0 ... var_199)"""
+    frames = [pd.read_csv(path) for path in paths]
+    new = pd.concat(frames, ignore_index=True)
+    missing = [column for column in ['target'] + FEATURE_NAMES if column not in new.columns]
+    if missing:
+        raise SystemExit(f"❌ Colonnes manquantes dans les nouvelles données: {', '.join(missing[:5])}")
+    return new[FEATURE_NAMES].to_numpy(np.float64), new['target'].to_numpy(np.int8)
+
+
+def scaler_drift(scaler, X):
+    """Écart des moyennes (en écarts-types du scaler) et rapport des écarts-types, par feature"""
+    mean_shift = np.abs(X.mean(axis=0) - scaler.mean_) / scaler.scale_
+    scale_ratio = X.std(axis=0) / scaler.scale_
+    return mean_shift, scale_ratio
+
+
+def main(args):
+    model = joblib.load(MODEL_PATH)
+    scaler = joblib.load(SCALER_PATH)
+    with open(METADATA_PATH, 'r') as f:
+        metadata = json.load(f)
+    parent_trees = model.booster_.current_iteration()
+    print(f"\n📦 Modèle parent: {parent_trees} arbres (version {files_version(MODEL_PATH, SCALER_PATH)})")
+
+    # ========================================================================
+    # Nouvelles lignes et dérive par rapport au scaler figé
+    # ========================================================================
+    X_new, y_new = load_new_rows(args.new_data)
+    n_accepted = int(y_new.sum())
+    print(f"📥 Nouvelles lignes: {len(X_new):,} (acceptés: {n_accepted:,}, {n_accepted / len(X_new) * 100:.1f}%)")
+
+    mean_shift, scale_ratio = scaler_drift(scaler, X_new)
+    worst = np.argsort(-np.maximum(mean_shift / args.max_mean_shift,
+                                   np.abs(np.log(scale_ratio)) / np.log(args.max_scale_ratio)))[:5]
+    print(f"\n📐 Dérive par rapport au scaler (tolérances: moyenne {args.max_mean_shift} σ, "
+          f"écart-type x{args.max_scale_ratio}):")
+    for i in worst:
+        print(f"   {FEATURE_NAMES[i]:8} moyenne {mean_shift[i]:.3f} σ, écart-type x{scale_ratio[i]:.3f}")
+    drifted = ((mean_shift > args.max_mean_shift) | (scale_ratio > args.max_scale_ratio)
+               | (scale_ratio < 1 / args.max_scale_ratio))
+    drift = {'max_mean_shift': float(mean_shift.max()), 'min_scale_ratio': float(scale_ratio.min()),
+             'max_scale_ratio': float(scale_ratio.max()), 'drifted_features': int(drifted.sum())}
+    if drifted.any() and not args.allow_drift:
+        raise SystemExit(f"❌ {int(drifted.sum())} features hors tolérance: le scaler figé ne convient plus, "
+                         f"réentraîner complètement (retrain_final.py) ou relancer avec --allow-drift")
+
+    # ========================================================================
+    # Arbres ajoutés (arrêt précoce sur une partie des nouvelles lignes)
+    # ========================================================================
+    X_fit, X_check, y_fit, y_check = train_test_split(X_new, y_new, test_size=args.new_holdout,
+                                                      random_state=args.seed, stratify=y_new)
+    params = dict(model.get_params(), n_estimators=args.max_trees)
+
+    print(f"\n🌱 Ajout d'au plus {args.max_trees} arbres sur {len(X_fit):,} lignes "
+          f"(arrêt précoce sur {len(X_check):,})...")
+    child, training = train_early_stopping(params, scaler.transform(X_fit), y_fit, scaler.transform(X_check), y_check,
+                                           args.early_stopping_rounds, init_model=model.booster_)
+    added_trees = training['best_iteration'] - parent_trees
+    print(f"   {added_trees} arbres ajoutés ({training['iterations_trained'] - parent_trees} essayés, "
+          f"{training['train_seconds']:.1f} s)")
+
+    # ========================================================================
+    # Contrôle avant promotion: AUC parent / nouveau modèle
+    # ========================================================================
+    split = pipeline.run('split')
+    _, X, y = load_data()
+    X_holdout = scaler.transform(X.iloc[split['val_index']])
+    y_holdout = y.iloc[split['val_index']].to_numpy()
+
+    checks = {}
+    for name, X_eval, y_eval in (('holdout', X_holdout, y_holdout), ('new_rows', scaler.transform(X_check), y_check)):
+        parent_auc = roc_auc_score(y_eval, model.predict_proba(X_eval)[:, 1])
+        child_auc = roc_auc_score(y_eval, child.predict_proba(X_eval)[:, 1])
+        checks[name] = {'rows': len(y_eval), 'parent_auc': float(parent_auc), 'auc': float(child_auc),
+                        'passed': bool(child_auc >= parent_auc - args.max_auc_drop)}
+
+    print(f"\n🧪 AUC (perte tolérée: {args.max_auc_drop}):")
+    print(f"   {'jeu':10} {'lignes':>8} {'parent':>8} {'nouveau':>8}")
+    for name, check in checks.items():
+        status = '✅' if check['passed'] else '❌'
+        print(f"   {name:10} {check['rows']:8,} {check['parent_auc']:8.4f} {check['auc']:8.4f} {status}")
+
+    if not all(check['passed'] for check in checks.values()):
+        raise SystemExit("❌ Le nouveau modèle perd en AUC: modèle parent conservé")
+    if args.dry_run:
+        print("\n🔎 --dry-run: contrôles passés, modèle non promu")
+        return
+
+    # ========================================================================
+    # Promotion (remplacements atomiques) et lignée
+    # ========================================================================
+    lineage = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'mode': 'incremental',
+        'parent_model_sha256': file_digest(MODEL_PATH),
+        'parent_version': files_version(MODEL_PATH, SCALER_PATH),
+        'parent_trees': parent_trees,
+        'added_trees': added_trees,
+        'rows_fit': len(X_fit),
+        'rows_early_stopping': len(X_check),
+        'new_data': [{'path': os.path.abspath(path), 'sha256': file_digest(path)} for path in args.new_data],
+        'drift': drift,
+        'checks': checks,
+        'training': training,
+    }
+
+    replace_file(MODEL_PATH, lambda path: joblib.dump(child, path))
+    print(f"   ✅ {MODEL_PATH}")
+    if os.path.exists(COMPILED_MODEL_PATH):
+        # Le .npz servi par MODEL_ENGINE=compiled enregistre le hash du .pkl: écrit après
+        # lui. Entre les deux, l'API qui recharge sert best_model.pkl (hash différent)
+        try:
+            export_compiled(child, scaler)
+            print(f"   ✅ {COMPILED_MODEL_PATH}")
+        except ValueError as e:
+            print(f"   ⚠️ {COMPILED_MODEL_PATH} non régénéré ({e}): l'API sert best_model.pkl")
+
+    metadata['roc_auc_score'] = checks['holdout']['auc']
+    metadata['n_estimators'] = training['best_iteration']
+    metadata['lineage'] = metadata.get('lineage', []) + [lineage]
+
+    def write_metadata(path):
+        with open(path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+
+    replace_file(METADATA_PATH, write_metadata)
+    print(f"   ✅ {METADATA_PATH} (lignée: {len(metadata['lineage'])} entrée(s))")
+    print(f"\n🚀 Modèle promu: {parent_trees} → {training['best_iteration']} arbres, "
+          f"version {files_version(MODEL_PATH, SCALER_PATH)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ajout d'arbres au modèle en service sur de nouvelles lignes")
+    parser.add_argument('--new-data', nargs='+', required=True, help="CSV de nouvelles lignes étiquetées")
+    parser.add_argument('--max-trees', type=int, default=100, help="Arbres ajoutés au plus")
+    parser.add_argument('--early-stopping-rounds', type=int, default=20)
+    parser.add_argument('--new-holdout', type=float, default=0.2,
+                        help="Fraction des nouvelles lignes réservée à l'arrêt précoce et au contrôle")
+    parser.add_argument('--max-mean-shift', type=float, default=0.1,
+                        help="Écart de moyenne toléré par feature (en écarts-types du scaler)")
+    parser.add_argument('--max-scale-ratio', type=float, default=1.25,
+                        help="Rapport d'écarts-types toléré par feature (et son inverse)")
+    parser.add_argument('--allow-drift', action='store_true', help="Continuer malgré une dérive hors tolérance")
+    parser.add_argument('--max-auc-drop', type=float, default=0.0, help="Perte d'AUC tolérée avant promotion")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dry-run', action='store_true', help="Contrôles sans promotion")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("🌱 RÉENTRAÎNEMENT INCRÉMENTAL")
+    print("=" * 70)
+    main(args)
@@ -0,0 +1,198 @@
+"""
+Script pour scorer hors ligne un fichier CSV (par défaut data/test.csv)
+
+Le fichier est lu par paquets de lignes brutes, distribués à un pool de
+processus: chaque worker charge best_model.pkl et scaler.pkl une seule fois
+(initializer), parse son paquet, et retourne ID_code, probabilité et score
+0-100 (scoring_transform de model_metadata.json). Les paquets sont écrits
+dans l'ordre de lecture: l'ordre des lignes est conservé. Le fichier de
+sortie est écrit sous un nom temporaire puis renommé.
+
+Usage:
+    python scripts/score_csv.py [--input data/test.csv] [--output data/test_scores.csv]
+                                [--workers 4] [--threads 1] [--chunk-rows 20000]
+    Sortie Parquet (nécessite pyarrow): --output data/test_scores.parquet
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import socket
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from feature_impact import probability_to_score
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+MODELS_DIR = os.path.join(BASE_DIR, 'models')
+
+N_FEATURES = 200
+FEATURE_NAMES = [f'var_{i}' for i in range(N_FEATURES)]
+
+# État de chaque worker (chargé une fois par processus)
+_worker = {}
+
+
+def init_worker(model_path, scaler_path, metadata_path, n_threads):
+    """Charge le modèle, le scaler et les métadonnées dans le processus"""
+    import warnings
+    warnings.filterwarnings('ignore')
+    import joblib
+
+    model = joblib.load(model_path)
+    if hasattr(model, 'set_params'):
+        model.set_params(n_jobs=n_threads)
+    with open(metadata_path, 'r') as f:
+        metadata = json.load(f)
+
+    _worker.update(model=model, scaler=joblib.load(scaler_path), metadata=metadata)
+
+
+def score_chunk(header, lines):
+    """Parse un paquet de lignes CSV (sans l'en-tête) et retourne le DataFrame ID_code / probabilité / score"""
+    frame = pd.read_csv(io.BytesIO(header + b''.join(lines)))
+    missing = [name for name in FEATURE_NAMES if name not in frame.columns]
+    if missing:
+        raise ValueError(f"Colonnes manquantes: {', '.join(missing[:5])}")
+
+    X = _worker['scaler'].transform(frame[FEATURE_NAMES].to_numpy(dtype=np.float64))
+    probabilities = _worker['model'].predict_proba(X)[:, 1]
+
+    result = pd.DataFrame({'probability': probabilities})
+    if 'ID_code' in frame.columns:
+        result.insert(0, 'ID_code', frame['ID_code'].to_numpy())
+    # Score 0-100 selon scoring_transform de model_metadata.json
+    transform = _worker['metadata'].get('scoring_transform')
+    if transform:
+        result['score'] = probability_to_score(probabilities, transform['p_min'], transform['p_max'])
+    return result
+
+
+def read_chunks(f, chunk_rows):
+    """Paquets de chunk_rows lignes brutes (la dernière ligne est complétée d'un saut de ligne)"""
+    while True:
+        lines = list(itertools.islice(f, chunk_rows))
+        if not lines:
+            return
+        if not lines[-1].endswith(b'\n'):
+            lines[-1] += b'\n'
+        yield lines
+
+
+class ResultWriter:
+    """Écrit les paquets en CSV ou en Parquet (selon l'extension de sortie)"""
+
+    def __init__(self, path):
+        self.path = path
+        # Nom temporaire propre au processus: deux workers ne s'écrasent pas
+        self.tmp_path = f'{path}.{socket.gethostname()}-{os.getpid()}.tmp'
+        self.parquet = path.endswith('.parquet')
+        self.writer = None
+        self.first = True
+
+        if self.parquet:
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise SystemExit("❌ La sortie Parquet nécessite pyarrow (pip install pyarrow)")
+            self.pa = pyarrow
+
+    def write(self, frame):
+        if self.parquet:
+            table = self.pa.Table.from_pandas(frame, preserve_index=False)
+            if self.writer is None:
+                self.writer = self.pa.parquet.ParquetWriter(self.tmp_path, table.schema)
+            self.writer.write_table(table)
+        else:
+            frame.to_csv(self.tmp_path, mode='w' if self.first else 'a', header=self.first, index=False)
+        self.first = False
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if not self.first:
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Abandonne l'écriture: ferme et supprime le fichier temporaire (la sortie n'est pas touchée)"""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def create_pool(args):
+    """Pool de processus de scoring (modèle chargé une fois par processus)"""
+    return ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                               initargs=(args.model, args.scaler, args.metadata, args.threads))
+
+
+def score_chunks(executor, header, chunks, writer, n_workers):
+    """Score les paquets dans le pool et les écrit dans l'ordre; retourne le nombre de lignes"""
+    n_rows = 0
+    # Au plus 2 paquets en attente par worker: la mémoire reste bornée
+    pending = deque()
+    for lines in chunks:
+        pending.append(executor.submit(score_chunk, header, lines))
+        if len(pending) >= 2 * n_workers:
+            frame = pending.popleft().result()
+            writer.write(frame)
+            n_rows += len(frame)
+    while pending:
+        frame = pending.popleft().result()
+        writer.write(frame)
+        n_rows += len(frame)
+    return n_rows
+
+
+def score_file(args):
+    """Score le fichier d'entrée; retourne le nombre de lignes écrites"""
+    writer = ResultWriter(args.output)
+
+    try:
+        with open(args.input, 'rb') as f, create_pool(args) as executor:
+            header = f.readline()
+            n_rows = score_chunks(executor, header, read_chunks(f, args.chunk_rows), writer, args.workers)
+    except BaseException:
+        writer.abort()
+        raise
+
+    writer.close()
+    return n_rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scoring hors ligne d'un fichier CSV")
+    parser.add_argument('--input', default=os.path.join(DATA_DIR, 'test.csv'))
+    parser.add_argument('--output', default=os.path.join(DATA_DIR, 'test_scores.csv'),
+                        help="Fichier de sortie (.csv ou .parquet)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Nombre de processus de scoring")
+    parser.add_argument('--threads', type=int, default=1,
+                        help="Threads LightGBM par processus (n_jobs)")
+    parser.add_argument('--chunk-rows', type=int, default=20000)
+    parser.add_argument('--model', default=os.path.join(MODELS_DIR, 'best_model.pkl'))
+    parser.add_argument('--scaler', default=os.path.join(MODELS_DIR, 'scaler.pkl'))
+    parser.add_argument('--metadata', default=os.path.join(MODELS_DIR, 'model_metadata.json'))
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("🧮 SCORING HORS LIGNE")
+    print("=" * 70)
+    print(f"\n   Entrée:  {args.input}")
+    print(f"   Sortie:  {args.output}")
+    print(f"   {args.workers} processus x {args.threads} thread(s) LightGBM, paquets de {args.chunk_rows:,} lignes")
+
+    start = time.perf_counter()
+    n_rows = score_file(args)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n✅ {n_rows:,} lignes scorées en {elapsed:.1f} s ({n_rows / elapsed:,.0f} lignes/s)")
@@ -0,0 +1,401 @@
+"""
+Scoring par shards, reprenable et réparti sur plusieurs machines
+
+Étapes (le répertoire du job doit être sur un stockage partagé, monté au
+même chemin sur toutes les machines, comme les fichiers d'entrée):
+
+1. plan:   découpe les fichiers CSV en shards déterministes (plages d'octets
+           de --shard-rows lignes), écrit manifest.json et la file SQLite
+           queue.sqlite. Relancer plan avec les mêmes entrées ne change rien.
+2. work:   à lancer sur autant de machines que voulu. Chaque processus prend
+           un shard dans la file (bail renouvelé tant qu'il travaille), le
+           score avec un pool local (voir score_csv.py) et écrit
+           shards/<id>.csv sous un nom temporaire puis renommé. Un shard dont
+           le bail expire (machine perdue) est repris par un autre worker; un
+           shard déjà écrit n'est jamais rescoré.
+3. status: avancement du job.
+4. merge:  vérifie que chaque shard a le nombre de lignes du manifeste, puis
+           concatène les shards dans l'ordre des fichiers d'entrée (.csv ou
+           .parquet).
+
+Les workers refusent de scorer si le modèle, le scaler ou les métadonnées
+diffèrent de ceux du manifeste, ou si un fichier d'entrée a changé.
+SQLite verrouille la file avec les verrous du système de fichiers: le
+stockage partagé doit les supporter (NFSv4, CephFS, Lustre...).
+
+Usage:
+    python scripts/score_sharded.py plan   --job-dir /shared/job --input a.csv b.csv [--shard-rows 200000]
+    python scripts/score_sharded.py work   --job-dir /shared/job [--workers 4] [--threads 1]
+    python scripts/score_sharded.py status --job-dir /shared/job
+    python scripts/score_sharded.py merge  --job-dir /shared/job --output /shared/scores.parquet
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR = os.path.join(BASE_DIR, 'models')
+sys.path.insert(0, os.path.join(BASE_DIR, 'api'))
+
+from model_bundle import files_version
+from score_csv import ResultWriter, create_pool, read_chunks, score_chunks
+
+MANIFEST_VERSION = 1
+
+
+def job_paths(job_dir):
+    return (os.path.join(job_dir, 'manifest.json'), os.path.join(job_dir, 'queue.sqlite'),
+            os.path.join(job_dir, 'shards'))
+
+
+def shard_output(job_dir, shard_id):
+    return os.path.join(job_dir, 'shards', f'{shard_id}.csv')
+
+
+def artifacts_version(args):
+    return files_version(args.model, args.scaler, args.metadata)
+
+
+def connect(queue_path):
+    """Connexion à la file (transactions explicites, attente des verrous)"""
+    connection = sqlite3.connect(queue_path, timeout=60, isolation_level=None)
+    connection.execute('PRAGMA busy_timeout = 60000')
+    return connection
+
+
+# ============================================================================
+# Planification
+# ============================================================================
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def plan_file(path, file_index, shard_rows):
+    """Shards d'un fichier: plages d'octets de shard_rows lignes non vides (en-tête exclu)"""
+    shards = []
+    with open(path, 'rb') as f:
+        header = f.readline()
+        position = start = len(header)
+        n_rows = 0
+        for line in f:
+            position += len(line)
+            if line.strip():
+                n_rows += 1
+            if n_rows == shard_rows:
+                shards.append({'id': f'{file_index:04d}-{len(shards):05d}', 'file': file_index,
+                               'start': start, 'end': position, 'n_rows': n_rows})
+                start, n_rows = position, 0
+        if n_rows:
+            shards.append({'id': f'{file_index:04d}-{len(shards):05d}', 'file': file_index,
+                           'start': start, 'end': position, 'n_rows': n_rows})
+    return shards
+
+
+def plan(args):
+    manifest_path, queue_path, shards_dir = job_paths(args.job_dir)
+    inputs = [os.path.abspath(path) for path in args.input]
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        same = ([item['path'] for item in manifest['files']] == inputs
+                and manifest['shard_rows'] == args.shard_rows
+                and all(file_signature(item['path']) == item['signature'] for item in manifest['files']))
+        if not same:
+            raise SystemExit(f"❌ {manifest_path} existe pour d'autres entrées: utiliser un autre --job-dir")
+        print(f"✅ Job déjà planifié: {len(manifest['shards'])} shards ({manifest_path})")
+        return
+
+    os.makedirs(shards_dir, exist_ok=True)
+    files, shards = [], []
+    for index, path in enumerate(inputs):
+        file_shards = plan_file(path, index, args.shard_rows)
+        files.append({'path': path, 'signature': file_signature(path),
+                      'n_rows': sum(shard['n_rows'] for shard in file_shards)})
+        shards.extend(file_shards)
+        print(f"   {path}: {files[-1]['n_rows']:,} lignes, {len(file_shards)} shards")
+
+    manifest = {
+        'manifest_version': MANIFEST_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'shard_rows': args.shard_rows,
+        'artifacts_version': artifacts_version(args),
+        'n_rows': sum(item['n_rows'] for item in files),
+        'files': files,
+        'shards': shards,
+    }
+
+    connection = connect(queue_path)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS shards (
+            id TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            owner TEXT,
+            lease_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            rows_written INTEGER,
+            error TEXT
+        )""")
+    connection.execute('BEGIN IMMEDIATE')
+    connection.executemany('INSERT OR IGNORE INTO shards (id, position) VALUES (?, ?)',
+                           [(shard['id'], i) for i, shard in enumerate(shards)])
+    connection.execute('COMMIT')
+    connection.close()
+
+    # Manifeste écrit en dernier: sa présence signifie que le job est prêt
+    tmp_path = f'{manifest_path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    print(f"\n✅ {manifest['n_rows']:,} lignes, {len(shards)} shards ({manifest_path})")
+
+
+# ============================================================================
+# Workers
+# ============================================================================
+
+def claim(connection, owner, lease_seconds):
+    """Prend le prochain shard en attente (ou dont le bail a expiré); None si plus rien"""
+    now = time.time()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        row = connection.execute("""
+            SELECT id FROM shards
+            WHERE status = 'pending' OR (status = 'running' AND lease_until < ?)
+            ORDER BY position LIMIT 1""", (now,)).fetchone()
+        if row is not None:
+            connection.execute("""
+                UPDATE shards SET status = 'running', owner = ?, lease_until = ?, attempts = attempts + 1
+                WHERE id = ?""", (owner, now + lease_seconds, row[0]))
+        connection.execute('COMMIT')
+    except Exception:
+        connection.execute('ROLLBACK')
+        raise
+    return row[0] if row is not None else None
+
+
+def finish(connection, shard_id, owner, status, rows_written=None, error=None):
+    connection.execute("""
+        UPDATE shards SET status = ?, rows_written = ?, error = ?, lease_until = NULL
+        WHERE id = ? AND owner = ?""", (status, rows_written, error, shard_id, owner))
+
+
+class LeaseKeeper(threading.Thread):
+    """Renouvelle le bail d'un shard tant qu'il est scoré"""
+
+    def __init__(self, queue_path, shard_id, owner, lease_seconds):
+        super().__init__(daemon=True)
+        self.queue_path = queue_path
+        self.shard_id = shard_id
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+
+    def run(self):
+        connection = connect(self.queue_path)
+        while not self.stopped.wait(self.lease_seconds / 3):
+            connection.execute("UPDATE shards SET lease_until = ? WHERE id = ? AND owner = ?",
+                               (time.time() + self.lease_seconds, self.shard_id, self.owner))
+        connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def read_shard(f, start, end):
+    """Lignes non vides d'une plage d'octets"""
+    f.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        line = f.readline(remaining)
+        if not line:
+            break
+        remaining -= len(line)
+        if line.strip():
+            yield line
+
+
+def count_rows(path):
+    """Nombre de lignes de données d'un shard écrit (en-tête exclu)"""
+    with open(path, 'rb') as f:
+        return sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b'')) - 1
+
+
+def score_shard(executor, args, manifest, shard):
+    """Score un shard dans shards/<id>.csv (écriture atomique); retourne le nombre de lignes"""
+    path = manifest['files'][shard['file']]['path']
+    writer = ResultWriter(shard_output(args.job_dir, shard['id']))
+    try:
+        with open(path, 'rb') as f:
+            header = f.readline()
+            chunks = read_chunks(read_shard(f, shard['start'], shard['end']), args.chunk_rows)
+            n_rows = score_chunks(executor, header, chunks, writer, args.workers)
+        if n_rows != shard['n_rows']:
+            raise ValueError(f"{n_rows} lignes scorées, {shard['n_rows']} attendues")
+    except BaseException:
+        # Pas de shards/<id>.csv.<hôte>-<pid>.tmp orphelin: le shard sera repris depuis zéro
+        writer.abort()
+        raise
+    writer.close()
+    return n_rows
+
+
+def work(args):
+    manifest_path, queue_path, _ = job_paths(args.job_dir)
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+
+    if artifacts_version(args) != manifest['artifacts_version']:
+        raise SystemExit("❌ Modèle, scaler ou métadonnées différents de ceux du manifeste")
+    for item in manifest['files']:
+        if file_signature(item['path']) != item['signature']:
+            raise SystemExit(f"❌ {item['path']} a changé depuis la planification")
+
+    shards = {shard['id']: shard for shard in manifest['shards']}
+    owner = f'{socket.gethostname()}:{os.getpid()}'
+    connection = connect(queue_path)
+    n_done = n_rows = 0
+    start = time.perf_counter()
+
+    with create_pool(args) as executor:
+        while True:
+            shard_id = claim(connection, owner, args.lease_seconds)
+            if shard_id is None:
+                break
+            shard = shards[shard_id]
+            output = shard_output(args.job_dir, shard_id)
+
+            # Shard déjà écrit par un worker interrompu avant d'avoir marqué la file
+            if os.path.exists(output) and count_rows(output) == shard['n_rows']:
+                finish(connection, shard_id, owner, 'done', shard['n_rows'])
+                print(f"   ⏭️  {shard_id}: déjà écrit")
+                continue
+
+            keeper = LeaseKeeper(queue_path, shard_id, owner, args.lease_seconds)
+            keeper.start()
+            shard_start = time.perf_counter()
+            try:
+                rows = score_shard(executor, args, manifest, shard)
+            except Exception as e:
+                keeper.stop()
+                attempts = connection.execute('SELECT attempts FROM shards WHERE id = ?', (shard_id,)).fetchone()[0]
+                status = 'failed' if attempts >= args.max_attempts else 'pending'
+                finish(connection, shard_id, owner, status, error=str(e))
+                print(f"   ❌ {shard_id}: {e} (tentative {attempts}, statut {status})")
+                continue
+            keeper.stop()
+            finish(connection, shard_id, owner, 'done', rows)
+            n_done += 1
+            n_rows += rows
+            elapsed = time.perf_counter() - shard_start
+            print(f"   ✅ {shard_id}: {rows:,} lignes en {elapsed:.1f} s ({rows / elapsed:,.0f} lignes/s)")
+
+    connection.close()
+    elapsed = time.perf_counter() - start
+    print(f"\n✅ {owner}: {n_done} shards, {n_rows:,} lignes en {elapsed:.1f} s")
+    print_status(args)
+
+
+# ============================================================================
+# Suivi et fusion
+# ============================================================================
+
+def print_status(args):
+    _, queue_path, _ = job_paths(args.job_dir)
+    connection = connect(queue_path)
+    counts = dict(connection.execute('SELECT status, COUNT(*) FROM shards GROUP BY status').fetchall())
+    rows = connection.execute("SELECT COALESCE(SUM(rows_written), 0) FROM shards WHERE status = 'done'").fetchone()[0]
+    failed = connection.execute("SELECT id, attempts, error FROM shards WHERE status = 'failed'").fetchall()
+    connection.close()
+
+    print("\n📋 Shards: " + ", ".join(f"{status}={counts.get(status, 0)}"
+                                    for status in ('pending', 'running', 'done', 'failed')))
+    print(f"   Lignes scorées: {rows:,}")
+    for shard_id, attempts, error in failed:
+        print(f"   ❌ {shard_id} ({attempts} tentatives): {error}")
+
+
+def merge(args):
+    manifest_path, queue_path, _ = job_paths(args.job_dir)
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+
+    connection = connect(queue_path)
+    status = dict(connection.execute('SELECT id, status FROM shards').fetchall())
+    connection.close()
+    unfinished = [shard['id'] for shard in manifest['shards'] if status.get(shard['id']) != 'done']
+    if unfinished:
+        raise SystemExit(f"❌ {len(unfinished)} shards non terminés (ex: {', '.join(unfinished[:5])})")
+
+    writer = ResultWriter(args.output)
+    total = 0
+    for shard in manifest['shards']:
+        output = shard_output(args.job_dir, shard['id'])
+        if not os.path.exists(output):
+            raise SystemExit(f"❌ Shard {shard['id']}: {output} introuvable")
+        frame = pd.read_csv(output, dtype={'ID_code': str})
+        if len(frame) != shard['n_rows']:
+            raise SystemExit(f"❌ Shard {shard['id']}: {len(frame)} lignes, {shard['n_rows']} attendues")
+        writer.write(frame)
+        total += len(frame)
+
+    if total != manifest['n_rows']:
+        raise SystemExit(f"❌ {total:,} lignes fusionnées, {manifest['n_rows']:,} attendues")
+    writer.close()
+    print(f"✅ {total:,} lignes ({len(manifest['shards'])} shards) → {args.output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scoring par shards reprenable")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    plan_parser = subparsers.add_parser('plan', help="Découper les entrées et créer la file")
+    work_parser = subparsers.add_parser('work', help="Scorer des shards de la file")
+    status_parser = subparsers.add_parser('status', help="Avancement du job")
+    merge_parser = subparsers.add_parser('merge', help="Vérifier et fusionner les shards")
+
+    for sub in (plan_parser, work_parser, status_parser, merge_parser):
+        sub.add_argument('--job-dir', required=True)
+    for sub in (plan_parser, work_parser):
+        sub.add_argument('--model', default=os.path.join(MODELS_DIR, 'best_model.pkl'))
+        sub.add_argument('--scaler', default=os.path.join(MODELS_DIR, 'scaler.pkl'))
+        sub.add_argument('--metadata', default=os.path.join(MODELS_DIR, 'model_metadata.json'))
+
+    plan_parser.add_argument('--input', nargs='+', required=True)
+    plan_parser.add_argument('--shard-rows', type=int, default=200000)
+
+    work_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                             help="Nombre de processus de scoring sur cette machine")
+    work_parser.add_argument('--threads', type=int, default=1,
+                             help="Threads LightGBM par processus (n_jobs)")
+    work_parser.add_argument('--chunk-rows', type=int, default=20000)
+    work_parser.add_argument('--lease-seconds', type=float, default=300.0,
+                             help="Durée du bail d'un shard (renouvelé pendant le scoring)")
+    work_parser.add_argument('--max-attempts', type=int, default=3)
+
+    merge_parser.add_argument('--output', required=True, help="Fichier fusionné (.csv ou .parquet)")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print(f"🗂️  SCORING PAR SHARDS ({args.command})")
+    print("=" * 70)
+
+    if args.command == 'plan':
+        plan(args)
+    elif args.command == 'work':
+        work(args)
+    elif args.command == 'status':
+        print_status(args)
+    else:
+        merge(args)
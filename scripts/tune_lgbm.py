@@ -0,0 +1,334 @@
+"""
+Recherche des hyperparamètres LightGBM: validation croisée stratifiée et successive halving
+
+Les configurations (tirées au hasard dans SEARCH_SPACE, la configuration
+actuelle de retrain_final.py en premier) sont évaluées en K plis stratifiés
+sur la partie entraînement du split de retrain_final.py. La validation reste
+réservée à l'arrêt précoce du modèle final.
+
+Successive halving: toutes les configurations reçoivent d'abord un petit
+budget d'arbres. Seul le meilleur tiers (--eta 3) passe au budget suivant,
+et ainsi de suite jusqu'à n_estimators (500 arbres). Chaque évaluation
+garde l'arrêt précoce sur le pli de validation. Les configurations faibles
+sont donc abandonnées après quelques dizaines d'arbres.
+
+Les essais sont répartis sur un pool de processus. Le Dataset binné
+(format binaire LightGBM, voir lgbm_training.py) est construit une seule
+fois. Chaque worker le charge une fois et découpe ses plis par
+Dataset.subset: les flottants ne sont ni relus ni rediscrétisés d'un essai
+à l'autre.
+
+Ce n'est pas une mémoire partagée: un Dataset LightGBM vit dans la mémoire
+C++ de son processus et ne se projette pas depuis un fichier. Chaque worker
+garde sa copie privée de train.bin (34 Mo pour 160k x 200), ses plis
+(environ 120 Mo pour 3 plis) et les histogrammes d'entraînement, soit
+environ 200 Mo de plus que l'interpréteur (380 Mo mesurés par worker).
+Construire le Dataset dans chaque worker à partir des .npy float32 de
+data_cache ne partagerait que les flottants. Il faudrait toujours une copie
+binnée privée par worker, et chacun rediscrétiserait (8 s sur 160k x 200).
+Prévoir --workers selon la mémoire disponible.
+
+Les résultats sont enregistrés au fil de l'eau dans une base SQLite
+(data/cache/tuning/lgbm_trials.sqlite). Une recherche interrompue reprend
+là où elle s'était arrêtée avec la même commande. Les paramètres gagnants
+sont écrits dans models/lgbm_params.json, que retrain_final.py lit au
+démarrage.
+
+Usage:
+    python scripts/tune_lgbm.py [--trials 27] [--folds 3] [--eta 3] [--rungs 3] [--workers 4] [--threads 1]
+    python scripts/tune_lgbm.py --fresh        # nouvelle recherche (efface la base)
+    python scripts/retrain_final.py            # réentraîne avec les paramètres retenus
+"""
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import lightgbm as lgb
+import numpy as np
+from sklearn.model_selection import StratifiedKFold
+
+from data_cache import source_signature
+from lgbm_training import binned_datasets, dataset_params
+from retrain_final import (DATA_DIR, EARLY_STOPPING_ROUNDS, LGBM_PARAMS, TRAIN_PATH, TUNED_PARAMS_PATH, pipeline,
+                           split_arrays)
+
+STORE_PATH = os.path.join(DATA_DIR, 'cache', 'tuning', 'lgbm_trials.sqlite')
+LGBM_CACHE_DIR = os.path.join(DATA_DIR, 'cache', 'lgbm')
+
+# Paramètres propres au wrapper scikit-learn (get_params d'un LGBMClassifier), inconnus de lgb.train
+SKLEARN_ONLY_PARAMS = ('n_estimators', 'class_weight', 'importance_type')
+
+# Espace de recherche: (loi, bornes) ou ('choice', valeurs)
+SEARCH_SPACE = {
+    'num_leaves': ('log_int', 15, 255),
+    'max_depth': ('choice', [-1, 6, 8, 10, 12]),
+    'learning_rate': ('log', 0.01, 0.1),
+    'min_child_samples': ('log_int', 20, 400),
+    'colsample_bytree': ('uniform', 0.2, 1.0),
+    'reg_lambda': ('log', 1e-3, 10.0),
+}
+
+# Dataset partagé par tous les essais: min_child_samples varie, le préfiltrage des
+# features (qui en dépend) est donc désactivé
+TUNING_DATASET_PARAMS = {'random_state': LGBM_PARAMS['random_state'], 'feature_pre_filter': False}
+
+
+def native_params(params):
+    """
+    Paramètres LGBMClassifier -> paramètres lgb.train (LightGBM accepte les noms
+    scikit-learn comme alias: subsample, colsample_bytree, min_child_samples, ...)
+    """
+    native = {name: value for name, value in params.items()
+              if name not in SKLEARN_ONLY_PARAMS and value is not None}
+    native['objective'] = 'binary'
+    return native
+
+
+def split_key_parts(split):
+    """Ce dont dépend le Dataset binné construit sur le split: CSV, indices et normalisation"""
+    scaler = split['scaler']
+    digest = hashlib.sha256(b''.join(array.tobytes() for array in
+                                     (split['train_index'], split['val_index'], scaler.mean_, scaler.scale_)))
+    return {'source': source_signature(TRAIN_PATH), 'split': digest.hexdigest()}
+
+
+def sample_params(rng):
+    """Une configuration tirée dans SEARCH_SPACE"""
+    params = {}
+    for name, (law, *bounds) in SEARCH_SPACE.items():
+        if law == 'choice':
+            params[name] = bounds[0][rng.integers(len(bounds[0]))]
+        elif law == 'uniform':
+            params[name] = float(rng.uniform(*bounds))
+        else:
+            value = math.exp(rng.uniform(math.log(bounds[0]), math.log(bounds[1])))
+            params[name] = int(round(value)) if law == 'log_int' else float(value)
+    return params
+
+
+def candidate_trials(n_trials, seed):
+    """Configurations à évaluer: l'actuelle (essai 0) puis n_trials - 1 tirages"""
+    rng = np.random.default_rng(seed)
+    baseline = {name: LGBM_PARAMS.get(name, 0.0 if name == 'reg_lambda' else None) for name in SEARCH_SPACE}
+    return [baseline] + [sample_params(rng) for _ in range(n_trials - 1)]
+
+
+def rung_budgets(max_rounds, eta, n_rungs):
+    """Nombre d'arbres à chaque palier: max_rounds / eta^k, ..., max_rounds"""
+    return [max(1, round(max_rounds / eta ** k)) for k in reversed(range(n_rungs))]
+
+
+# ============================================================================
+# Base des essais (SQLite)
+# ============================================================================
+
+def open_store(path, study, trials, fresh):
+    """
+    Ouvre (ou crée) la base des essais d'une recherche
+    Une base existante n'est reprise que si elle décrit la même recherche
+    """
+    if fresh and os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute("CREATE TABLE IF NOT EXISTS study (id INTEGER PRIMARY KEY CHECK (id = 0), config TEXT NOT NULL)")
+    connection.execute("CREATE TABLE IF NOT EXISTS trials (id INTEGER PRIMARY KEY, params TEXT NOT NULL)")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS results (
+            trial_id INTEGER NOT NULL,
+            rounds INTEGER NOT NULL,
+            auc REAL NOT NULL,
+            fold_aucs TEXT NOT NULL,
+            best_iteration INTEGER NOT NULL,
+            seconds REAL NOT NULL,
+            finished_at TEXT NOT NULL,
+            PRIMARY KEY (trial_id, rounds)
+        )""")
+
+    config = json.dumps(study, sort_keys=True)
+    row = connection.execute("SELECT config FROM study").fetchone()
+    if row is None:
+        connection.execute("BEGIN")
+        connection.execute("INSERT INTO study (id, config) VALUES (0, ?)", (config,))
+        connection.executemany("INSERT INTO trials (id, params) VALUES (?, ?)",
+                               [(i, json.dumps(params)) for i, params in enumerate(trials)])
+        connection.execute("COMMIT")
+    elif row[0] != config:
+        raise SystemExit(f"❌ {path} contient une autre recherche (données, paramètres ou options différents): "
+                         f"relancer avec --fresh ou --store <autre fichier>")
+    return connection
+
+
+def load_results(connection):
+    """{(trial_id, rounds): résultat} des évaluations déjà terminées"""
+    rows = connection.execute("SELECT trial_id, rounds, auc, fold_aucs, best_iteration, seconds FROM results")
+    return {(trial_id, rounds): {'trial_id': trial_id, 'rounds': rounds, 'auc': auc, 'fold_aucs': json.loads(folds),
+                                 'best_iteration': best_iteration, 'seconds': seconds}
+            for trial_id, rounds, auc, folds, best_iteration, seconds in rows}
+
+
+def save_result(connection, result):
+    connection.execute("""
+        INSERT OR REPLACE INTO results (trial_id, rounds, auc, fold_aucs, best_iteration, seconds, finished_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        (result['trial_id'], result['rounds'], result['auc'], json.dumps(result['fold_aucs']),
+         result['best_iteration'], result['seconds'], time.strftime('%Y-%m-%dT%H:%M:%S')))
+
+
+# ============================================================================
+# Workers
+# ============================================================================
+_worker = {}
+
+
+def init_worker(dataset_path, folds):
+    """Charge le Dataset binné une fois par processus (copie privée, voir l'en-tête du module)"""
+    full = lgb.Dataset(dataset_path, params=dataset_params(TUNING_DATASET_PARAMS)).construct()
+    _worker.update(full=full, folds=folds, subsets={})
+
+
+def fold_datasets(fold):
+    """(entraînement, validation) d'un pli, découpés dans le Dataset binné et gardés pour les essais suivants"""
+    if fold not in _worker['subsets']:
+        train_index, valid_index = _worker['folds'][fold]
+        full = _worker['full']
+        _worker['subsets'][fold] = (full.subset(train_index).construct(), full.subset(valid_index).construct())
+    return _worker['subsets'][fold]
+
+
+def evaluate_trial(trial_id, params, rounds, early_stopping_rounds):
+    """AUC moyenne des plis pour une configuration et un budget d'arbres"""
+    native = native_params(params)
+    native['metric'] = 'auc'
+    start = time.perf_counter()
+    aucs, iterations = [], []
+    for fold in range(len(_worker['folds'])):
+        train_set, valid_set = fold_datasets(fold)
+        booster = lgb.train(native, train_set, num_boost_round=rounds, valid_sets=[valid_set], valid_names=['valid'],
+                            callbacks=[lgb.early_stopping(early_stopping_rounds, first_metric_only=True,
+                                                          verbose=False)])
+        aucs.append(float(booster.best_score['valid']['auc']))
+        iterations.append(booster.best_iteration)
+    return {'trial_id': trial_id, 'rounds': rounds, 'auc': float(np.mean(aucs)), 'fold_aucs': aucs,
+            'best_iteration': int(round(np.mean(iterations))), 'seconds': time.perf_counter() - start}
+
+
+# ============================================================================
+# Successive halving
+# ============================================================================
+
+def run_rung(executor, connection, results, trials, active, rounds, args):
+    """Évalue les essais actifs au budget rounds (ceux déjà en base sont repris tels quels)"""
+    pending = [trial_id for trial_id in active if (trial_id, rounds) not in results]
+    if len(pending) < len(active):
+        print(f"   ♻️  {len(active) - len(pending)} essais repris de la base")
+
+    futures = [executor.submit(evaluate_trial, trial_id, dict(LGBM_PARAMS, **trials[trial_id], n_jobs=args.threads),
+                               rounds, args.early_stopping_rounds)
+               for trial_id in pending]
+    for future in as_completed(futures):
+        result = future.result()
+        save_result(connection, result)
+        results[(result['trial_id'], rounds)] = result
+        print(f"   essai {result['trial_id']:3d}: AUC {result['auc']:.4f} "
+              f"(meilleure itération {result['best_iteration']}, {result['seconds']:.1f} s)")
+
+    return sorted(active, key=lambda trial_id: (-results[(trial_id, rounds)]['auc'], trial_id))
+
+
+def tune(args):
+    split = pipeline.run('split')
+    train_set, _, dataset = binned_datasets(LGBM_CACHE_DIR, split_key_parts(split), TUNING_DATASET_PARAMS,
+                                            lambda: split_arrays(split))
+    dataset_path = os.path.join(dataset['path'], 'train.bin')
+    labels = train_set.get_label()
+    folds = list(StratifiedKFold(args.folds, shuffle=True, random_state=args.seed)
+                 .split(np.zeros(len(labels)), labels))
+    print(f"\n📦 Dataset binné {'rechargé' if dataset['cached'] else 'construit'} en {dataset['seconds']:.1f} s: "
+          f"{len(labels):,} lignes, {args.folds} plis")
+
+    budgets = rung_budgets(LGBM_PARAMS['n_estimators'], args.eta, args.rungs)
+    trials = candidate_trials(args.trials, args.seed)
+    base_params = {name: value for name, value in LGBM_PARAMS.items() if name not in SEARCH_SPACE and name != 'n_jobs'}
+    study = {'dataset': dataset['key'], 'n_trials': args.trials, 'n_folds': args.folds, 'eta': args.eta,
+             'budgets': budgets, 'seed': args.seed, 'early_stopping_rounds': args.early_stopping_rounds,
+             'base_params': base_params, 'search_space': SEARCH_SPACE, 'trials': trials}
+    connection = open_store(args.store, study, trials, args.fresh)
+    results = load_results(connection)
+    print(f"🗃️  Base des essais: {args.store} ({len(results)} évaluations déjà faites)")
+    print(f"🪜 Paliers (arbres): {' → '.join(map(str, budgets))}, {args.trials} configurations, eta={args.eta}")
+
+    start = time.perf_counter()
+    active = list(range(len(trials)))
+    # spawn: le processus principal a déjà utilisé OpenMP (construction du Dataset), un fork
+    # pourrait bloquer les workers
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_worker, initargs=(dataset_path, folds)) as executor:
+        for level, rounds in enumerate(budgets):
+            print(f"\n🔬 Palier {level + 1}/{len(budgets)}: {len(active)} configurations, {rounds} arbres")
+            ranking = run_rung(executor, connection, results, trials, active, rounds, args)
+            if level < len(budgets) - 1:
+                active = ranking[:max(1, math.ceil(len(ranking) / args.eta))]
+                print(f"   ✂️  {len(ranking) - len(active)} configurations abandonnées")
+    elapsed = time.perf_counter() - start
+
+    winner_id = ranking[0]
+    winner = results[(winner_id, budgets[-1])]
+    baseline = results.get((0, budgets[-1]))
+    evaluated_rounds = sum(result['rounds'] for result in results.values())
+
+    print("\n🏆 Meilleures configurations (dernier palier):")
+    for trial_id in ranking[:5]:
+        result = results[(trial_id, budgets[-1])]
+        label = ' (actuelle)' if trial_id == 0 else ''
+        print(f"   essai {trial_id:3d}: AUC {result['auc']:.4f} ± {np.std(result['fold_aucs']):.4f}{label} "
+              f"{json.dumps(trials[trial_id])}")
+    if baseline is None:
+        print("   (configuration actuelle abandonnée avant le dernier palier)")
+    print(f"\n⏱️  {elapsed:.1f} s, budget de {evaluated_rounds * args.folds:,} arbres-plis "
+          f"(contre {len(trials) * budgets[-1] * args.folds:,} sans successive halving)")
+
+    tuned = {
+        'params': trials[winner_id],
+        'cv_auc': winner['auc'],
+        'cv_fold_aucs': winner['fold_aucs'],
+        'cv_best_iteration': winner['best_iteration'],
+        'baseline_cv_auc': baseline['auc'] if baseline else None,
+        'trial': winner_id,
+        'n_trials': args.trials,
+        'n_folds': args.folds,
+        'budgets': budgets,
+        'store': args.store,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    tmp_path = f'{TUNED_PARAMS_PATH}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(tuned, f, indent=2)
+    os.replace(tmp_path, TUNED_PARAMS_PATH)
+    print(f"\n💾 {TUNED_PARAMS_PATH} (utilisé par retrain_final.py)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Recherche des hyperparamètres LightGBM (successive halving)")
+    parser.add_argument('--trials', type=int, default=27, help="Configurations évaluées au premier palier")
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--eta', type=int, default=3, help="Facteur de réduction entre deux paliers")
+    parser.add_argument('--rungs', type=int, default=3, help="Nombre de paliers (le dernier: n_estimators arbres)")
+    parser.add_argument('--early-stopping-rounds', type=int, default=EARLY_STOPPING_ROUNDS)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--threads', type=int, default=1, help="Threads LightGBM par worker")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--store', default=STORE_PATH, help="Base SQLite des essais")
+    parser.add_argument('--fresh', action='store_true', help="Effacer la base et recommencer")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("🎛️  RECHERCHE DES HYPERPARAMÈTRES LIGHTGBM")
+    print("=" * 70)
+    tune(args)